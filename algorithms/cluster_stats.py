@@ -0,0 +1,67 @@
+# algorithms/cluster_stats.py
+import numpy as np
+
+
+class ClusterStats:
+    """
+    Per-cluster statistics of a partition, computed once with vectorized
+    reductions over the points sorted by cluster.
+
+    Holds the point count, centroid, axis-aligned bounding box, extent and
+    principal axes of every cluster.
+    """
+
+    def __init__(self, points, partition):
+        """
+        :param points: Numpy array of shape (n_points, 3).
+        :param partition: Partition of the points (see data.partition).
+        """
+        num_clusters = len(partition)
+        self.num_clusters = num_clusters
+        # Points grouped by cluster, so every cluster is one run
+        sorted_points = np.asarray(points, dtype=np.float64)[partition.order]
+
+        self.counts = partition.sizes
+        ids = np.repeat(np.arange(num_clusters), self.counts)
+        # Centered coordinates keep the sums accurate for georeferenced clouds
+        origin = sorted_points.mean(axis=0) if len(sorted_points) else np.zeros(3)
+        centered = sorted_points - origin
+        safe_counts = np.maximum(self.counts, 1)[:, None]
+        sums = np.column_stack(
+            [np.bincount(ids, centered[:, axis], num_clusters) for axis in range(3)]
+        )
+        means = sums / safe_counts
+        self.centroids = means + origin
+
+        # Bounding boxes by reducing over the runs of each cluster
+        starts = partition.offsets[:-1]
+        nonempty = self.counts > 0
+        self.lower = np.full((num_clusters, 3), np.nan)
+        self.upper = np.full((num_clusters, 3), np.nan)
+        if nonempty.any():
+            self.lower[nonempty] = np.minimum.reduceat(
+                sorted_points, starts[nonempty], axis=0
+            )
+            self.upper[nonempty] = np.maximum.reduceat(
+                sorted_points, starts[nonempty], axis=0
+            )
+        self.extents = self.upper - self.lower
+
+        # Covariances from the second moments about each centroid, decomposed
+        # in one batch
+        local = centered - means[ids]
+        moments = np.empty((num_clusters, 3, 3))
+        for i in range(3):
+            for j in range(i, 3):
+                moments[:, i, j] = moments[:, j, i] = np.bincount(
+                    ids, local[:, i] * local[:, j], num_clusters
+                )
+        eigenvalues, eigenvectors = np.linalg.eigh(moments / safe_counts[:, :, None])
+        # Largest variance first; axes are the rows of principal_axes[i]
+        self.variances = np.maximum(eigenvalues[:, ::-1], 0)
+        self.principal_axes = eigenvectors[:, :, ::-1].transpose(0, 2, 1)
+
+    def bounding_sphere(self, cluster):
+        """Center and radius of the bounding box of a cluster, for framing."""
+        center = (self.lower[cluster] + self.upper[cluster]) / 2
+        return center, float(np.linalg.norm(self.extents[cluster])) / 2
@@ -1,52 +1,353 @@
 # algorithms/community_detection.py
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from algorithms.superpoint_graph import (
+    as_networkx,
+    as_superpoint_graph,
+    length_affinities,
+)
+
+# Component size times sampled sources above which Girvan-Newman spreads the
+# betweenness computation over worker processes
+GN_PARALLEL_WORK = 2**16
 
 
 def label_propagation(graph):
     """
     Apply the label propagation community detection algorithm.
 
-    :param graph: NetworkX graph
+    :param graph: SuperpointGraph or NetworkX graph
     :return: List of lists, where each sublist contains the nodes in a cluster
     """
     print("Applying label_propagation_communities...")
-    communities = nx.community.label_propagation_communities(graph)
+    communities = nx.community.label_propagation_communities(as_networkx(graph))
     return [list(community) for community in communities]
 
 
-def asyn_lpa_communities(graph):
+def sparse_label_propagation(
+    graph, seed=None, max_iterations=100, update_fraction=0.5, return_stats=False
+):
+    """
+    Label propagation on the CSR adjacency, with every iteration vectorized.
+
+    Each node adopts the label with the largest total vote among its
+    neighbors, where an edge votes with weight exp(-length / median length),
+    so short edges count most. Ties are broken by a random label priority
+    drawn per iteration. Only a random update_fraction of the nodes is updated
+    per iteration, which prevents the label oscillations of fully synchronous
+    updates. Stops once every node holds one of its best-voted labels.
+
+    :param graph: SuperpointGraph or NetworkX graph
+    :param seed: Seed for the random number generator
+    :param max_iterations: Upper bound on the number of iterations
+    :param update_fraction: Fraction of the nodes updated per iteration
+    :param return_stats: Also return a dict of convergence statistics
+    :return: List of lists, where each sublist contains the nodes in a cluster
+        (and the statistics dict if return_stats is set)
+    """
+    print("Applying sparse label propagation...")
+    curr_time = time.time()
+    adjacency = as_superpoint_graph(graph).adjacency
+    num_nodes = adjacency.shape[0]
+    votes = sparse.csr_matrix(
+        (length_affinities(adjacency.data), adjacency.indices, adjacency.indptr),
+        shape=adjacency.shape,
+    )
+    nodes = np.flatnonzero(np.diff(votes.indptr))  # Nodes with neighbors
+
+    rng = np.random.default_rng(seed)
+    labels = np.arange(num_nodes, dtype=np.int64)
+    changes = []
+    converged = False
+    for _ in range(max_iterations):
+        # Total vote per (node, neighbor label): votes times one-hot labels
+        one_hot = sparse.csr_matrix(
+            (np.ones(num_nodes), labels, np.arange(num_nodes + 1)),
+            shape=(num_nodes, num_nodes),
+        )
+        scores = votes @ one_hot
+        counts = np.diff(scores.indptr)[nodes]
+        starts = scores.indptr[nodes]
+        key_nodes = np.repeat(nodes, counts)
+        key_labels = scores.indices
+
+        best_score = np.maximum.reduceat(scores.data, starts)
+        is_best = scores.data >= np.repeat(best_score, counts) * (1 - 1e-12)
+        holds_best = np.zeros(num_nodes, dtype=bool)
+        holds_best[key_nodes[is_best & (key_labels == labels[key_nodes])]] = True
+        if holds_best[nodes].all():
+            converged = True
+            break
+
+        # Among the best-voted labels, pick the one with the highest priority
+        priority = rng.permutation(num_nodes)
+        candidate = np.where(is_best, priority[key_labels], -1)
+        label_of_priority = np.empty(num_nodes, dtype=np.int64)
+        label_of_priority[priority] = np.arange(num_nodes)
+        best_label = label_of_priority[np.maximum.reduceat(candidate, starts)]
+
+        update = ~holds_best[nodes] & (rng.random(len(nodes)) < update_fraction)
+        changes.append(int(update.sum()))
+        labels[nodes[update]] = best_label[update]
+
+    _, cluster_ids = np.unique(labels, return_inverse=True)
+    order = np.argsort(cluster_ids, kind="stable")
+    splits = np.cumsum(np.bincount(cluster_ids))[:-1]
+    communities = [cluster.tolist() for cluster in np.split(order, splits)]
+
+    stats = {
+        "iterations": len(changes),
+        "converged": converged,
+        "changes": changes,
+        "communities": len(communities),
+        "seconds": time.time() - curr_time,
+    }
+    print(
+        f"Sparse label propagation {'converged' if converged else 'stopped'} "
+        f"after {stats['iterations']} iterations with {stats['communities']} "
+        f"communities in {stats['seconds']:.2f} seconds"
+    )
+    if return_stats:
+        return communities, stats
+    return communities
+
+
+def asyn_lpa_communities(graph, seed=None):
     """
     Apply the asynchronous label propagation algorithm.
 
-    :param graph: NetworkX graph
+    :param graph: SuperpointGraph or NetworkX graph
+    :param seed: Seed for the random number generator
     :return: List of lists, where each sublist contains the nodes in a cluster
     """
     print("Applying asyn_lpa_communities...")
-    communities = nx.community.asyn_lpa_communities(graph, weight="weight")
+    communities = nx.community.asyn_lpa_communities(
+        as_networkx(graph, affinity=True), weight="weight", seed=seed
+    )
     return [list(community) for community in communities]
 
 
-def girvan_newman(graph):
+def girvan_newman(
+    graph,
+    target_communities=None,
+    num_sources=64,
+    workers=None,
+    seed=None,
+    patience=20,
+):
     """
     Apply the Girvan-Newman community detection algorithm.
 
-    :param graph: NetworkX graph
+    Repeatedly removes the edge with the highest edge betweenness (edge weights
+    are path lengths). Betweenness is estimated from num_sources randomly
+    sampled shortest-path sources per connected component (exact for smaller
+    components), with the sources split across worker processes for large
+    components. After a removal only the component that contained the edge is
+    recomputed. Shortest paths are assumed unique, which holds for the
+    real-valued lengths of point cloud graphs.
+
+    Without a target the partition with the highest modularity is returned;
+    the search stops once patience splits in a row did not improve it.
+
+    :param graph: SuperpointGraph or NetworkX graph
+    :param target_communities: Stop at this many communities, or None (or 0)
+        for the modularity peak
+    :param num_sources: Sampled sources per component
+    :param workers: Number of worker processes (None for all cores, 1 for none)
+    :param seed: Seed for the source sampling
+    :param patience: Splits without modularity gain before stopping
     :return: List of lists, where each sublist contains the nodes in a cluster
     """
     print("Applying girvan_newman...")
-    communities = nx.community.girvan_newman(graph)
-    return [list(community) for community in communities]
+    curr_time = time.time()
+    adjacency = sparse.triu(as_superpoint_graph(graph).adjacency, k=1).tocoo()
+    num_nodes = adjacency.shape[0]
+    rows, cols = adjacency.row, adjacency.col
+    # csgraph treats zeros as missing edges, see superpoint_graph
+    lengths = np.maximum(adjacency.data, np.finfo(np.float64).tiny)
+    degree = np.bincount(rows, minlength=num_nodes) + np.bincount(
+        cols, minlength=num_nodes
+    )
+
+    rng = np.random.default_rng(seed)
+    workers = workers or os.cpu_count() or 1
+    executor = None
+    alive = np.ones(len(rows), dtype=bool)
+    scores = np.zeros(len(rows))
+    num_components, component = csgraph.connected_components(adjacency, directed=False)
+
+    def update_scores(c):
+        nodes = np.flatnonzero(component == c)
+        edges = np.flatnonzero(alive & (component[rows] == c))
+        if not len(edges):
+            return
+        local = np.empty(num_nodes, dtype=np.int64)
+        local[nodes] = np.arange(len(nodes))
+        local_rows, local_cols = local[rows[edges]], local[cols[edges]]
+        sub_adjacency = sparse.csr_matrix(
+            (lengths[edges], (local_rows, local_cols)), shape=(len(nodes),) * 2
+        )
+        sub_adjacency = (sub_adjacency + sub_adjacency.T).tocsr()
+
+        sources = np.arange(len(nodes))
+        if len(nodes) > num_sources:
+            sources = rng.choice(sources, num_sources, replace=False)
+        nonlocal executor
+        if workers > 1 and len(nodes) * len(sources) >= GN_PARALLEL_WORK:
+            if executor is None:
+                executor = ProcessPoolExecutor(max_workers=workers)
+            chunks = np.array_split(sources, min(workers, len(sources)))
+            dependencies = sum(
+                executor.map(_edge_dependencies, [sub_adjacency] * len(chunks), chunks)
+            )
+        else:
+            dependencies = _edge_dependencies(sub_adjacency, sources)
+        dependencies = dependencies.tocsr()
+        scores[edges] = (
+            np.asarray(dependencies[local_rows, local_cols]).ravel()
+            + np.asarray(dependencies[local_cols, local_rows]).ravel()
+        ) * (len(nodes) / len(sources))
+
+    def partition_modularity():
+        # Unweighted modularity of the current components on the input graph
+        total = max(len(rows), 1)
+        inside = np.bincount(
+            component[rows][component[rows] == component[cols]],
+            minlength=num_components,
+        )
+        degrees = np.bincount(component, weights=degree, minlength=num_components)
+        return float(np.sum(inside / total - (degrees / (2 * total)) ** 2))
+
+    try:
+        for c in range(num_components):
+            update_scores(c)
+        best_modularity = partition_modularity()
+        best_component = component.copy()
+        stale = 0
+        while alive.any():
+            if target_communities and num_components >= target_communities:
+                break
+            edge = np.argmax(np.where(alive, scores, -np.inf))
+            alive[edge] = False
+            c = component[rows[edge]]
+            affected = [c]
+
+            nodes = np.flatnonzero(component == c)
+            edges = np.flatnonzero(alive & (component[rows] == c))
+            local = np.empty(num_nodes, dtype=np.int64)
+            local[nodes] = np.arange(len(nodes))
+            num_parts, parts = csgraph.connected_components(
+                sparse.csr_matrix(
+                    (
+                        np.ones(len(edges)),
+                        (local[rows[edges]], local[cols[edges]]),
+                    ),
+                    shape=(len(nodes),) * 2,
+                ),
+                directed=False,
+            )
+            if num_parts > 1:
+                for part in range(1, num_parts):
+                    component[nodes[parts == part]] = num_components
+                    affected.append(num_components)
+                    num_components += 1
+                current_modularity = partition_modularity()
+                if current_modularity > best_modularity:
+                    best_modularity = current_modularity
+                    best_component = component.copy()
+                    stale = 0
+                else:
+                    stale += 1
+                if not target_communities and stale >= patience:
+                    break
+            for c in affected:
+                update_scores(c)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if target_communities:
+        best_modularity = partition_modularity()
+    else:
+        component = best_component
+    _, cluster_ids = np.unique(component, return_inverse=True)
+    order = np.argsort(cluster_ids, kind="stable")
+    splits = np.cumsum(np.bincount(cluster_ids))[:-1]
+    communities = [cluster.tolist() for cluster in np.split(order, splits)]
+    print(
+        f"Girvan-Newman removed {np.count_nonzero(~alive)} edges and found "
+        f"{len(communities)} communities (modularity {best_modularity:.3f}) "
+        f"in {time.time() - curr_time:.2f} seconds"
+    )
+    return communities
+
+
+def _edge_dependencies(adjacency, sources):
+    """
+    Edge betweenness contributions of a set of shortest-path sources.
+
+    For every source the shortest-path tree is computed with Dijkstra; the
+    dependency of the tree edge (parent, node) is the size of the subtree below
+    node, accumulated level by level from the leaves up, for all sources at
+    once.
+
+    :param adjacency: Symmetric CSR adjacency of edge lengths (one component).
+    :param sources: Source node indices.
+    :return: Sparse (n_nodes, n_nodes) matrix; entry (parent, node) holds the
+        summed dependency of that edge over the sources.
+    """
+    num_nodes = adjacency.shape[0]
+    _, predecessors = csgraph.dijkstra(
+        adjacency, indices=sources, return_predecessors=True
+    )
+    offsets = (np.arange(len(sources)) * num_nodes)[:, None]
+    parent = np.where(predecessors >= 0, predecessors + offsets, -1).ravel()
+
+    # Depth in the shortest-path trees by pointer jumping
+    depth = (parent >= 0).astype(np.int64)
+    ancestor = parent.copy()
+    while True:
+        has_ancestor = ancestor >= 0
+        if not has_ancestor.any():
+            break
+        depth[has_ancestor] += depth[ancestor[has_ancestor]]
+        ancestor[has_ancestor] = ancestor[ancestor[has_ancestor]]
+
+    # Subtree sizes, deepest level first
+    subtree = np.ones(len(parent))
+    order = np.argsort(depth, kind="stable")
+    level_starts = np.searchsorted(depth[order], np.arange(depth.max() + 2))
+    for level in range(depth.max(), 0, -1):
+        members = order[level_starts[level] : level_starts[level + 1]]
+        np.add.at(subtree, parent[members], subtree[members])
+
+    has_parent = parent >= 0
+    return sparse.coo_matrix(
+        (
+            subtree[has_parent],
+            (parent[has_parent] % num_nodes, np.flatnonzero(has_parent) % num_nodes),
+        ),
+        shape=(num_nodes, num_nodes),
+    )
 
 
-def louvain(graph):
+def louvain(graph, seed=None):
     """
     Apply the Louvain community detection algorithm.
 
-    :param graph: NetworkX graph
+    :param graph: SuperpointGraph or NetworkX graph
+    :param seed: Seed for the random number generator
     :return: List of lists, where each sublist contains the nodes in a cluster
     """
     print("Applying louvain...")
-    communities = nx.community.louvain_communities(graph, weight="weight")
+    communities = nx.community.louvain_communities(
+        as_networkx(graph, affinity=True), weight="weight", seed=seed
+    )
     return [list(community) for community in communities]
 
 
@@ -54,21 +355,26 @@ def modularity(graph):
     """
     Apply the modularity community detection algorithm.
 
-    :param graph: NetworkX graph
+    :param graph: SuperpointGraph or NetworkX graph
     :return: List of lists, where each sublist contains the nodes in a cluster
     """
     print("Applying modularity...")
-    communities = nx.community.modularity_max.greedy_modularity_communities(graph)
+    communities = nx.community.modularity_max.greedy_modularity_communities(
+        as_networkx(graph)
+    )
     return [list(community) for community in communities]
 
 
-def kernighan_lin(graph):
+def kernighan_lin(graph, seed=None):
     """
     Apply the Kernighan-Lin community detection algorithm.
 
-    :param graph: NetworkX graph
+    :param graph: SuperpointGraph or NetworkX graph
+    :param seed: Seed for the random number generator
     :return: List of lists, where each sublist contains the nodes in a cluster
     """
     print("Applying kernighan_lin bipartitions...")
-    communities = nx.community.kernighan_lin_bisection(graph)
+    communities = nx.community.kernighan_lin_bisection(
+        as_networkx(graph, affinity=True), seed=seed
+    )
     return [list(community) for community in communities]
@@ -2,21 +2,22 @@
 import numpy as np
 
 
-def random_downsample(points, target_count):
+def random_downsample(points, target_count, seed=None):
     """
     Randomly downsamples a point cloud to a specified number of points.
 
     Parameters:
     points (np.ndarray): A numpy array of shape (N, 3), where N is the number of points in the point cloud.
     target_count (int): The desired number of points after downsampling.
+    seed (int, optional): Seed for the random number generator.
 
     Returns:
-    np.ndarray: A downsampled numpy array of shape (target_count, 3).
+    np.ndarray: Indices of sampled points (sorted).
     """
     if len(points) <= target_count:
-        return points
-    indices = np.random.choice(len(points), target_count, replace=False)
-    return points[indices]
+        return np.arange(len(points))
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(len(points), target_count, replace=False))
 
 
 # Vanilla FPS
@@ -33,7 +34,7 @@ def vanilla_fps(points, num_samples):
     """
     import fpsample
 
-    return points[fpsample.fps_sampling(points, num_samples)]
+    return fpsample.fps_sampling(points, num_samples)
 
 
 # FPS + NPDU
@@ -53,9 +54,9 @@ def fps_npdu(points, num_samples, k=None):
     import fpsample
 
     if k is not None:
-        return points[fpsample.fps_npdu_sampling(points, num_samples, k=k)]
+        return fpsample.fps_npdu_sampling(points, num_samples, k=k)
     else:
-        return points[fpsample.fps_npdu_sampling(points, num_samples)]
+        return fpsample.fps_npdu_sampling(points, num_samples)
 
 
 # FPS + NPDU + KDTree
@@ -74,9 +75,9 @@ def fps_npdu_kdtree(points, num_samples, k=None):
     import fpsample
 
     if k is not None:
-        return points[fpsample.fps_npdu_kdtree_sampling(points, num_samples, k=k)]
+        return fpsample.fps_npdu_kdtree_sampling(points, num_samples, k=k)
     else:
-        return points[fpsample.fps_npdu_kdtree_sampling(points, num_samples)]
+        return fpsample.fps_npdu_kdtree_sampling(points, num_samples)
 
 
 # KDTree-based FPS
@@ -94,7 +95,7 @@ def kdtree_fps(points, num_samples):
     """
     import fpsample
 
-    return points[fpsample.bucket_fps_kdtree_sampling(points, num_samples)]
+    return fpsample.bucket_fps_kdtree_sampling(points, num_samples)
 
 
 # Bucket-based FPS or QuickFPS
@@ -112,4 +113,284 @@ def bucket_fps_kdline(points, num_samples, h=3):
     """
     import fpsample
 
-    return points[fpsample.bucket_fps_kdline_sampling(points, num_samples, h=h)]
+    return fpsample.bucket_fps_kdline_sampling(points, num_samples, h=h)
+
+
+# Streaming reservoir sampling
+def reservoir_downsample(chunks, target_count, seed=None):
+    """
+    Uniformly samples points from a stream of point chunks with bounded memory.
+
+    Every point receives a random key and the target_count points with the
+    smallest keys are kept, which is equivalent to random sampling without
+    replacement over the whole stream. Only the reservoir and the current chunk
+    are held in memory.
+
+    Parameters:
+    chunks (iterable of np.ndarray): Arrays of shape (M, 3) read in sequence.
+    target_count (int): The desired number of points after downsampling.
+    seed (int, optional): Seed for the random number generator.
+
+    Returns:
+    tuple: The sampled points (np.ndarray of shape (<= target_count, 3)) and
+    their indices in the stream, in stream order.
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = np.empty((0, 3))
+    indices = np.empty(0, dtype=np.int64)
+    keys = np.empty(0)
+    offset = 0
+    for chunk in chunks:
+        reservoir = np.concatenate((reservoir, chunk))
+        indices = np.concatenate((indices, np.arange(offset, offset + len(chunk))))
+        keys = np.concatenate((keys, rng.random(len(chunk))))
+        offset += len(chunk)
+        if len(keys) > target_count:
+            keep = np.argpartition(keys, target_count)[:target_count]
+            reservoir, indices, keys = reservoir[keep], indices[keep], keys[keep]
+    order = np.argsort(indices)
+    return reservoir[order], indices[order]
+
+
+# Streaming voxel-grid pre-reduction
+def voxel_prereduce(chunks, max_points, voxel_size):
+    """
+    Reduces a stream of point chunks to at most one point per voxel.
+
+    The first point seen in each occupied voxel is kept. Whenever the number of
+    occupied voxels exceeds max_points the voxel size is doubled and the kept
+    points are merged again, so memory stays bounded by max_points plus one
+    chunk regardless of the size of the stream. Intended as a cheap first stage
+    ahead of farthest point sampling.
+
+    Parameters:
+    chunks (iterable of np.ndarray): Arrays of shape (M, 3) read in sequence.
+    max_points (int): Upper bound on the number of points kept.
+    voxel_size (float): Initial voxel edge length.
+
+    Returns:
+    tuple: The kept points (np.ndarray of shape (<= max_points, 3)) and their
+    indices in the stream, in stream order.
+    """
+    kept = np.empty((0, 3))
+    kept_indices = np.empty(0, dtype=np.int64)
+    kept_keys = np.empty(0, dtype=np.int64)
+    origin = None
+    offset = 0
+    for chunk in chunks:
+        if origin is None:
+            origin = chunk.min(axis=0)
+        points = np.concatenate((kept, chunk))
+        indices = np.concatenate((kept_indices, np.arange(offset, offset + len(chunk))))
+        keys = np.concatenate((kept_keys, _voxel_keys(chunk, origin, voxel_size)))
+        offset += len(chunk)
+        # np.unique keeps the first occurrence, so already kept points win
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        kept, kept_indices, kept_keys = points[first], indices[first], keys[first]
+        while len(kept) > max_points:
+            voxel_size *= 2
+            kept_keys = _voxel_keys(kept, origin, voxel_size)
+            _, first = np.unique(kept_keys, return_index=True)
+            first.sort()
+            kept, kept_indices = kept[first], kept_indices[first]
+            kept_keys = kept_keys[first]
+    return kept, kept_indices
+
+
+def _voxel_keys(points, origin, voxel_size):
+    """Packs integer voxel coordinates into one int64 key (21 bits per axis)."""
+    coords = np.floor((points - origin) / voxel_size).astype(np.int64) + (1 << 20)
+    coords = np.clip(coords, 0, (1 << 21) - 1)
+    return (coords[:, 0] << 42) | (coords[:, 1] << 21) | coords[:, 2]
+
+
+# Voxel-grid downsampling
+def voxel_downsample(points, target_count, seed=None):
+    """
+    Downsamples a point cloud to one point per occupied voxel.
+
+    The voxel size is fitted so that the number of occupied voxels just reaches
+    target_count; surplus voxels (at most a few percent) are dropped at random.
+    Each voxel is represented by its input point closest to the voxel mean.
+    Runs in O(N log N) per fitting step, with only a handful of steps needed.
+
+    Parameters:
+    points (np.ndarray): A numpy array of shape (N, 3).
+    target_count (int): The desired number of points after downsampling.
+    seed (int, optional): Seed for dropping surplus voxels.
+
+    Returns:
+    np.ndarray: Indices of sampled points (sorted).
+    """
+    if len(points) <= target_count:
+        return np.arange(len(points))
+    inverse, counts, centroids = _fitted_voxels(points, target_count)
+    distances = np.sum((points - centroids[inverse]) ** 2, axis=1)
+    # Sort by voxel, then distance; the first point of every voxel wins
+    order = np.lexsort((distances, inverse))
+    indices = order[np.concatenate(([0], np.cumsum(counts)[:-1]))]
+    return np.sort(_drop_surplus(indices, target_count, seed))
+
+
+def voxel_centroids(points, target_count, seed=None):
+    """
+    Replaces a point cloud by the means of the points in occupied voxels.
+
+    Same voxel fitting as voxel_downsample, but the result consists of new
+    points rather than a selection of the input, so there are no indices.
+
+    Parameters:
+    points (np.ndarray): A numpy array of shape (N, 3).
+    target_count (int): The desired number of points after downsampling.
+    seed (int, optional): Seed for dropping surplus voxels.
+
+    Returns:
+    np.ndarray: A numpy array of shape (<= target_count, 3).
+    """
+    if len(points) <= target_count:
+        return points
+    _, _, centroids = _fitted_voxels(points, target_count)
+    keep = _drop_surplus(np.arange(len(centroids)), target_count, seed)
+    return centroids[np.sort(keep)]
+
+
+def _fitted_voxels(points, target_count):
+    """
+    Voxel id of every point, point count and mean of every voxel, for the
+    voxel size that gives just over target_count occupied voxels.
+    """
+    origin = points.min(axis=0)
+
+    def count_voxels(voxel_size):
+        return len(np.unique(_voxel_keys(points, origin, voxel_size)))
+
+    voxel_size = _fit_scale(points, target_count, count_voxels)
+    _, inverse, counts = np.unique(
+        _voxel_keys(points, origin, voxel_size), return_inverse=True, return_counts=True
+    )
+    inverse = inverse.reshape(-1)
+    centroids = (
+        np.column_stack(
+            [np.bincount(inverse, weights=points[:, axis]) for axis in range(3)]
+        )
+        / counts[:, None]
+    )
+    return inverse, counts, centroids
+
+
+def _drop_surplus(indices, target_count, seed):
+    """Random subset of at most target_count of the given indices."""
+    if len(indices) <= target_count:
+        return indices
+    rng = np.random.default_rng(seed)
+    return indices[rng.choice(len(indices), target_count, replace=False)]
+
+
+# Approximate Poisson-disk downsampling
+def poisson_disk_downsample(points, target_count, seed=None):
+    """
+    Downsamples a point cloud so that no two kept points are closer than a radius.
+
+    Candidates are one random point per grid cell of edge radius / sqrt(3);
+    conflicting candidates (closer than the radius) are then resolved in
+    parallel rounds where a candidate is kept if it has the lowest random
+    priority among its remaining neighbors. The radius is fitted so the result
+    just reaches target_count, and surplus points are dropped by priority,
+    which keeps the minimum distance intact.
+
+    Parameters:
+    points (np.ndarray): A numpy array of shape (N, 3).
+    target_count (int): The desired number of points after downsampling.
+    seed (int, optional): Seed for the random priorities.
+
+    Returns:
+    np.ndarray: Indices of sampled points (sorted).
+    """
+    if len(points) <= target_count:
+        return np.arange(len(points))
+    rng = np.random.default_rng(seed)
+    # Points in priority order, so np.unique picks the best point per cell
+    priority_order = rng.permutation(len(points))
+    by_priority = points[priority_order]
+    origin = points.min(axis=0)
+
+    def sample(radius):
+        keys = _voxel_keys(by_priority, origin, radius / np.sqrt(3))
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        return first[_independent_set(by_priority[first], radius)]
+
+    radius = _fit_scale(points, target_count, lambda radius: len(sample(radius)))
+    # Indices into by_priority are priority ranks: keep the highest priorities
+    kept = sample(radius)[:target_count]
+    return np.sort(priority_order[kept])
+
+
+def _independent_set(points, radius):
+    """
+    Maximal set of points with pairwise distances of at least radius.
+
+    Points earlier in the array have priority. Returns sorted indices.
+    """
+    from scipy.spatial import cKDTree
+
+    pairs = cKDTree(points).query_pairs(radius, output_type="ndarray")
+    active = np.ones(len(points), dtype=bool)
+    kept = np.zeros(len(points), dtype=bool)
+    while len(pairs):
+        # A point is kept when no active neighbor has a lower index
+        lowest = np.arange(len(points))
+        np.minimum.at(lowest, pairs[:, 0], pairs[:, 1])
+        np.minimum.at(lowest, pairs[:, 1], pairs[:, 0])
+        winners = active & (lowest == np.arange(len(points)))
+        kept |= winners
+        losers = np.zeros(len(points), dtype=bool)
+        losers[pairs[:, 1][winners[pairs[:, 0]]]] = True
+        losers[pairs[:, 0][winners[pairs[:, 1]]]] = True
+        active &= ~(winners | losers)
+        pairs = pairs[active[pairs[:, 0]] & active[pairs[:, 1]]]
+    kept |= active
+    return np.flatnonzero(kept)
+
+
+def _fit_scale(points, target_count, count_fn, tolerance=0.05, max_iterations=30):
+    """
+    Finds a length scale (voxel size, radius) for which count_fn just reaches
+    target_count, assuming the count decreases with the scale.
+
+    Steps are taken on a log-log interpolation of the last bracketing counts,
+    which usually converges in a few evaluations. Returns the largest scale
+    found with at least target_count (the smallest tried if none reaches it).
+    """
+    extent = max(float(np.max(points.max(axis=0) - points.min(axis=0))), 1e-12)
+    smallest = extent / (1 << 20)  # Resolution limit of _voxel_keys
+    scale = max(extent / np.cbrt(target_count), smallest)
+    above = below = None  # (scale, count) with count >= / < target_count
+    for _ in range(max_iterations):
+        count = count_fn(scale)
+        if count >= target_count:
+            above = (scale, count)
+            if count <= target_count * (1 + tolerance):
+                break
+        else:
+            below = (scale, count)
+            if scale <= smallest:
+                break
+
+        if above and below:
+            dimension = np.log(above[1] / max(below[1], 1)) / np.log(
+                below[0] / above[0]
+            )
+            step = (above[1] / target_count) ** (1 / max(dimension, 1e-3))
+            next_scale = above[0] * step
+            if not above[0] < next_scale < below[0]:
+                next_scale = np.sqrt(above[0] * below[0])
+            if next_scale in (above[0], below[0]):
+                break
+            scale = next_scale
+        elif above:
+            scale *= 2
+        else:
+            scale = max(scale / 2, smallest)
+    return above[0] if above else scale
@@ -0,0 +1,85 @@
+# algorithms/features.py
+import numpy as np
+from algorithms.neighbors import get_index
+
+FEATURE_NAMES = ["linearity", "planarity", "scattering", "verticality"]
+
+
+def neighborhood_covariances(points, indices):
+    """
+    Covariance matrices of the neighborhoods of a batch of points.
+
+    :param points: Numpy array of shape (n_points, 3).
+    :param indices: Neighbor indices of shape (n_batch, k).
+    :return: Array of shape (n_batch, 3, 3).
+    """
+    neighbors = points[indices]
+    neighbors -= neighbors.mean(axis=1, keepdims=True)
+    return np.matmul(neighbors.transpose(0, 2, 1), neighbors) / indices.shape[1]
+
+
+def eigen_features(points, k=16, indices=None, chunk_size=65536):
+    """
+    Geometric eigen-features of the k-neighborhood of every point.
+
+    The eigenvalues l1 >= l2 >= l3 of each neighborhood covariance give
+    linearity (l1 - l2) / l1, planarity (l2 - l3) / l1 and scattering l3 / l1,
+    which sum to one. Verticality is the vertical share of the eigenvectors
+    weighted by their eigenvalues (as in Landrieu and Simonovsky's superpoint
+    graphs): near 1 for stems, near 0 for ground.
+
+    All eigendecompositions of a chunk run as one batched np.linalg.eigh call.
+
+    :param points: Numpy array of shape (n_points, 3).
+    :param k: Neighborhood size (the point itself included).
+    :param indices: Precomputed neighbor indices of shape (n_points, k), or None.
+    :param chunk_size: Points per batch, which bounds the (chunk, k, 3) memory.
+    :return: float32 array of shape (n_points, 4), columns as in FEATURE_NAMES.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n_points = len(points)
+    if indices is None:
+        indices = get_index(points).knn(k)[1]
+
+    features = np.zeros((n_points, len(FEATURE_NAMES)), dtype=np.float32)
+    for start in range(0, n_points, chunk_size):
+        stop = min(start + chunk_size, n_points)
+        eigenvalues, eigenvectors = np.linalg.eigh(
+            neighborhood_covariances(points, indices[start:stop])
+        )
+        # eigh sorts ascending: l3, l2, l1
+        eigenvalues = np.maximum(eigenvalues, 0)
+        l3, l2, l1 = eigenvalues[:, 0], eigenvalues[:, 1], eigenvalues[:, 2]
+        scale = np.where(l1 > 0, l1, 1.0)
+        features[start:stop, 0] = (l1 - l2) / scale
+        features[start:stop, 1] = (l2 - l3) / scale
+        features[start:stop, 2] = l3 / scale
+
+        # Columns of eigenvectors are the unit eigenvectors
+        unary = np.einsum("nj,nij->ni", eigenvalues, np.abs(eigenvectors))
+        norm = np.linalg.norm(unary, axis=1)
+        features[start:stop, 3] = unary[:, 2] / np.where(norm > 0, norm, 1.0)
+    return features
+
+
+def feature_edge_weights(lengths, features, rows, cols, feature_weight):
+    """
+    Edge lengths stretched by the feature difference of their endpoints.
+
+    Weights stay lengths (small means similar):
+    ``length * (1 + feature_weight * |f_i - f_j|)``. The MST, Girvan-Newman and
+    sparse label propagation read them as distances; the NetworkX algorithms
+    that read weights as connection strengths get them as affinities (see
+    superpoint_graph.length_affinities), so dissimilar pairs become weaker.
+
+    :param lengths: Euclidean edge lengths.
+    :param features: Per-point features (see eigen_features).
+    :param rows: Source node of every edge.
+    :param cols: Target node of every edge.
+    :param feature_weight: Strength of the feature term, 0 for plain lengths.
+    :return: Array of edge weights.
+    """
+    if not feature_weight:
+        return lengths
+    difference = np.linalg.norm(features[rows] - features[cols], axis=1)
+    return lengths * (1 + feature_weight * difference)
@@ -0,0 +1,235 @@
+# algorithms/neighbors.py
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+from sklearn.neighbors import NearestNeighbors
+
+BACKENDS = ["kdtree", "ball_tree", "brute"]
+
+# Fitted indices kept by get_index, most recently used last
+INDEX_CACHE_SIZE = 4
+_index_cache = OrderedDict()
+
+
+def kdtree_query(tree, points, k=1, workers=-1, **kwargs):
+    """
+    cKDTree.query using all cores.
+
+    :param tree: scipy.spatial.cKDTree.
+    :param points: Query points.
+    :param k: Number of neighbors.
+    :param workers: Number of threads (-1 for all cores).
+    :param kwargs: Passed on to cKDTree.query.
+    :return: Distances and indices as returned by cKDTree.query.
+    """
+    try:
+        return tree.query(points, k, workers=workers, **kwargs)
+    except TypeError:  # scipy < 1.6 calls the argument n_jobs
+        return tree.query(points, k, n_jobs=workers, **kwargs)
+
+
+class NeighborIndex:
+    """
+    Fitted nearest neighbor index over a point set.
+
+    Backends:
+
+    - ``"kdtree"``: scipy's cKDTree, queried on all cores.
+    - ``"ball_tree"``: scikit-learn's ball tree, queried in parallel jobs.
+    - ``"brute"``: exact distances in blocks of query points with NumPy, which
+      needs no tree and suits small point sets.
+
+    The k-nearest neighbors of the indexed points themselves are computed once
+    for the largest k requested so far; smaller k are slices of that result.
+    """
+
+    def __init__(self, points, backend="kdtree", workers=-1, block_bytes=2**26):
+        """
+        :param points: Numpy array of shape (n_points, 3).
+        :param backend: One of BACKENDS.
+        :param workers: Threads or jobs per query (-1 for all cores).
+        :param block_bytes: Size of the distance blocks of the brute backend.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown neighbor search backend: {backend}")
+        self.points = np.asarray(points, dtype=np.float64)
+        self.backend = backend
+        self.workers = workers
+        self.block_bytes = block_bytes
+        self._distances = None
+        self._indices = None
+
+        if backend == "kdtree":
+            self._tree = cKDTree(self.points)
+        elif backend == "ball_tree":
+            self._tree = NearestNeighbors(algorithm="ball_tree", n_jobs=workers)
+            self._tree.fit(self.points)
+        else:
+            # Centered coordinates keep the expanded distances accurate for
+            # georeferenced clouds
+            self._center = self.points.mean(axis=0) if len(self.points) else 0.0
+            self._centered = self.points - self._center
+            self._squared_norms = np.einsum("ij,ij->i", self._centered, self._centered)
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, query_points, k):
+        """
+        k nearest indexed points of arbitrary query points.
+
+        :param query_points: Numpy array of shape (n_queries, 3).
+        :param k: Number of neighbors (at most the number of indexed points).
+        :return: Distances and indices, both of shape (n_queries, k), sorted
+            by distance.
+        """
+        query_points = np.asarray(query_points, dtype=np.float64)
+        k = min(k, len(self.points))
+        if self.backend == "kdtree":
+            distances, indices = kdtree_query(self._tree, query_points, k, self.workers)
+            # cKDTree drops the neighbor axis for k == 1
+            return distances.reshape(-1, k), indices.reshape(-1, k)
+        if self.backend == "ball_tree":
+            return self._tree.kneighbors(query_points, k)
+        return self._brute_query(query_points, k)
+
+    def _brute_query(self, query_points, k):
+        centered = query_points - self._center
+        block = max(1, self.block_bytes // (8 * max(len(self.points), 1)))
+        distances = np.empty((len(query_points), k))
+        indices = np.empty((len(query_points), k), dtype=np.int64)
+        for start in range(0, len(query_points), block):
+            stop = min(start + block, len(query_points))
+            squared = (
+                self._squared_norms[None, :]
+                - 2 * centered[start:stop] @ self._centered.T
+                + np.einsum("ij,ij->i", centered[start:stop], centered[start:stop])[
+                    :, None
+                ]
+            )
+            if k < len(self.points):
+                nearest = np.argpartition(squared, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(k), squared.shape).copy()
+            # Exact distances of the candidates, sorted
+            exact = np.linalg.norm(
+                self._centered[nearest] - centered[start:stop, None, :], axis=2
+            )
+            order = np.argsort(exact, axis=1, kind="stable")
+            distances[start:stop] = np.take_along_axis(exact, order, axis=1)
+            indices[start:stop] = np.take_along_axis(nearest, order, axis=1)
+        return distances, indices
+
+    def knn(self, k):
+        """
+        k nearest neighbors of every indexed point, the point itself included.
+
+        :param k: Number of neighbors (at most the number of points).
+        :return: Distances and indices of shape (n_points, k).
+        """
+        k = min(k, len(self.points))
+        if self._indices is None or self._indices.shape[1] < k:
+            self._distances, self._indices = self.query(self.points, k)
+        return self._distances[:, :k], self._indices[:, :k]
+
+    def radius_pairs(self, radius):
+        """
+        All pairs of indexed points closer than radius, each pair once.
+
+        :param radius: Search radius.
+        :return: Arrays (rows, cols, distances) with rows < cols.
+        """
+        if self.backend == "kdtree":
+            pairs = self._tree.query_pairs(radius, output_type="ndarray")
+            rows, cols = pairs[:, 0], pairs[:, 1]
+        elif self.backend == "ball_tree":
+            graph = self._tree.radius_neighbors_graph(
+                self.points, radius, mode="connectivity"
+            )
+            graph = sparse.triu(graph, k=1).tocoo()
+            rows, cols = graph.row, graph.col
+        else:
+            rows, cols = [], []
+            block = max(1, self.block_bytes // (24 * max(len(self.points), 1)))
+            for start in range(0, len(self.points), block):
+                stop = min(start + block, len(self.points))
+                difference = (
+                    self._centered[start:stop, None, :] - self._centered[None, :, :]
+                )
+                block_rows, block_cols = np.nonzero(
+                    np.einsum("ijk,ijk->ij", difference, difference) <= radius**2
+                )
+                block_rows += start
+                upper = block_rows < block_cols
+                rows.append(block_rows[upper])
+                cols.append(block_cols[upper])
+            rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+            cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        distances = np.linalg.norm(self.points[rows] - self.points[cols], axis=1)
+        return rows, cols, distances
+
+
+def get_index(points, backend="kdtree", workers=-1):
+    """
+    Fitted NeighborIndex of a point set, reused while it stays cached.
+
+    Indices are looked up by the content of the points, so a point set
+    reloaded from the stage cache still finds its index (and its k-nearest
+    neighbors) from an earlier graph construction.
+
+    :param points: Numpy array of shape (n_points, 3).
+    :param backend: One of BACKENDS.
+    :param workers: Threads or jobs per query (-1 for all cores).
+    :return: NeighborIndex.
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    key = (
+        points.shape,
+        backend,
+        workers,
+        hashlib.blake2b(points.data, digest_size=16).hexdigest(),
+    )
+    index = _index_cache.pop(key, None)
+    if index is None:
+        index = NeighborIndex(points, backend, workers)
+    _index_cache[key] = index
+    while len(_index_cache) > INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+    return index
+
+
+def knn_edges(index, k):
+    """
+    Directed edges from every point to its k nearest neighbors.
+
+    :param index: NeighborIndex.
+    :param k: Number of neighbors (the point itself counts as the first).
+    :return: Arrays (rows, cols, distances).
+    """
+    distances, indices = index.knn(k)
+    rows = np.repeat(np.arange(len(index)), indices.shape[1])
+    return rows, indices.ravel(), distances.ravel()
+
+
+def mutual_knn_edges(index, k):
+    """
+    Edges between points that are among each other's k nearest neighbors.
+
+    :param index: NeighborIndex.
+    :param k: Number of neighbors (the point itself counts as the first).
+    :return: Arrays (rows, cols, distances) with rows < cols.
+    """
+    rows, cols, distances = knn_edges(index, k)
+    num_points = len(index)
+    directed = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(num_points, num_points)
+    )
+    # Entries present in both directions sum to 2
+    mutual = sparse.triu(directed + directed.T, k=1).tocoo()
+    keep = mutual.data >= 2
+    rows, cols = mutual.row[keep].astype(np.int64), mutual.col[keep].astype(np.int64)
+    return rows, cols, np.linalg.norm(index.points[rows] - index.points[cols], axis=1)
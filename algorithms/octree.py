@@ -0,0 +1,192 @@
+# algorithms/octree.py
+import numpy as np
+
+# Bits per axis of the Morton codes; 3 * MAX_DEPTH must fit in 64 bits
+MAX_DEPTH = 21
+
+
+def _spread_bits(values):
+    # Insert two zero bits between each of the lower 21 bits
+    values = values.astype(np.uint64) & np.uint64(0x1FFFFF)
+    values = (values | (values << np.uint64(32))) & np.uint64(0x1F00000000FFFF)
+    values = (values | (values << np.uint64(16))) & np.uint64(0x1F0000FF0000FF)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x100F00F00F00F00F)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x10C30C30C30C30C3)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return values
+
+
+def morton_codes(points, depth):
+    """
+    Z-order codes of points on a 2^depth grid spanning their bounding cube.
+
+    :param points: Numpy array of shape (n_points, 3).
+    :param depth: Number of bits per axis (at most MAX_DEPTH).
+    :return: uint64 array of codes.
+    """
+    lower = points.min(axis=0)
+    size = max(float(np.max(points.max(axis=0) - lower)), np.finfo(float).tiny)
+    cells = np.floor((points - lower) / size * (1 << depth)).astype(np.int64)
+    cells = np.clip(cells, 0, (1 << depth) - 1)
+    return (
+        _spread_bits(cells[:, 0])
+        | (_spread_bits(cells[:, 1]) << np.uint64(1))
+        | (_spread_bits(cells[:, 2]) << np.uint64(2))
+    )
+
+
+class Octree:
+    """
+    Level-of-detail index over a point cloud.
+
+    The cloud is split into octree leaves of at most leaf_size points (or the
+    maximum depth). Points are stored leaf by leaf in random order, so any
+    prefix of a leaf is a uniform sample of it and a level of detail is just a
+    prefix length per leaf. select() spends a point budget on the leaves
+    according to their projected size on screen.
+    """
+
+    def __init__(self, points, leaf_size=4096, max_depth=16, seed=0):
+        points = np.asarray(points, dtype=np.float64)
+        max_depth = min(max_depth, MAX_DEPTH)
+        codes = morton_codes(points, max_depth) if len(points) else np.zeros(0)
+        sorted_indices = np.argsort(codes, kind="stable")
+        codes = codes[sorted_indices]
+
+        leaf_starts = []
+        leaf_ends = []
+        # Ranges (into the sorted codes) of nodes that still need splitting
+        starts = np.zeros(1, dtype=np.int64)
+        ends = np.full(1, len(points), dtype=np.int64)
+        for level in range(1, max_depth + 1):
+            is_leaf = ends - starts <= leaf_size
+            leaf_starts.append(starts[is_leaf])
+            leaf_ends.append(ends[is_leaf])
+            starts, ends = starts[~is_leaf], ends[~is_leaf]
+            if not len(starts):
+                break
+
+            # Children start wherever the code prefix of this level changes;
+            # prefixes of different parents always differ as well
+            lengths = ends - starts
+            positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            positions += np.arange(lengths.sum())
+            prefix = codes[positions] >> np.uint64(3 * (max_depth - level))
+            boundary = np.flatnonzero(
+                np.concatenate(([True], prefix[1:] != prefix[:-1]))
+            )
+            starts = positions[boundary]
+            ends = np.append(positions[boundary[1:] - 1] + 1, positions[-1] + 1)
+        leaf_starts.append(starts)
+        leaf_ends.append(ends)
+
+        order = np.argsort(np.concatenate(leaf_starts), kind="stable")
+        self.leaf_start = np.concatenate(leaf_starts)[order]
+        self.leaf_count = np.concatenate(leaf_ends)[order] - self.leaf_start
+        self.leaf_start = self.leaf_start[self.leaf_count > 0]
+        self.leaf_count = self.leaf_count[self.leaf_count > 0]
+
+        # Shuffle the points within every leaf
+        leaf_ids = np.repeat(np.arange(len(self.leaf_count)), self.leaf_count)
+        ranks = np.random.default_rng(seed).random(len(points))
+        self.order = sorted_indices[np.lexsort((ranks, leaf_ids))]
+
+        # Bounding spheres of the leaves
+        if len(points):
+            leaf_points = points[self.order]
+            lower = np.minimum.reduceat(leaf_points, self.leaf_start, axis=0)
+            upper = np.maximum.reduceat(leaf_points, self.leaf_start, axis=0)
+        else:
+            lower = upper = np.zeros((0, 3))
+        self.leaf_center = (lower + upper) / 2
+        self.leaf_radius = np.linalg.norm(upper - lower, axis=1) / 2
+
+    @property
+    def num_points(self):
+        return len(self.order)
+
+    @property
+    def num_leaves(self):
+        return len(self.leaf_count)
+
+    def leaf_weights(
+        self,
+        camera_position,
+        view_direction,
+        view_angle,
+        aspect_ratio=1.0,
+        offscreen_weight=0.1,
+    ):
+        """
+        Relative screen area of every leaf for a perspective camera.
+
+        :param camera_position: Camera position.
+        :param view_direction: Direction the camera looks in.
+        :param view_angle: Vertical view angle in degrees.
+        :param aspect_ratio: Window width divided by height.
+        :param offscreen_weight: Weight factor of leaves outside the view cone,
+            which keeps some context visible while the camera moves.
+        :return: Array of leaf weights.
+        """
+        direction = np.asarray(view_direction, dtype=np.float64)
+        direction /= max(np.linalg.norm(direction), np.finfo(float).tiny)
+        relative = self.leaf_center - np.asarray(camera_position, dtype=np.float64)
+        distance = np.linalg.norm(relative, axis=1)
+        along = relative @ direction
+        across = np.sqrt(np.maximum(distance**2 - along**2, 0))
+
+        # Cone around the view direction enclosing the view frustum
+        half_angle = np.arctan(
+            np.tan(np.radians(view_angle) / 2) * np.hypot(1, max(aspect_ratio, 1))
+        )
+        cone_distance = across * np.cos(half_angle) - along * np.sin(half_angle)
+        visible = (cone_distance <= self.leaf_radius) & (along >= -self.leaf_radius)
+
+        # Leaves of duplicate points still get a (tiny) share
+        scene_size = max(self.leaf_radius.max(), distance.max(), 1.0)
+        radius = np.maximum(self.leaf_radius, 1e-3 * scene_size)
+        weights = (radius / np.maximum(distance, radius)) ** 2
+        return np.where(visible, weights, weights * offscreen_weight)
+
+    def select(self, budget, camera_position=None, view_direction=None, **kwargs):
+        """
+        Indices of the points to display for a camera, at most budget of them.
+
+        Every leaf gets a number of points proportional to its weight (see
+        leaf_weights), capped at its size, scaled so the total fits the budget.
+        Without a camera the points are sampled uniformly.
+
+        :param budget: Maximum number of points.
+        :param camera_position: Camera position, or None.
+        :param view_direction: Direction the camera looks in.
+        :param kwargs: Passed on to leaf_weights.
+        :return: Array of point indices.
+        """
+        if budget >= self.num_points:
+            return self.order
+        if camera_position is None:
+            weights = self.leaf_count.astype(np.float64)
+        else:
+            weights = self.leaf_weights(camera_position, view_direction, **kwargs)
+
+        # Binary search for the scale that fills the budget
+        positive = weights > 0
+        if not positive.any():
+            return self.order[:0]
+        lower = 0.0
+        upper = float(np.max(self.leaf_count[positive] / weights[positive]))
+        for _ in range(100):
+            scale = (lower + upper) / 2
+            taken = np.minimum(self.leaf_count, np.floor(scale * weights)).sum()
+            if taken > budget:
+                upper = scale
+            else:
+                lower = scale
+        counts = np.minimum(self.leaf_count, np.floor(lower * weights)).astype(np.int64)
+
+        # Concatenate the first counts[i] points of every leaf
+        starts = self.leaf_start[counts > 0]
+        counts = counts[counts > 0]
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        positions += np.arange(counts.sum())
+        return self.order[positions]
@@ -1,47 +1,416 @@
 # algorithms/superpoint_graph.py
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
+from scipy import sparse
 import networkx as nx
-from scipy.spatial.distance import pdist, squareform
+from scipy.sparse import csgraph
+from scipy.spatial import Delaunay
+from algorithms.features import eigen_features, feature_edge_weights
+from algorithms.neighbors import get_index, knn_edges, mutual_knn_edges
 
+try:
+    from scipy.spatial import QhullError
+except ImportError:  # scipy < 1.8
+    from scipy.spatial.qhull import QhullError
 
-def create_knn_graph(points, k):
+
+class SuperpointGraph:
+    """
+    Undirected, weighted superpoint graph backed by a symmetric CSR adjacency.
+
+    Edge weights are stored once per direction, so ``adjacency[i, j]`` and
+    ``adjacency[j, i]`` always hold the same value. Zero-length edges (duplicate
+    points) are kept as explicit zeros rather than being dropped.
+    """
+
+    def __init__(self, adjacency):
+        self.adjacency = sparse.csr_matrix(adjacency)
+
+    @classmethod
+    def from_edges(cls, num_nodes, rows, cols, weights):
+        """
+        Build a graph from an edge list, symmetrizing and de-duplicating it.
+
+        :param num_nodes: Number of nodes in the graph.
+        :param rows: Array of edge source node ids.
+        :param cols: Array of edge target node ids.
+        :param weights: Array of edge weights.
+        :return: SuperpointGraph with one undirected edge per unique node pair.
+        """
+        rows = np.asarray(rows, dtype=np.int64).ravel()
+        cols = np.asarray(cols, dtype=np.int64).ravel()
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+
+        # Drop self-loops and put every pair in (low, high) order
+        keep = rows != cols
+        rows, cols, weights = rows[keep], cols[keep], weights[keep]
+        low = np.minimum(rows, cols)
+        high = np.maximum(rows, cols)
+
+        # Keep a single copy of each undirected edge
+        _, first = np.unique(low * num_nodes + high, return_index=True)
+        low, high, weights = low[first], high[first], weights[first]
+
+        adjacency = sparse.coo_matrix(
+            (
+                np.concatenate((weights, weights)),
+                (np.concatenate((low, high)), np.concatenate((high, low))),
+            ),
+            shape=(num_nodes, num_nodes),
+        ).tocsr()
+        adjacency.sort_indices()
+        return cls(adjacency)
+
+    @property
+    def num_nodes(self):
+        return self.adjacency.shape[0]
+
+    @property
+    def num_edges(self):
+        return self.adjacency.nnz // 2
+
+    def degree(self):
+        """Number of neighbors of every node."""
+        return np.diff(self.adjacency.indptr)
+
+    def neighbors(self, node):
+        """Neighbor ids and edge weights of ``node`` as zero-copy CSR slices."""
+        start, end = self.adjacency.indptr[node], self.adjacency.indptr[node + 1]
+        return self.adjacency.indices[start:end], self.adjacency.data[start:end]
+
+    def edges(self):
+        """
+        Return the undirected edge list with each edge listed once.
+
+        :return: Tuple (rows, cols, weights) with rows < cols.
+        """
+        coo = self.adjacency.tocoo()
+        upper = coo.row < coo.col
+        return coo.row[upper], coo.col[upper], coo.data[upper]
+
+    def to_networkx(self, affinity=False):
+        """
+        Convert to a NetworkX graph (opt-in fallback for NetworkX algorithms).
+
+        :param affinity: Store affinities (see length_affinities) instead of lengths
+            as the ``weight`` attribute, for algorithms that treat a larger
+            weight as a stronger connection.
+        :return: NetworkX graph with a ``weight`` attribute on every edge.
+        """
+        G = nx.Graph()
+        G.add_nodes_from(range(self.num_nodes))
+        rows, cols, weights = self.edges()
+        if affinity:
+            weights = length_affinities(weights)
+        G.add_weighted_edges_from(
+            zip(rows.tolist(), cols.tolist(), weights.tolist()), weight="weight"
+        )
+        return G
+
+
+def length_affinities(lengths):
+    """
+    Turn edge lengths into affinities exp(-length / median length).
+
+    Short edges get affinities near 1 and long ones near 0, for algorithms
+    that treat a larger weight as a stronger connection.
+
+    :param lengths: Array of edge lengths.
+    :return: Array of affinities.
+    """
+    positive = lengths[lengths > 0]
+    scale = np.median(positive) if len(positive) else 1.0
+    return np.exp(-lengths / scale)
+
+
+def as_networkx(graph, affinity=False):
+    """
+    Return ``graph`` as a NetworkX graph, converting a SuperpointGraph if needed.
+
+    :param graph: SuperpointGraph or NetworkX graph.
+    :param affinity: Weight the edges by affinity instead of length (see
+        SuperpointGraph.to_networkx).
+    :return: NetworkX graph.
+    """
+    if affinity:
+        return as_superpoint_graph(graph).to_networkx(affinity=True)
+    if isinstance(graph, SuperpointGraph):
+        return graph.to_networkx()
+    return graph
+
+
+def as_superpoint_graph(graph):
+    """
+    Return ``graph`` as a SuperpointGraph, converting a NetworkX graph if needed.
+
+    :param graph: SuperpointGraph or NetworkX graph with nodes 0..n-1.
+    :return: SuperpointGraph (edges without a weight get weight 1).
+    """
+    if isinstance(graph, SuperpointGraph):
+        return graph
+    edges = np.array(list(graph.edges(data="weight", default=1.0)), dtype=float)
+    edges = edges.reshape(-1, 3)
+    return SuperpointGraph.from_edges(
+        graph.number_of_nodes(),
+        edges[:, 0].astype(np.int64),
+        edges[:, 1].astype(np.int64),
+        edges[:, 2],
+    )
+
+
+def create_knn_graph(
+    points,
+    k,
+    return_networkx=False,
+    feature_weight=0.0,
+    feature_k=16,
+    backend="kdtree",
+):
     """
     Create a KNN graph from point cloud data.
 
     :param points: Numpy array of point cloud coordinates (shape: [n_points, 3]).
-    :param k: Number of nearest neighbors to consider for graph construction.
-    :return: NetworkX graph representing the KNN graph.
+    :param k: Number of nearest neighbors to consider for graph construction
+        (the query point itself counts as the first neighbor).
+    :param return_networkx: Return a NetworkX graph instead of a SuperpointGraph.
+    :param feature_weight: Stretch edges between points with different
+        eigen-features by this factor (see features.feature_edge_weights),
+        0 for plain Euclidean lengths.
+    :param feature_k: Neighborhood size of the eigen-features.
+    :param backend: Neighbor search backend (see neighbors.BACKENDS).
+    :return: SuperpointGraph (or NetworkX graph) representing the KNN graph.
     """
     print("Creating KNN graph...")
-    nbrs = NearestNeighbors(n_neighbors=k, algorithm="auto").fit(points)
-    distances, indices = nbrs.kneighbors(points)
+    index = get_index(points, backend)
+    rows, cols, weights = knn_edges(index, k)
+    graph = _weighted_graph(index, rows, cols, weights, feature_weight, feature_k)
+    return graph.to_networkx() if return_networkx else graph
+
 
-    G = nx.Graph()
-    for i in range(indices.shape[0]):
-        for j in range(1, indices.shape[1]):  # Start from 1 to avoid self-loop
-            G.add_edge(i, indices[i, j], weight=distances[i, j])
+def create_mutual_knn_graph(
+    points,
+    k,
+    return_networkx=False,
+    feature_weight=0.0,
+    feature_k=16,
+    backend="kdtree",
+):
+    """
+    Create a mutual KNN graph from point cloud data.
 
-    return G
+    Only points that are among each other's k nearest neighbors are connected,
+    which cuts the long edges a KNN graph grows from sparse into dense regions.
+    Isolated points stay unconnected.
 
+    :param points: Numpy array of point cloud coordinates (shape: [n_points, 3]).
+    :param k: Number of nearest neighbors (the point itself included).
+    :param return_networkx: Return a NetworkX graph instead of a SuperpointGraph.
+    :param feature_weight: See create_knn_graph.
+    :param feature_k: Neighborhood size of the eigen-features.
+    :param backend: Neighbor search backend (see neighbors.BACKENDS).
+    :return: SuperpointGraph (or NetworkX graph) representing the graph.
+    """
+    print("Creating mutual KNN graph...")
+    index = get_index(points, backend)
+    rows, cols, weights = mutual_knn_edges(index, k)
+    graph = _weighted_graph(index, rows, cols, weights, feature_weight, feature_k)
+    return graph.to_networkx() if return_networkx else graph
 
-def create_mst_graph(points):
+
+def create_radius_graph(
+    points,
+    radius=None,
+    k=8,
+    return_networkx=False,
+    feature_weight=0.0,
+    feature_k=16,
+    backend="kdtree",
+):
     """
-    Create a Minimum Spanning Tree (MST) graph from point cloud data.
+    Create a graph connecting all points closer than a radius.
 
     :param points: Numpy array of point cloud coordinates (shape: [n_points, 3]).
-    :return: NetworkX graph representing the MST graph.
+    :param radius: Connection radius. None (or 0) uses the median distance of
+        the points to their k-th nearest neighbor.
+    :param k: Neighbor count of the automatic radius (the point itself included).
+    :param return_networkx: Return a NetworkX graph instead of a SuperpointGraph.
+    :param feature_weight: See create_knn_graph.
+    :param feature_k: Neighborhood size of the eigen-features.
+    :param backend: Neighbor search backend (see neighbors.BACKENDS).
+    :return: SuperpointGraph (or NetworkX graph) representing the graph.
+    """
+    print("Creating radius graph...")
+    index = get_index(points, backend)
+    if not radius:
+        radius = float(np.median(index.knn(k)[0][:, -1]))
+        print(f"Radius graph radius: {radius:.4g}")
+    rows, cols, weights = index.radius_pairs(radius)
+    graph = _weighted_graph(index, rows, cols, weights, feature_weight, feature_k)
+    return graph.to_networkx() if return_networkx else graph
+
+
+def _weighted_graph(index, rows, cols, lengths, feature_weight, feature_k):
+    """Build a SuperpointGraph, stretching the edge lengths by eigen-features."""
+    if feature_weight:
+        features = eigen_features(index.points, indices=index.knn(feature_k)[1])
+        lengths = feature_edge_weights(lengths, features, rows, cols, feature_weight)
+    return SuperpointGraph.from_edges(len(index), rows, cols, lengths)
+
+
+def create_mst_graph(
+    points,
+    candidates="knn",
+    k=16,
+    return_networkx=False,
+    feature_weight=0.0,
+    feature_k=16,
+    backend="kdtree",
+):
+    """
+    Create a Euclidean Minimum Spanning Tree (MST) graph from point cloud data.
+
+    The tree is extracted with scipy's compiled MST routine from a sparse set of
+    candidate edges instead of the complete graph:
+
+    - ``"delaunay"``: edges of the 3D Delaunay tetrahedralization, which always
+      contain the Euclidean MST (exact). Falls back to ``"knn"`` for degenerate
+      (e.g. coplanar) inputs.
+    - ``"knn"``: edges of the k-nearest-neighbor graph, with disconnected
+      components bridged by their shortest connecting edges (approximate).
+    - ``"complete"``: all pairwise distances (exact, O(N^2) memory, small N only).
+
+    :param points: Numpy array of point cloud coordinates (shape: [n_points, 3]).
+    :param candidates: Candidate edge set, one of "delaunay", "knn" or "complete".
+    :param k: Number of nearest neighbors for the "knn" candidate graph.
+    :param return_networkx: Return a NetworkX graph instead of a SuperpointGraph.
+    :param feature_weight: Stretch candidate edges between points with different
+        eigen-features by this factor before extracting the tree, so it prefers
+        to cross between geometrically similar points. 0 for the Euclidean MST.
+    :param feature_k: Neighborhood size of the eigen-features.
+    :param backend: Neighbor search backend (see neighbors.BACKENDS).
+    :return: SuperpointGraph (or NetworkX graph) representing the MST graph.
     """
     print("Creating MST graph...")
-    # Calculate pairwise distances between points
-    dist_matrix = squareform(pdist(points))
-
-    # Create a complete graph
-    G = nx.Graph()
-    for i in range(len(points)):
-        for j in range(i + 1, len(points)):
-            G.add_edge(i, j, weight=dist_matrix[i, j])
-
-    # Generate MST from the complete graph
-    G = nx.minimum_spanning_tree(G)
-    return G
+    points = np.asarray(points, dtype=np.float64)
+    n_points = len(points)
+
+    index = None
+    if candidates == "delaunay" and n_points > points.shape[1] + 1:
+        try:
+            rows, cols = _delaunay_edges(points)
+        except QhullError:
+            print("Delaunay triangulation failed, using KNN candidates instead")
+            candidates = "knn"
+    elif candidates == "delaunay":
+        candidates = "complete"
+
+    if candidates == "knn":
+        index = get_index(points, backend)
+        rows, cols, _ = knn_edges(index, k)
+    elif candidates == "complete":
+        rows, cols = np.triu_indices(n_points, k=1)
+    elif candidates != "delaunay":
+        raise ValueError(f"Unknown MST candidate set: {candidates}")
+
+    weights = np.linalg.norm(points[rows] - points[cols], axis=1)
+    if feature_weight and index is None:
+        index = get_index(points, backend)
+    if feature_weight:
+        graph = _weighted_graph(index, rows, cols, weights, feature_weight, feature_k)
+    else:
+        graph = SuperpointGraph.from_edges(n_points, rows, cols, weights)
+    graph = _minimum_spanning_tree(graph)
+
+    # Duplicate points dropped by Qhull or separated KNN neighborhoods leave a
+    # forest; join it into a single tree
+    graph = _bridge_components(points, graph, index, backend)
+
+    return graph.to_networkx() if return_networkx else graph
+
+
+def _delaunay_edges(points):
+    """Return the unique edges (rows, cols) of the Delaunay tetrahedralization."""
+    simplices = Delaunay(points).simplices
+    pairs = [
+        (a, b)
+        for a in range(simplices.shape[1])
+        for b in range(a + 1, simplices.shape[1])
+    ]
+    rows = np.concatenate([simplices[:, a] for a, _ in pairs])
+    cols = np.concatenate([simplices[:, b] for _, b in pairs])
+    return rows, cols
+
+
+def _minimum_spanning_tree(graph):
+    """
+    Compute the minimum spanning forest of a SuperpointGraph.
+
+    scipy's csgraph routines treat zero entries as missing edges, so zero-length
+    edges between duplicate points are nudged to the smallest positive float
+    before the MST and restored afterwards.
+    """
+    adjacency = graph.adjacency.copy()
+    zero_weight = np.finfo(adjacency.dtype).tiny
+    adjacency.data = np.maximum(adjacency.data, zero_weight)
+    mst = csgraph.minimum_spanning_tree(adjacency).tocoo()
+    weights = np.where(mst.data <= zero_weight, 0.0, mst.data)
+    return SuperpointGraph.from_edges(graph.num_nodes, mst.row, mst.col, weights)
+
+
+def _bridge_components(points, graph, index=None, backend="kdtree", k=2):
+    """
+    Connect the trees of a spanning forest into a single spanning tree.
+
+    Runs Boruvka rounds on the forest components: every point looks up its
+    nearest neighbors, the shortest edge leaving each component is added, and
+    the neighbor count is doubled whenever some component finds no such edge.
+    """
+    n_points = len(points)
+    n_components, component = csgraph.connected_components(
+        graph.adjacency, directed=False
+    )
+    if n_components > 1 and index is None:
+        index = get_index(points, backend)
+    rows, cols, weights = graph.edges()
+    rows, cols, weights = [rows], [cols], [weights]
+
+    while n_components > 1:
+        k = min(k, n_points)
+        distances, indices = index.knn(k)
+
+        # First neighbor of every point that lies in another component
+        outside = component[indices] != component[:, None]
+        has_outside = outside.any(axis=1)
+        first = np.argmax(outside, axis=1)
+        source = np.flatnonzero(has_outside)
+        target = indices[source, first[source]]
+        length = distances[source, first[source]]
+
+        # Shortest outgoing edge per component
+        order = np.lexsort((length, component[source]))
+        source, target, length = source[order], target[order], length[order]
+        _, first_of_component = np.unique(component[source], return_index=True)
+        source = source[first_of_component]
+        target = target[first_of_component]
+        length = length[first_of_component]
+
+        if len(source) < n_components:
+            k *= 2
+
+        rows.append(source)
+        cols.append(target)
+        weights.append(length)
+        graph = _minimum_spanning_tree(
+            SuperpointGraph.from_edges(
+                n_points,
+                np.concatenate(rows),
+                np.concatenate(cols),
+                np.concatenate(weights),
+            )
+        )
+        rows, cols, weights = graph.edges()
+        rows, cols, weights = [rows], [cols], [weights]
+        n_components, component = csgraph.connected_components(
+            graph.adjacency, directed=False
+        )
+
+    return graph
@@ -0,0 +1,228 @@
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import config.settings as settings
+from algorithms import neighbors
+from data import label_journal, label_store
+from data.manifest import FolderManifest, suggest_downsampling
+from data.stage_cache import StageCache
+from pipeline import processing
+from pipeline.profiling import profiler
+
+
+def process_file(file_path, destination_folder, params, cache_dir, max_bytes):
+    # Runs in a worker process: the GUI pipeline minus rendering. Returns the
+    # profiling spans of this file along with its statistics.
+    profiler.clear()
+    curr_time = time.time()
+    cache = StageCache(cache_dir, max_bytes) if cache_dir else None
+    # Files already run in parallel, so Girvan-Newman stays in this process
+    params = {**params, "gn_workers": 1}
+    result = processing.run_pipeline(file_path, params, cache=cache)
+    processing.save_new_partition(
+        label_store.label_file_path(destination_folder, file_path),
+        file_path,
+        params,
+        result["points"],
+        result["partition"],
+        indices=result["indices"],
+    )
+    return (
+        len(result["points"]),
+        len(result["partition"]),
+        time.time() - curr_time,
+        list(profiler.records),
+    )
+
+
+def parse_args(argv=None):
+    defaults = settings.current_settings
+    parser = argparse.ArgumentParser(
+        description="Precompute the label partitions of a folder of point clouds "
+        "without opening the GUI."
+    )
+    parser.add_argument("folder", help="Folder with .las/.laz/.txt point cloud files")
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Destination folder for the partition files (default: the input folder)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of files processed in parallel",
+    )
+    parser.add_argument("--downsampling", default=defaults["Subsampling"])
+    parser.add_argument("--target-count", type=int, default=defaults["Subsample_size"])
+    parser.add_argument(
+        "--adaptive-downsampling",
+        action="store_true",
+        default=defaults["Adaptive_downsampling"],
+        help="Adapt the downsampling to each file's point count (skip files below "
+        "the target count, pick the QuickFPS variant by size)",
+    )
+    parser.add_argument(
+        "--no-adaptive-downsampling",
+        dest="adaptive_downsampling",
+        action="store_false",
+        help="Use the same downsampling for every file",
+    )
+    parser.add_argument("--graph", default=defaults["superpoint_graph"])
+    parser.add_argument("--k", type=int, default=defaults["KNN_graph"])
+    parser.add_argument("--mst-candidates", default=defaults["MST_candidates"])
+    parser.add_argument(
+        "--radius",
+        type=float,
+        default=defaults["Radius_graph"],
+        help="Radius of the radius graph (0 to derive it from --k)",
+    )
+    parser.add_argument(
+        "--neighbor-backend",
+        default=defaults["Neighbor_backend"],
+        choices=neighbors.BACKENDS,
+    )
+    parser.add_argument(
+        "--feature-weight",
+        type=float,
+        default=defaults["Feature_weight"],
+        help="Eigen-feature term of the graph edge weights (0 for plain distances)",
+    )
+    parser.add_argument("--feature-k", type=int, default=defaults["Feature_neighbors"])
+    parser.add_argument("--clustering", default=defaults["Community_detection"])
+    parser.add_argument(
+        "--gn-communities",
+        type=int,
+        default=defaults["Girvan_newman_communities"],
+        help="Girvan-Newman target community count (0 for the modularity peak)",
+    )
+    parser.add_argument(
+        "--gn-sources", type=int, default=defaults["Girvan_newman_sources"]
+    )
+    parser.add_argument("--seed", type=int, default=defaults["Random_seed"])
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Recompute files that already have save data (discards their labels)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Do not use the stage cache"
+    )
+    parser.add_argument(
+        "--profile",
+        help="Write the per-stage timings of all files to this file "
+        "(Chrome trace for .json, JSON lines for .jsonl)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    destination_folder = args.output or args.folder
+    os.makedirs(destination_folder, exist_ok=True)
+    params = {
+        "downsampling_method": args.downsampling,
+        "target_count": args.target_count,
+        "seed": args.seed,
+        "xyz_sidecar": settings.current_settings["XYZ_sidecar_cache"],
+        "point_cache": settings.current_settings["Point_cache"],
+        "superpoint_graph_method": args.graph,
+        "k_value": args.k,
+        "mst_candidates": args.mst_candidates,
+        "radius": args.radius,
+        "neighbor_backend": args.neighbor_backend,
+        "feature_weight": args.feature_weight,
+        "feature_k": args.feature_k,
+        "clustering_algorithm": args.clustering,
+        "gn_communities": args.gn_communities,
+        "gn_sources": args.gn_sources,
+    }
+    cache_dir = None
+    if settings.current_settings["Stage_cache"] and not args.no_cache:
+        cache_dir = settings.stage_cache_dir()
+    max_bytes = settings.current_settings["Cache_size_mb"] * 1024 * 1024
+
+    # Largest files first so they do not end up running alone at the end
+    manifest = FolderManifest(args.folder, processing.POINTCLOUD_EXTENSIONS)
+    manifest.refresh()
+    for file_name, entry in sorted(manifest.entries.items()):
+        if entry["error"] is not None:
+            print(f"Skipping {file_name}: unreadable ({entry['error']})")
+    file_names = manifest.files(sort_key="size", descending=True)
+    if not args.overwrite:
+        skipped = [
+            f for f in file_names if label_store.has_saved_labels(destination_folder, f)
+        ]
+        for file_name in skipped:
+            print(f"Skipping {file_name}: save data exists")
+        file_names = [f for f in file_names if f not in skipped]
+    if not file_names:
+        print("Nothing to do")
+        return 0
+
+    curr_time = time.time()
+    failures = {}
+    with ProcessPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        futures = {}
+        for file_name in file_names:
+            if args.overwrite:
+                # Old labels and their journal no longer match the new clusters
+                journal_file_path = label_journal.journal_path(
+                    label_store.label_file_path(destination_folder, file_name)
+                )
+                label_store.delete_saved_labels(destination_folder, file_name)
+                if os.path.exists(journal_file_path):
+                    os.remove(journal_file_path)
+            file_params = params
+            if args.adaptive_downsampling:
+                downsampling_method, target_count = suggest_downsampling(
+                    manifest.get(file_name), args.downsampling, args.target_count
+                )
+                file_params = {
+                    **params,
+                    "downsampling_method": downsampling_method,
+                    "target_count": target_count,
+                }
+            future = executor.submit(
+                process_file,
+                os.path.join(args.folder, file_name),
+                destination_folder,
+                file_params,
+                cache_dir,
+                max_bytes,
+            )
+            futures[future] = file_name
+
+        for done, future in enumerate(as_completed(futures), 1):
+            file_name = futures[future]
+            try:
+                num_points, num_clusters, seconds, records = future.result()
+            except Exception as e:
+                failures[file_name] = e
+                print(f"[{done}/{len(futures)}] {file_name} FAILED: {e}")
+                traceback.print_exception(type(e), e, e.__traceback__)
+                continue
+            profiler.extend(records)
+            print(
+                f"[{done}/{len(futures)}] {file_name}: {num_points} points, "
+                f"{num_clusters} clusters in {seconds:.2f} seconds"
+            )
+
+    print(
+        f"Processed {len(file_names) - len(failures)} of {len(file_names)} files "
+        f"in {time.time() - curr_time:.2f} seconds"
+    )
+    for file_name, error in failures.items():
+        print(f"Failed: {file_name}: {error}")
+    if args.profile:
+        profiler.export(args.profile)
+        print(f"Profile written to {args.profile}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+# benchmarks/downsampling_benchmark.py
+"""
+Benchmark of the downsampling methods in algorithms/downsampling.py.
+
+Every method runs over synthetic clouds (and optionally point cloud files) for
+several input sizes and target counts. For each run the table reports the best
+wall time over a number of repeats, the peak memory of one traced run and the
+sample quality:
+
+- covering radius: largest distance from a source point to its nearest sample
+  (the radius of the biggest hole the sample leaves);
+- Chamfer distance: mean source-to-sample plus mean sample-to-source distance.
+
+Each run happens in a fresh worker process so the peak resident memory of one
+method does not hide behind another's. Example:
+
+    python -m benchmarks.downsampling_benchmark --sizes 20000 200000 --targets 2048
+"""
+
+import argparse
+import csv
+import multiprocessing
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from scipy.spatial import cKDTree
+from algorithms import downsampling
+from pipeline import processing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Methods offered in the control panel plus the deprecated KDTree FPS
+METHODS = [
+    "random",
+    "vanilla_fps",
+    "fps_npdu",
+    "fps_npdu_kdtree",
+    "kdtree_fps",
+    "bucket_fps_kdline_small",
+    "bucket_fps_kdline_medium",
+    "bucket_fps_kdline_large",
+    "voxel_centroid",
+    "voxel_nearest",
+    "poisson_disk",
+]
+
+CLOUDS = ["uniform", "clusters", "terrain"]
+
+
+def synthetic_cloud(kind, num_points, seed=0):
+    """
+    Reproducible synthetic point cloud.
+
+    :param kind: "uniform" (unit cube), "clusters" (anisotropic Gaussian blobs
+        with very uneven density) or "terrain" (noisy ground surface with
+        vertical stems, similar to a forest scan).
+    :param num_points: Number of points.
+    :param seed: Seed of the random generator.
+    :return: Numpy array of shape (num_points, 3).
+    """
+    rng = np.random.default_rng(seed)
+    if kind == "uniform":
+        return rng.random((num_points, 3))
+    if kind == "clusters":
+        centers = rng.random((16, 3)) * 100
+        scales = rng.random((16, 3)) * 4 + 0.1
+        weights = rng.random(16) ** 3
+        members = rng.choice(16, num_points, p=weights / weights.sum())
+        return centers[members] + rng.normal(size=(num_points, 3)) * scales[members]
+    if kind == "terrain":
+        num_ground = num_points // 2
+        ground = rng.random((num_ground, 3)) * [50, 50, 0]
+        ground[:, 2] = np.sin(ground[:, 0] / 7) + np.cos(ground[:, 1] / 11)
+        ground[:, 2] += rng.normal(scale=0.05, size=num_ground)
+        stems = rng.random((40, 2)) * 50
+        members = rng.integers(0, 40, num_points - num_ground)
+        trees = np.column_stack(
+            (
+                stems[members] + rng.normal(scale=0.2, size=(len(members), 2)),
+                rng.random(len(members)) * 20,
+            )
+        )
+        return np.vstack((ground, trees))
+    raise ValueError(f"Unknown synthetic cloud: {kind}")
+
+
+def run_method(method, points, target_count, seed=0):
+    if method == "kdtree_fps":
+        return points[downsampling.kdtree_fps(points, target_count)]
+    return processing.downsample(points, method, target_count, seed=seed)[0]
+
+
+def _peak_rss():
+    # Peak resident set size of this process in bytes, None if unavailable
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(method, points, target_count, repeat, seed=0):
+    """
+    Time one method and record its memory use. Meant to run in a fresh process.
+
+    :return: Dict with the sample, the best wall time, the traced peak and the
+        growth of the peak resident memory (None where unavailable).
+    """
+    rss_before = _peak_rss()
+    tracemalloc.start()
+    sample = run_method(method, points, target_count, seed)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = _peak_rss()
+
+    times = []
+    for _ in range(repeat):
+        curr_time = time.perf_counter()
+        run_method(method, points, target_count, seed)
+        times.append(time.perf_counter() - curr_time)
+    return {
+        "sample": np.asarray(sample),
+        "seconds": min(times) if times else float("nan"),
+        "traced_peak": traced_peak,
+        "rss_peak": None if rss_before is None else rss_after - rss_before,
+    }
+
+
+def sample_quality(points, sample, eval_points=200000, seed=0):
+    """
+    Covering radius and Chamfer distance of a sample of a point cloud.
+
+    :param points: Source cloud.
+    :param sample: Downsampled cloud.
+    :param eval_points: Source points used for the estimate (all if fewer).
+    :return: (covering radius, Chamfer distance).
+    """
+    if len(points) > eval_points:
+        rng = np.random.default_rng(seed)
+        points = points[rng.choice(len(points), eval_points, replace=False)]
+    to_sample, _ = cKDTree(sample).query(points)
+    to_source, _ = cKDTree(points).query(sample)
+    return float(to_sample.max()), float(to_sample.mean() + to_source.mean())
+
+
+def benchmark(clouds, targets, methods, repeat=3, eval_points=200000, seed=0):
+    """
+    Run every method on every cloud and target count.
+
+    :param clouds: List of (name, points) pairs.
+    :param targets: Target counts.
+    :param methods: Method names (see METHODS).
+    :param repeat: Timed repeats per run.
+    :return: List of result rows (dicts).
+    """
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for cloud_name, points in clouds:
+        for target_count in targets:
+            if target_count >= len(points):
+                continue
+            for method in methods:
+                row = {
+                    "cloud": cloud_name,
+                    "points": len(points),
+                    "target": target_count,
+                    "method": method,
+                }
+                print(
+                    f"Running {method} on {cloud_name} ({len(points)} -> {target_count})"
+                )
+                try:
+                    with context.Pool(1, maxtasksperchild=1) as pool:
+                        result = pool.apply(
+                            measure, (method, points, target_count, repeat, seed)
+                        )
+                except Exception as e:
+                    row["error"] = f"{type(e).__name__}: {e}"
+                    rows.append(row)
+                    continue
+                radius, chamfer = sample_quality(
+                    points, result["sample"], eval_points, seed
+                )
+                row.update(
+                    samples=len(result["sample"]),
+                    seconds=result["seconds"],
+                    traced_mb=result["traced_peak"] / 2**20,
+                    rss_mb=(
+                        None
+                        if result["rss_peak"] is None
+                        else result["rss_peak"] / 2**20
+                    ),
+                    covering_radius=radius,
+                    chamfer=chamfer,
+                )
+                rows.append(row)
+    return rows
+
+
+COLUMNS = [
+    ("cloud", "{}"),
+    ("points", "{}"),
+    ("target", "{}"),
+    ("method", "{}"),
+    ("samples", "{}"),
+    ("seconds", "{:.4f}"),
+    ("traced_mb", "{:.1f}"),
+    ("rss_mb", "{:.1f}"),
+    ("covering_radius", "{:.4g}"),
+    ("chamfer", "{:.4g}"),
+    ("error", "{}"),
+]
+
+
+def format_table(rows):
+    cells = [[name for name, _ in COLUMNS]]
+    for row in rows:
+        cells.append(
+            [
+                "" if row.get(name) is None else fmt.format(row[name])
+                for name, fmt in COLUMNS
+            ]
+        )
+    widths = [max(len(line[i]) for line in cells) for i in range(len(COLUMNS))]
+    lines = [
+        "  ".join(cell.ljust(w) for cell, w in zip(line, widths)) for line in cells
+    ]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "files", nargs="*", help="Point cloud files (.las/.txt) to include"
+    )
+    parser.add_argument("--clouds", nargs="*", default=CLOUDS, choices=CLOUDS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000])
+    parser.add_argument("--targets", nargs="+", type=int, default=[1024, 4096])
+    parser.add_argument("--methods", nargs="+", default=METHODS, choices=METHODS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--eval-points", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="Also write the results to this CSV file")
+    args = parser.parse_args(argv)
+
+    clouds = [
+        (kind, synthetic_cloud(kind, size, args.seed))
+        for kind in args.clouds
+        for size in args.sizes
+    ]
+    for file_path in args.files:
+        clouds.append((file_path, processing.load_points(file_path)[0]))
+
+    rows = benchmark(
+        clouds, args.targets, args.methods, args.repeat, args.eval_points, args.seed
+    )
+    print(
+        f"\nPython {platform.python_version()}, NumPy {np.__version__}, "
+        f"{platform.platform()}, seed {args.seed}, best of {args.repeat}"
+    )
+    print(format_table(rows))
+    if args.csv:
+        with open(args.csv, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=[name for name, _ in COLUMNS])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
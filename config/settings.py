@@ -17,6 +17,25 @@ current_settings = {
     "Subsampling": "bucket_fps_kdline_medium",
     "Subsample_size": 2048,
     "Community_detection": "label_propagation",
+    "MST_candidates": "knn",
+    "XYZ_sidecar_cache": True,
+    "Point_cache": True,  # Memory-mapped coordinate cache next to LAS files
+    "Random_seed": 0,
+    "Stage_cache": True,
+    "Cache_dir": "",  # Empty for the default location in the home folder
+    "Cache_size_mb": 2048,
+    "Prefetch_depth": 2,  # Number of upcoming files precomputed in the background
+    "LOD_point_budget": 300000,  # Points drawn in the full view, 0 to draw all
+    "Radius_graph": 0.0,  # Radius of the radius graph, 0 to derive it from K
+    "Neighbor_backend": "kdtree",  # kdtree, ball_tree or brute
+    "Feature_weight": 0.0,  # Eigen-feature term of the graph edge weights, 0 for off
+    "Feature_neighbors": 16,
+    "Girvan_newman_communities": 0,  # Target community count, 0 for best modularity
+    "Girvan_newman_sources": 64,  # Sampled betweenness sources per component
+    "Profile_memory": False,  # Trace Python allocations in profiling spans
+    "File_sort": "name",  # Order of the file navigator: name, points, size, modified
+    "File_max_points_m": 0.0,  # Hide files with more million points, 0 for none
+    "Adaptive_downsampling": False,  # Adapt downsampling to each file's point count
 }
 
 
@@ -24,12 +43,20 @@ def load_settings():
     if os.path.exists(settings_file):
         try:
             with open(settings_file, "r") as file:
-                return json.load(file)
+                # Fill in defaults for keys added since the file was written
+                return {**current_settings, **json.load(file)}
         except json.JSONDecodeError:
             pass
     return current_settings
 
 
+def stage_cache_dir():
+    # Folder holding the persistent pipeline stage cache
+    return current_settings["Cache_dir"] or os.path.join(
+        os.path.expanduser("~"), ".needlr", "cache"
+    )
+
+
 def save_settings(settings):
     with open(settings_file, "w") as file:
         json.dump(settings, file, indent=4)
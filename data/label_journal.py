@@ -0,0 +1,96 @@
+# data/label_journal.py
+import json
+import os
+import time
+
+JOURNAL_EXTENSION = ".journal"
+
+
+def journal_path(partition_path):
+    """Path of the label journal that belongs to a partition file."""
+    return partition_path + JOURNAL_EXTENSION
+
+
+class LabelJournal:
+    """
+    Append-only log of label events for one partition file.
+
+    Every event is written as one JSON line and synced to disk before append
+    returns, so a crash loses at most the event being written. The file handle
+    stays open between events, making each append a small write plus fsync
+    instead of a rewrite of the whole partition.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def append(self, cluster, label):
+        if self._file is None:
+            self._file = open(self.path, "a")
+            if _ends_with_partial_line(self.path):
+                # Keep a torn entry from a crash from swallowing this event
+                self._file.write("\n")
+        event = {"cluster": int(cluster), "label": int(label), "time": time.time()}
+        self._file.write(json.dumps(event) + "\n")
+        self._file.flush()
+        # fdatasync skips the metadata flush where the platform supports it
+        getattr(os, "fdatasync", os.fsync)(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Close the journal and delete it from disk (after compaction)."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _ends_with_partial_line(path):
+    if os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) != b"\n"
+
+
+def read_journal(path):
+    """
+    Read the label events of a journal in the order they were written.
+
+    A torn final line left by a crash mid-write is ignored.
+
+    :param path: Path to the journal file.
+    :return: List of event dicts with ``cluster``, ``label`` and ``time`` keys.
+    """
+    events = []
+    if not os.path.exists(path):
+        return events
+    with open(path, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                print("Skipping incomplete label journal entry")
+    return events
+
+
+def replay_journal(path, labels):
+    """
+    Apply the events of a journal to a cluster label array in place.
+
+    :param path: Path to the journal file.
+    :param labels: Mutable sequence with the label of every cluster.
+    :return: Number of events applied.
+    """
+    applied = 0
+    for event in read_journal(path):
+        if 0 <= event["cluster"] < len(labels):
+            labels[event["cluster"]] = event["label"]
+            applied += 1
+    return applied
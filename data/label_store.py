@@ -0,0 +1,193 @@
+# data/label_store.py
+import hashlib
+import json
+import os
+import numpy as np
+
+# Version of the binary partition format written by save_partition
+FORMAT_VERSION = 1
+PARTITION_EXTENSION = ".npz"
+LEGACY_EXTENSION = ".json"
+
+# Bytes hashed from each end of a source file by file_fingerprint
+FINGERPRINT_BLOCK_SIZE = 1 << 20
+
+
+def label_file_path(destination_folder, source_file):
+    """Path of the binary partition file for a point cloud file."""
+    return os.path.join(
+        destination_folder, os.path.basename(source_file) + PARTITION_EXTENSION
+    )
+
+
+def legacy_label_file_path(destination_folder, source_file):
+    """Path of the per-point JSON label file written by earlier versions."""
+    return os.path.join(
+        destination_folder, os.path.basename(source_file) + LEGACY_EXTENSION
+    )
+
+
+def has_saved_labels(destination_folder, source_file):
+    """Whether a partition (binary or legacy JSON) exists for a point cloud file."""
+    return os.path.exists(
+        label_file_path(destination_folder, source_file)
+    ) or os.path.exists(legacy_label_file_path(destination_folder, source_file))
+
+
+def delete_saved_labels(destination_folder, source_file):
+    """Delete the binary and legacy JSON partition files of a point cloud file."""
+    for path in (
+        label_file_path(destination_folder, source_file),
+        legacy_label_file_path(destination_folder, source_file),
+    ):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def file_fingerprint(file_path):
+    """
+    Fast content fingerprint of a (possibly very large) file.
+
+    Hashes the file size together with its first and last megabyte, which is
+    enough to tell scans apart without reading gigabytes of point data.
+
+    :param file_path: Path to the file.
+    :return: Hex digest string.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(file_path, "rb") as file:
+        digest.update(file.read(FINGERPRINT_BLOCK_SIZE))
+        if size > FINGERPRINT_BLOCK_SIZE:
+            file.seek(max(size - FINGERPRINT_BLOCK_SIZE, FINGERPRINT_BLOCK_SIZE))
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def save_partition(path, points, cluster_ids, labels, header=None, sample_indices=None):
+    """
+    Write a labeled partition to a single binary .npz file.
+
+    Coordinates are stored as float32 relative to a float64 offset (the minimum
+    corner of the cloud) so georeferenced scans keep their precision.
+
+    :param path: Destination .npz path.
+    :param points: Numpy array of point coordinates (shape: [n_points, 3]).
+    :param cluster_ids: Cluster id of every point (shape: [n_points]).
+    :param labels: Label of every cluster, -1 for unlabeled (shape: [n_clusters]).
+    :param header: Dict of metadata (source fingerprint, pipeline parameters).
+    :param sample_indices: Index of every point in the source file, if known.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    offset = points.min(axis=0) if len(points) else np.zeros(3)
+    header = dict(header or {}, format_version=FORMAT_VERSION)
+    optional = {}
+    if sample_indices is not None:
+        optional["sample_indices"] = np.asarray(sample_indices, dtype=np.int64)
+
+    # Write to a temporary file first so a partial partition is never read
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        np.savez(
+            file,
+            points=(points - offset).astype(np.float32),
+            offset=offset,
+            cluster_ids=np.asarray(cluster_ids, dtype=np.int32),
+            labels=np.asarray(labels, dtype=np.int32),
+            header=np.array(json.dumps(header)),
+            **optional,
+        )
+    os.replace(temp_path, path)
+
+
+def load_partition(path):
+    """
+    Read a partition written by save_partition.
+
+    :param path: Path to the .npz file.
+    :return: Dict with float64 ``points``, int32 ``cluster_ids``, int32
+        ``labels``, the ``header`` dict and int64 ``sample_indices`` (None for
+        partitions saved without them).
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return {
+            "points": data["points"].astype(np.float64) + data["offset"],
+            "cluster_ids": data["cluster_ids"],
+            "labels": data["labels"],
+            "header": json.loads(str(data["header"])),
+            "sample_indices": (
+                data["sample_indices"] if "sample_indices" in data.files else None
+            ),
+        }
+
+
+def load_labels(path):
+    """Read only the cluster label array of a partition file."""
+    with np.load(path, allow_pickle=False) as data:
+        return data["labels"]
+
+
+def save_labels(path, labels):
+    """
+    Replace the cluster labels of an existing partition file.
+
+    :param path: Path to the .npz file.
+    :param labels: Label of every cluster, -1 for unlabeled.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    arrays["labels"] = np.asarray(labels, dtype=np.int32)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(temp_path, path)
+
+
+def ids_from_clusters(clusters, num_points):
+    """
+    Cluster id of every point from the point index lists of the clusters.
+
+    :param clusters: Sequence of point index lists, one per cluster.
+    :param num_points: Total number of points.
+    :return: int32 array with the cluster id of every point.
+    """
+    cluster_ids = np.full(num_points, -1, dtype=np.int32)
+    lengths = [len(cluster) for cluster in clusters]
+    if sum(lengths):
+        cluster_ids[np.concatenate(clusters).astype(np.int64)] = np.repeat(
+            np.arange(len(clusters), dtype=np.int32), lengths
+        )
+    return cluster_ids
+
+
+def migrate_legacy_partition(json_path, path):
+    """
+    Convert a per-point JSON label file to the binary partition format.
+
+    The JSON file is renamed to ``<name>.json.bak`` afterwards so the migration
+    only happens once. A file without clusters is only renamed, so the point
+    cloud is processed again as if it had no save data.
+
+    :param json_path: Path to the legacy .json file.
+    :param path: Destination .npz path.
+    """
+    print("Migrating JSON save data to binary format: ", json_path)
+    with open(json_path, "r") as file:
+        save_data = json.load(file)
+    if not save_data:
+        print("Legacy save data holds no clusters, ignoring it: ", json_path)
+        os.replace(json_path, json_path + ".bak")
+        return
+
+    lengths = [len(data["points"]) for data in save_data]
+    points = np.concatenate(
+        [np.array(data["points"], dtype=float).reshape(-1, 3) for data in save_data]
+    )
+    cluster_ids = np.repeat(np.arange(len(save_data), dtype=np.int32), lengths)
+    labels = [int(data["label"]) for data in save_data]
+
+    save_partition(
+        path, points, cluster_ids, labels, header={"migrated_from": json_path}
+    )
+    os.replace(json_path, json_path + ".bak")
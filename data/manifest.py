@@ -0,0 +1,272 @@
+# data/manifest.py
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from data import readers
+
+# Version of the manifest file format
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = ".needlr_manifest.json"
+# Bytes of a text file read to estimate its line count
+TXT_SAMPLE_BYTES = 1 << 20
+
+# Orders offered by FolderManifest.files: key of an entry, None sorting last
+SORT_KEYS = {
+    "name": lambda entry: entry["name"].lower(),
+    "points": lambda entry: entry["point_count"],
+    "size": lambda entry: entry["size"],
+    "modified": lambda entry: entry["mtime_ns"],
+}
+
+# Largest number of points QuickFPS runs on with each tree height; larger
+# inputs use the large variant
+QUICKFPS_VARIANTS = [
+    (100_000, "bucket_fps_kdline_small"),
+    (1_000_000, "bucket_fps_kdline_medium"),
+]
+
+
+def read_las_header(file_path):
+    """
+    Summary of a LAS file from its header alone, without decoding points.
+
+    :param file_path: Path to the .las or .laz file.
+    :return: Dict with point_count, mins, maxs, scales, offsets, point_format
+        and version.
+    """
+    with readers.open_las(file_path) as reader:
+        header = reader.header
+        return {
+            "point_count": int(header.point_count),
+            "estimated": False,
+            "mins": [float(value) for value in header.mins],
+            "maxs": [float(value) for value in header.maxs],
+            "scales": [float(value) for value in header.scales],
+            "offsets": [float(value) for value in header.offsets],
+            "point_format": int(header.point_format.id),
+            "version": str(header.version),
+        }
+
+
+def estimate_txt_points(file_path, sample_bytes=TXT_SAMPLE_BYTES):
+    """
+    Number of points of an XYZ text file, counted or estimated.
+
+    A valid .npy sidecar gives the exact count. Otherwise files up to
+    sample_bytes are counted, and larger files are estimated from the mean
+    line length of their first sample_bytes.
+
+    :param file_path: Path to the .txt file.
+    :param sample_bytes: Bytes read from the start of the file.
+    :return: Dict with point_count and whether it is estimated.
+    """
+    sidecar = readers.xyz_sidecar_path(file_path)
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(
+        file_path
+    ):
+        try:
+            shape = np.load(sidecar, mmap_mode="r").shape
+            return {"point_count": int(shape[0]), "estimated": False}
+        except (OSError, ValueError):
+            pass
+
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as file:
+        sample = file.read(sample_bytes)
+    if len(sample) >= size:
+        lines = sum(1 for line in sample.split(b"\n") if line.strip())
+        return {"point_count": lines, "estimated": False}
+    # The last sampled line is usually cut off
+    complete = sample[: sample.rfind(b"\n") + 1]
+    lines = sum(1 for line in complete.split(b"\n") if line.strip())
+    line_bytes = len(complete) / lines if lines else size
+    return {"point_count": int(size / line_bytes), "estimated": True}
+
+
+def read_entry(file_path):
+    """
+    Manifest entry of one point cloud file.
+
+    Files that cannot be read get an entry with an error message and no point
+    count instead of raising.
+
+    :param file_path: Path to a .las, .laz or .txt file.
+    :return: Dict with name, size, mtime_ns, point_count, estimated, error and,
+        for LAS files, the header fields of read_las_header.
+    """
+    stat = os.stat(file_path)
+    entry = {
+        "name": os.path.basename(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "point_count": None,
+        "estimated": False,
+        "error": None,
+    }
+    try:
+        if readers.is_las(file_path):
+            entry.update(read_las_header(file_path))
+        else:
+            entry.update(estimate_txt_points(file_path))
+    except Exception as e:  # laspy raises its own errors for broken headers
+        entry["error"] = str(e) or type(e).__name__
+    return entry
+
+
+def suggest_downsampling(entry, downsampling_method, target_count):
+    """
+    Downsampling parameters for one file, chosen from its manifest entry.
+
+    Files with no more than target_count points are not downsampled, and the
+    QuickFPS variants get the tree height that suits the number of points
+    they will actually sample from (large files are pre-reduced while
+    loading, see readers.load_las_points).
+
+    :param entry: Manifest entry of the file (see read_entry).
+    :param downsampling_method: Downsampling method selected by the user.
+    :param target_count: Number of points selected by the user.
+    :return: Downsampling method and target count to use for this file.
+    """
+    point_count = entry.get("point_count")
+    if point_count is None or not downsampling_method or not target_count:
+        return downsampling_method, target_count
+    if point_count <= target_count and not entry.get("estimated"):
+        return None, target_count
+    if downsampling_method.startswith("bucket_fps_kdline"):
+        sampled = min(point_count, readers.prereduction_budget(target_count))
+        for limit, variant in QUICKFPS_VARIANTS:
+            if sampled <= limit:
+                return variant, target_count
+        return "bucket_fps_kdline_large", target_count
+    return downsampling_method, target_count
+
+
+class FolderManifest:
+    """
+    Summary of every point cloud file of a folder, read without decoding
+    point data: point count (from LAS headers, or estimated for text files),
+    bounds, scales and offsets, point format, and the error of unreadable
+    files.
+
+    The manifest is kept in a JSON file in the folder. refresh only re-reads
+    files whose size or modification time changed, on a thread pool.
+    """
+
+    def __init__(self, folder, extensions, workers=8):
+        """
+        :param folder: Folder with point cloud files.
+        :param extensions: Tuple of file extensions to include.
+        :param workers: Number of files read in parallel.
+        """
+        self.folder = folder
+        self.extensions = tuple(extensions)
+        self.workers = workers
+        self.entries = {}  # file name -> entry
+        self._loaded = False
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, MANIFEST_FILENAME)
+
+    def load(self):
+        """Read the cached manifest file, if any."""
+        self._loaded = True
+        try:
+            with open(self.path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self.entries = data.get("entries", {})
+
+    def save(self):
+        # Write to a temporary file first so a partial manifest is never read
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Could not write folder manifest: {e}")
+
+    def refresh(self):
+        """
+        Bring the manifest up to date with the folder.
+
+        :return: Number of files that were (re-)read.
+        """
+        if not self._loaded:
+            self.load()
+        stale = []
+        names = set()
+        for name in os.listdir(self.folder):
+            if not name.endswith(self.extensions):
+                continue
+            names.add(name)
+            stat = os.stat(os.path.join(self.folder, name))
+            entry = self.entries.get(name)
+            if (
+                entry is None
+                or entry["size"] != stat.st_size
+                or entry["mtime_ns"] != stat.st_mtime_ns
+            ):
+                stale.append(name)
+        removed = [name for name in self.entries if name not in names]
+        for name in removed:
+            del self.entries[name]
+
+        if stale:
+            paths = [os.path.join(self.folder, name) for name in stale]
+            with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+                for name, entry in zip(stale, executor.map(read_entry, paths)):
+                    self.entries[name] = entry
+        if stale or removed:
+            self.save()
+        return len(stale)
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def files(self, sort_key="name", descending=False, max_points=None, readable=True):
+        """
+        File names of the folder, filtered and sorted by their entries.
+
+        :param sort_key: One of SORT_KEYS.
+        :param descending: Sort in descending order.
+        :param max_points: Leave out files with more points, None for no limit.
+        :param readable: Leave out files whose header could not be read.
+        :return: List of file names.
+        """
+        entries = list(self.entries.values())
+        if readable:
+            entries = [entry for entry in entries if entry["error"] is None]
+        if max_points:
+            entries = [
+                entry
+                for entry in entries
+                if entry["point_count"] is None or entry["point_count"] <= max_points
+            ]
+        key = SORT_KEYS[sort_key]
+        known = [entry for entry in entries if key(entry) is not None]
+        unknown = [entry for entry in entries if key(entry) is None]
+        known.sort(key=key, reverse=descending)
+        unknown.sort(key=SORT_KEYS["name"])
+        return [entry["name"] for entry in known + unknown]
+
+    def describe(self, name):
+        """One line summary of a file, e.g. for a tooltip."""
+        entry = self.entries.get(name)
+        if entry is None:
+            return name
+        if entry["error"] is not None:
+            return f"{name}: unreadable ({entry['error']})"
+        text = f"{name}: {entry['size'] / (1024 * 1024):.1f} MB"
+        if entry["point_count"] is not None:
+            approx = "~" if entry["estimated"] else ""
+            text += f", {approx}{entry['point_count']:,} points"
+        if "mins" in entry:
+            extent = np.subtract(entry["maxs"], entry["mins"])
+            text += ", extent " + " x ".join(f"{value:.1f}" for value in extent)
+            text += f", point format {entry['point_format']}"
+        return text
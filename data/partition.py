@@ -0,0 +1,90 @@
+# data/partition.py
+import numpy as np
+from data import label_store
+
+
+class Partition:
+    """
+    Clusters of a point set and their labels, stored CSR style.
+
+    - ``ids``: int32 cluster id of every point (-1 for points in no cluster).
+    - ``order``: point indices sorted by cluster, so the members of cluster i
+      are ``order[offsets[i]:offsets[i + 1]]``.
+    - ``offsets``: int64 array of length num_clusters + 1.
+    - ``labels``: int32 label of every cluster (-1 for unlabeled).
+    """
+
+    def __init__(self, cluster_ids, num_clusters=None, labels=None):
+        """
+        :param cluster_ids: Cluster id of every point, -1 for none.
+        :param num_clusters: Number of clusters (defaults to max id + 1).
+        :param labels: Label of every cluster (defaults to all unlabeled).
+        """
+        self.ids = np.asarray(cluster_ids, dtype=np.int32)
+        if num_clusters is None:
+            num_clusters = int(self.ids.max()) + 1 if len(self.ids) else 0
+        counts = np.bincount(self.ids[self.ids >= 0], minlength=num_clusters)
+        self.offsets = np.zeros(num_clusters + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        # Points without a cluster sort first and are skipped
+        unassigned = len(self.ids) - int(self.offsets[-1])
+        self.order = np.argsort(self.ids, kind="stable")[unassigned:]
+
+        if labels is None:
+            labels = np.full(num_clusters, -1)
+        self.labels = np.array(labels, dtype=np.int32)
+        self.num_labeled = int(np.count_nonzero(self.labels >= 0))
+
+    @classmethod
+    def from_clusters(cls, clusters, num_points, labels=None):
+        """
+        Build a partition from a sequence of point index lists.
+
+        :param clusters: Sequence of point index lists, one per cluster.
+        :param num_points: Total number of points.
+        :param labels: Label of every cluster (defaults to all unlabeled).
+        """
+        cluster_ids = label_store.ids_from_clusters(clusters, num_points)
+        return cls(cluster_ids, len(clusters), labels)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def sizes(self):
+        return np.diff(self.offsets)
+
+    def members(self, cluster):
+        """Point indices of a cluster (a view into order)."""
+        return self.order[self.offsets[cluster] : self.offsets[cluster + 1]]
+
+    def members_of(self, clusters):
+        """
+        Point indices of several clusters, concatenated in the given order.
+
+        :return: (point indices, cluster of every returned point).
+        """
+        clusters = np.asarray(clusters, dtype=np.int64)
+        starts = self.offsets[clusters]
+        counts = self.offsets[clusters + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        positions += np.arange(counts.sum())
+        return self.order[positions], np.repeat(clusters, counts)
+
+    def cluster_points(self, points, cluster):
+        """
+        Coordinates of the points of a cluster.
+
+        :param points: Numpy array of shape (n_points, 3) the partition is of.
+        :param cluster: Cluster index.
+        """
+        return points[self.members(cluster)]
+
+    def point_labels(self):
+        """Label of every point, -1 for unlabeled points and points in no cluster."""
+        return np.append(self.labels, -1).astype(np.int32)[self.ids]
+
+    def set_label(self, cluster, label):
+        """Change the label of one cluster."""
+        self.num_labeled += int(label >= 0) - int(self.labels[cluster] >= 0)
+        self.labels[cluster] = label
@@ -0,0 +1,476 @@
+# data/readers.py
+import itertools
+import json
+import os
+import warnings
+import laspy
+import numpy as np
+from algorithms import downsampling
+from data import label_store
+
+# Uncompressed and LAZ-compressed LAS files
+LAS_EXTENSIONS = (".las", ".laz")
+# Number of points decoded per chunk when streaming LAS files
+LAS_CHUNK_SIZE = 1_000_000
+# Number of lines parsed per chunk when reading XYZ text files
+XYZ_CHUNK_SIZE = 1_000_000
+# Version of the LAS point cache written by build_las_cache
+POINT_CACHE_VERSION = 1
+
+
+def is_las(file_path):
+    """Whether a file is read as LAS (.las, or LAZ-compressed .laz)."""
+    return file_path.endswith(LAS_EXTENSIONS)
+
+
+def open_las(file_path):
+    """
+    Open a LAS or LAZ file for reading with laspy.
+
+    LAZ files are decompressed with lazrs' parallel backend when it is
+    installed, which decompresses the LAZ chunks of every read on all cores,
+    and only the coordinates are decompressed.
+
+    :param file_path: Path to the .las or .laz file.
+    :return: laspy.LasReader.
+    """
+    if not file_path.endswith(".laz"):
+        return laspy.open(file_path)
+    laz_backend = None
+    if laspy.LazBackend.LazrsParallel in laspy.LazBackend.detect_available():
+        laz_backend = laspy.LazBackend.LazrsParallel
+    return laspy.open(
+        file_path,
+        laz_backend=laz_backend,
+        decompression_selection=laspy.DecompressionSelection.XY_RETURNS_CHANNEL
+        | laspy.DecompressionSelection.Z,
+    )
+
+
+def iter_las_chunks(file_path, chunk_size=LAS_CHUNK_SIZE):
+    """
+    Stream the XYZ coordinates of a LAS or LAZ file in fixed-size chunks.
+
+    LAZ files are decompressed chunk by chunk, so callers can reduce the
+    points while the file is being decompressed.
+
+    :param file_path: Path to the .las or .laz file.
+    :param chunk_size: Number of points decoded per chunk.
+    :return: Generator of numpy arrays of shape (<= chunk_size, 3).
+    """
+    with open_las(file_path) as reader:
+        for chunk in reader.chunk_iterator(chunk_size):
+            yield np.column_stack((chunk.x, chunk.y, chunk.z))
+
+
+def las_cache_paths(file_path):
+    """Paths of the binary point cache of a LAS file and of its metadata."""
+    return file_path + ".npy", file_path + ".npy.json"
+
+
+def _temp_path(path):
+    # Unique temporary name so concurrent writers (the GUI pipeline and the
+    # prefetch processes) never share a file
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def _remove_quietly(path):
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def _write_json(path, data):
+    # Write to a temporary file first so a partial file is never read
+    temp_path = _temp_path(path)
+    try:
+        with open(temp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(temp_path, path)
+    finally:
+        _remove_quietly(temp_path)
+
+
+def open_las_cache(file_path):
+    """
+    Memory-map the point cache of a LAS file if it still matches the file.
+
+    The cache is valid while the file keeps the size and modification time it
+    had when the cache was written. A file with a new modification time but the
+    same size (e.g. copied or touched) keeps its cache if its fingerprint is
+    unchanged.
+
+    :param file_path: Path to the .las file.
+    :return: Read-only int32 memory map of shape (n_points, 3) and the cache
+        metadata, or None when there is no valid cache.
+    """
+    cache_path, meta_path = las_cache_paths(file_path)
+    try:
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+        stat = os.stat(file_path)
+        if (
+            meta.get("version") != POINT_CACHE_VERSION
+            or meta["source_size"] != stat.st_size
+        ):
+            return None
+        if meta["source_mtime_ns"] != stat.st_mtime_ns:
+            if meta["source_hash"] != label_store.file_fingerprint(file_path):
+                return None
+            meta["source_mtime_ns"] = stat.st_mtime_ns
+            _write_json(meta_path, meta)
+        raw = np.load(cache_path, mmap_mode="r")
+    except (OSError, ValueError, KeyError):
+        return None
+    if raw.dtype != np.int32 or raw.shape != (meta["point_count"], 3):
+        return None
+    return raw, meta
+
+
+def build_las_cache(file_path, chunk_size=LAS_CHUNK_SIZE):
+    """
+    Write the point cache of a LAS file next to it.
+
+    The cache holds the raw int32 coordinates of the file as a .npy file, which
+    is lossless and half the size of float64 coordinates; the scales and
+    offsets that turn them into coordinates are kept in the metadata.
+
+    :param file_path: Path to the .las file.
+    :param chunk_size: Number of points decoded per chunk.
+    :return: As open_las_cache, or None when the cache could not be written.
+    """
+    cache_path, meta_path = las_cache_paths(file_path)
+    temp_path = _temp_path(cache_path)
+    raw = None
+    try:
+        stat = os.stat(file_path)
+        with open_las(file_path) as reader:
+            header = reader.header
+            raw = np.lib.format.open_memmap(
+                temp_path, mode="w+", dtype=np.int32, shape=(header.point_count, 3)
+            )
+            start = 0
+            for chunk in reader.chunk_iterator(chunk_size):
+                stop = start + len(chunk)
+                raw[start:stop, 0] = chunk.X
+                raw[start:stop, 1] = chunk.Y
+                raw[start:stop, 2] = chunk.Z
+                start = stop
+            meta = {
+                "version": POINT_CACHE_VERSION,
+                "source_size": stat.st_size,
+                "source_mtime_ns": stat.st_mtime_ns,
+                "source_hash": label_store.file_fingerprint(file_path),
+                "point_count": int(header.point_count),
+                "scales": [float(value) for value in header.scales],
+                "offsets": [float(value) for value in header.offsets],
+                "mins": [float(value) for value in header.mins],
+                "maxs": [float(value) for value in header.maxs],
+            }
+        raw.flush()
+        raw = None  # Unmap before renaming, which Windows requires
+        os.replace(temp_path, cache_path)
+        _write_json(meta_path, meta)
+    except OSError as e:
+        print(f"Could not write LAS point cache: {e}")
+        # Another process may have written the cache in the meantime
+        return open_las_cache(file_path)
+    finally:
+        raw = None
+        _remove_quietly(temp_path)
+    return np.load(cache_path, mmap_mode="r"), meta
+
+
+def las_point_cache(file_path, chunk_size=LAS_CHUNK_SIZE):
+    """Open the point cache of a LAS file, writing it first if needed."""
+    cache = open_las_cache(file_path)
+    if cache is None:
+        print(f"Writing point cache of {os.path.basename(file_path)}...")
+        cache = build_las_cache(file_path, chunk_size)
+    return cache
+
+
+def iter_cached_chunks(raw, meta, chunk_size=LAS_CHUNK_SIZE):
+    """
+    Stream the coordinates of a LAS point cache in fixed-size chunks.
+
+    :param raw: Memory map returned by open_las_cache.
+    :param meta: Cache metadata returned by open_las_cache.
+    :param chunk_size: Number of points per chunk.
+    :return: Generator of float64 numpy arrays of shape (<= chunk_size, 3),
+        equal to the coordinates laspy decodes.
+    """
+    scales = np.asarray(meta["scales"])
+    offsets = np.asarray(meta["offsets"])
+    for start in range(0, len(raw), chunk_size):
+        yield raw[start : start + chunk_size] * scales + offsets
+
+
+def read_cached_points(raw, meta, chunk_size=LAS_CHUNK_SIZE):
+    """
+    Coordinates of every point of a LAS point cache, converted chunk by chunk
+    into a single preallocated float64 array.
+
+    :param raw: Memory map returned by open_las_cache.
+    :param meta: Cache metadata returned by open_las_cache.
+    :param chunk_size: Number of points converted at a time.
+    :return: Numpy array of shape (n_points, 3).
+    """
+    scales = np.asarray(meta["scales"])
+    offsets = np.asarray(meta["offsets"])
+    points = np.empty(raw.shape)
+    for start in range(0, len(raw), chunk_size):
+        block = points[start : start + chunk_size]
+        np.multiply(raw[start : start + chunk_size], scales, out=block)
+        block += offsets
+    return points
+
+
+def _gather_chunks(chunks, point_count):
+    # Copy a stream of chunks into one array instead of concatenating a list
+    points = np.empty((point_count, 3))
+    start = 0
+    for chunk in chunks:
+        points[start : start + len(chunk)] = chunk
+        start += len(chunk)
+    return points[:start]
+
+
+def prereduction_budget(target_count):
+    """Number of points kept ahead of FPS when a file is too large to hold."""
+    return max(10 * target_count, 1_000_000)
+
+
+def load_las_points(
+    file_path,
+    downsampling_method=None,
+    target_count=None,
+    seed=None,
+    chunk_size=LAS_CHUNK_SIZE,
+    use_cache=True,
+):
+    """
+    Load a LAS or LAZ file with peak memory independent of the file size.
+
+    Random downsampling is applied on the fly with a reservoir sample of
+    target_count points. For the FPS methods, files larger than the
+    pre-reduction budget are first reduced to one point per voxel while
+    streaming; the selected downsampling method then runs on the result. LAZ
+    files are reduced the same way while they are being decompressed.
+
+    With use_cache, the points of .las files are read from the memory-mapped
+    point cache of the file (see build_las_cache), which is written on the
+    first load. This skips decoding the file, and random downsampling reads
+    only the sampled points from the cache instead of streaming every point
+    (the sample differs from the uncached reservoir sample of the same seed).
+    The FPS methods still stream every point once. LAZ files are not cached,
+    as the cache would take several times the disk space of the compressed
+    file.
+
+    :param file_path: Path to the .las or .laz file.
+    :param downsampling_method: Downsampling method that will be applied next.
+    :param target_count: Number of points the downsampling will produce.
+    :param seed: Seed for the random reservoir sample.
+    :param chunk_size: Number of points decoded per chunk.
+    :param use_cache: Read from and write to the point cache of the file.
+    :return: Numpy array of shape (n_points, 3) and the indices of these points
+        in the file (None when every point was read).
+    """
+    cache = None
+    if use_cache and file_path.endswith(".las"):
+        cache = las_point_cache(file_path, chunk_size)
+    downsample = downsampling_method and target_count
+    if cache is not None:
+        raw, meta = cache
+        point_count = meta["point_count"]
+        if not downsample or point_count <= target_count:
+            return read_cached_points(raw, meta, chunk_size), None
+        if downsampling_method == "random":
+            # The memory map is random access, so only the sampled points are
+            # read and converted; sorted indices keep the reads sequential
+            rng = np.random.default_rng(seed)
+            indices = np.sort(rng.choice(point_count, target_count, replace=False))
+            scales, offsets = np.asarray(meta["scales"]), np.asarray(meta["offsets"])
+            points = raw[indices] * scales + offsets
+            return points, indices
+        mins, maxs = np.asarray(meta["mins"]), np.asarray(meta["maxs"])
+        chunks = iter_cached_chunks(raw, meta, chunk_size)
+    else:
+        with open_las(file_path) as reader:
+            header = reader.header
+            point_count = header.point_count
+            mins, maxs = np.asarray(header.mins), np.asarray(header.maxs)
+        chunks = iter_las_chunks(file_path, chunk_size)
+
+    if not downsample or point_count <= target_count:
+        return _gather_chunks(chunks, point_count), None
+
+    if downsampling_method == "random":
+        return downsampling.reservoir_downsample(chunks, target_count, seed=seed)
+
+    budget = prereduction_budget(target_count)
+    if point_count <= budget:
+        return _gather_chunks(chunks, point_count), None
+
+    # Start from the finest grid the voxel keys can address; voxel_prereduce
+    # doubles the voxel size whenever the budget is exceeded
+    voxel_size = max(float(np.max(maxs - mins)), 1.0) / (1 << 20)
+    print(f"Streaming {point_count} points through voxel pre-reduction...")
+    return downsampling.voxel_prereduce(chunks, budget, voxel_size)
+
+
+def _parse_xyz_lines(lines):
+    # Slow path for chunks with malformed lines: keeps the lines whose first
+    # three fields are numbers. Returns the points and the number of skipped
+    # lines, blank lines not counted.
+    rows = []
+    skipped = 0
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            if len(fields) < 3:
+                raise ValueError
+            rows.append([float(value) for value in fields[:3]])
+        except ValueError:
+            skipped += 1
+    return np.array(rows, dtype=np.float64).reshape(-1, 3), skipped
+
+
+def iter_xyz_chunks(file_path, chunk_size=XYZ_CHUNK_SIZE):
+    """
+    Parse the first three columns of a whitespace separated XYZ text file.
+
+    Uses pandas' C parser when available and numpy's loadtxt otherwise. Extra
+    attribute columns after X Y Z are ignored, even when only some lines have
+    them, and blank lines are skipped. Malformed lines (fewer than three
+    fields, or fields that are not numbers, e.g. a header) are skipped and
+    their number is reported.
+
+    :param file_path: Path to the .txt file.
+    :param chunk_size: Number of lines parsed per chunk.
+    :return: Generator of numpy arrays of shape (<= chunk_size, 3).
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    skipped = 0
+    if pd is not None:
+        reader = pd.read_csv(
+            file_path,
+            sep=r"\s+",
+            header=None,
+            usecols=[0, 1, 2],
+            chunksize=chunk_size,
+            engine="c",
+        )
+        for chunk in reader:
+            # Columns with a token that is not a number are read as strings
+            for column in chunk.columns:
+                if not pd.api.types.is_numeric_dtype(chunk[column]):
+                    chunk[column] = pd.to_numeric(chunk[column], errors="coerce")
+            points = chunk.to_numpy(dtype=np.float64)
+            # Short lines are padded with NaN
+            valid = ~np.isnan(points).any(axis=1)
+            if not valid.all():
+                skipped += len(points) - int(np.count_nonzero(valid))
+                points = points[valid]
+            if len(points):
+                yield points
+    else:
+        with open(file_path, "r") as file:
+            while True:
+                lines = list(itertools.islice(file, chunk_size))
+                if not lines:
+                    break
+                try:
+                    with warnings.catch_warnings():
+                        # loadtxt warns about chunks of blank lines only
+                        warnings.simplefilter("ignore", UserWarning)
+                        points = np.loadtxt(lines, usecols=(0, 1, 2), ndmin=2)
+                except (ValueError, IndexError):
+                    points, chunk_skipped = _parse_xyz_lines(lines)
+                    skipped += chunk_skipped
+                if len(points):
+                    yield points
+
+    if skipped:
+        print(f"Skipped {skipped} malformed lines of {os.path.basename(file_path)}")
+
+
+def xyz_sidecar_path(file_path):
+    """Path of the binary .npy cache written next to an XYZ text file."""
+    return file_path + ".npy"
+
+
+def load_xyz_points(file_path, use_sidecar=True, chunk_size=XYZ_CHUNK_SIZE):
+    """
+    Load the XYZ coordinates of a text point cloud.
+
+    With use_sidecar, the parsed coordinates are written to a .npy file next to
+    the text file on first load, and later loads memory-map that file instead of
+    parsing the text again. The sidecar is ignored once the text file is newer.
+
+    :param file_path: Path to the .txt file.
+    :param use_sidecar: Read from and write to the .npy sidecar cache.
+    :param chunk_size: Number of lines parsed per chunk.
+    :return: Numpy array (or read-only memory map) of shape (n_points, 3).
+    """
+    sidecar = xyz_sidecar_path(file_path)
+    if (
+        use_sidecar
+        and os.path.exists(sidecar)
+        and os.path.getmtime(sidecar) >= os.path.getmtime(file_path)
+    ):
+        return np.load(sidecar, mmap_mode="r")
+
+    chunks = list(iter_xyz_chunks(file_path, chunk_size))
+    points = np.concatenate(chunks) if chunks else np.empty((0, 3))
+
+    if use_sidecar:
+        # Write to a temporary file first so a partial sidecar is never read
+        temp_path = _temp_path(sidecar)
+        try:
+            with open(temp_path, "wb") as file:
+                np.save(file, points)
+            os.replace(temp_path, sidecar)
+        except OSError as e:
+            print(f"Could not write XYZ sidecar cache: {e}")
+        finally:
+            _remove_quietly(temp_path)
+    return points
+
+
+def open_point_chunks(
+    file_path, chunk_size=LAS_CHUNK_SIZE, use_sidecar=True, use_cache=True
+):
+    """
+    Stream every point of a point cloud file, in file order.
+
+    :param file_path: Path to a .las, .laz or .txt file.
+    :param chunk_size: Number of points per chunk.
+    :param use_sidecar: Use the .npy sidecar cache of XYZ text files.
+    :param use_cache: Use the point cache of .las files, if it is valid.
+    :return: Number of points in the file and a generator of numpy arrays of
+        shape (<= chunk_size, 3).
+    """
+    if is_las(file_path):
+        cache = None
+        if use_cache and file_path.endswith(".las"):
+            cache = open_las_cache(file_path)
+        if cache is not None:
+            raw, meta = cache
+            return meta["point_count"], iter_cached_chunks(raw, meta, chunk_size)
+        with open_las(file_path) as reader:
+            point_count = reader.header.point_count
+        return point_count, iter_las_chunks(file_path, chunk_size)
+    points = load_xyz_points(file_path, use_sidecar=use_sidecar)
+    return len(points), (
+        points[start : start + chunk_size]
+        for start in range(0, len(points), chunk_size)
+    )
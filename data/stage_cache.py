@@ -0,0 +1,111 @@
+# data/stage_cache.py
+import hashlib
+import json
+import os
+import numpy as np
+
+CACHE_EXTENSION = ".npz"
+
+
+class StageCache:
+    """
+    Persistent, content-addressed cache of pipeline stage outputs.
+
+    Every entry is a .npz file named after a hash of the stage name and the
+    parameters that produced it (including a fingerprint of the source file),
+    so results survive across sessions and are shared between processes.
+    Reading an entry refreshes its modification time; when the cache grows past
+    max_bytes the least recently used entries are deleted first.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = {}
+        self.misses = {}
+        self._total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, stage, params):
+        key = json.dumps({"stage": stage, **params}, sort_keys=True, default=str)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{stage}-{digest}{CACHE_EXTENSION}")
+
+    def contains(self, stage, params):
+        return os.path.exists(self.entry_path(stage, params))
+
+    def get(self, stage, params):
+        """
+        Look up the output of a stage.
+
+        :param stage: Stage name, e.g. "downsample".
+        :param params: Dict of everything the stage output depends on.
+        :return: Dict of numpy arrays, or None on a miss.
+        """
+        path = self.entry_path(stage, params)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            # Missing, evicted by another process or unreadable
+            self.misses[stage] = self.misses.get(stage, 0) + 1
+            return None
+        self.hits[stage] = self.hits.get(stage, 0) + 1
+        return arrays
+
+    def put(self, stage, params, arrays):
+        """
+        Store the output of a stage and evict old entries if over the size cap.
+
+        :param stage: Stage name, e.g. "downsample".
+        :param params: Dict of everything the stage output depends on.
+        :param arrays: Dict of numpy arrays to store.
+        """
+        path = self.entry_path(stage, params)
+        # Unique temporary name so concurrent writers never share a file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                np.savez(file, **arrays)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write {stage} cache entry: {e}")
+            return
+        if self._total_bytes is not None:
+            self._total_bytes += os.path.getsize(path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes."""
+        if self._total_bytes is not None and self._total_bytes <= self.max_bytes:
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_EXTENSION):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            self._total_bytes -= size
+
+    def stats(self):
+        """Hit and miss counts per stage since the cache was opened."""
+        return {
+            stage: {
+                "hits": self.hits.get(stage, 0),
+                "misses": self.misses.get(stage, 0),
+            }
+            for stage in sorted(set(self.hits) | set(self.misses))
+        }
@@ -16,12 +16,30 @@ from PyQt5.QtWidgets import (
     QStyle,
     QGroupBox,
     QSizePolicy,
+    QTableWidget,
+    QTableWidgetItem,
 )
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont, QPixmap
 import os
 from mayavi import mlab
 import config.settings as settings
+from data import label_store
+from data.manifest import FolderManifest, suggest_downsampling
+from pipeline import processing
+from pipeline.prefetch import Prefetcher
+from pipeline.profiling import profiler
+
+# Columns of the profiling table: (header, summary key, format)
+PROFILE_COLUMNS = [
+    ("Span", "name", "{}"),
+    ("Count", "count", "{}"),
+    ("Last (s)", "wall_last", "{:.3f}"),
+    ("Mean (s)", "wall_mean", "{:.3f}"),
+    ("CPU (s)", "cpu_total", "{:.2f}"),
+    ("Peak RSS (MB)", "rss_peak_mb", "{:.0f}"),
+    ("Traced (MB)", "traced_peak_mb", "{:.1f}"),
+]
 
 
 class ControlPanel(QWidget):
@@ -29,9 +47,12 @@ class ControlPanel(QWidget):
         super().__init__(parent)
         self.pointcloud_view = pointcloud_view
         self.pointcloud_view.cluster_label_update_func = self.update_cluster_label
+        self.pointcloud_view.progress_update_func = self.show_progress
         self.pointcloud_files = []  # List of point cloud files
+        self.manifest = None  # Header summary of the files of the folder
         self.current_file_index = 0  # Index of the currently displayed file
         self.dest_folder_path = None  # Path to the destination folder for labels
+        self.prefetcher = None  # Background pipeline runs for upcoming files
         self.initUI()
 
     def initUI(self):
@@ -80,6 +101,32 @@ class ControlPanel(QWidget):
 
         input_navigation_groupbox_layout.addLayout(nav_layout)
 
+        # File order and filter, from the folder manifest
+        file_filter_layout = QHBoxLayout()
+        file_filter_layout.addWidget(QLabel("Sort:", self))
+        self.file_sort_selector = QComboBox(self)
+        self.file_sort_selector.addItem("Name", "name")
+        self.file_sort_selector.addItem("Points", "points")
+        self.file_sort_selector.addItem("Size", "size")
+        self.file_sort_selector.addItem("Modified", "modified")
+        index = self.file_sort_selector.findData(settings.current_settings["File_sort"])
+        if index >= 0:
+            self.file_sort_selector.setCurrentIndex(index)
+        self.file_sort_selector.currentIndexChanged.connect(self.on_file_order_changed)
+        file_filter_layout.addWidget(self.file_sort_selector)
+
+        file_filter_layout.addWidget(QLabel("Max points (M):", self))
+        self.file_max_points = QDoubleSpinBox(self)
+        self.file_max_points.setRange(0, 100000)
+        self.file_max_points.setSpecialValueText("Any")
+        self.file_max_points.setValue(settings.current_settings["File_max_points_m"])
+        self.file_max_points.lineEdit().returnPressed.connect(
+            self.on_file_order_changed
+        )
+        file_filter_layout.addWidget(self.file_max_points)
+
+        input_navigation_groupbox_layout.addLayout(file_filter_layout)
+
         # add input navigation groupbox to layout
         input_navigation_groupbox.setLayout(input_navigation_groupbox_layout)
         layout.addWidget(input_navigation_groupbox)
@@ -105,6 +152,14 @@ class ControlPanel(QWidget):
 
         output_groupbox_layout.addLayout(dest_folder_layout)
 
+        # Button for exporting the labels of every point of the current file
+        self.btn_export_dense = QPushButton("Export Dense Labels", self)
+        self.btn_export_dense.setToolTip(
+            "Write the label of every point of the original file to a .npy file"
+        )
+        self.btn_export_dense.clicked.connect(self.export_dense_labels)
+        output_groupbox_layout.addWidget(self.btn_export_dense)
+
         # add output groupbox to layout
         output_groupbox.setLayout(output_groupbox_layout)
         layout.addWidget(output_groupbox)
@@ -176,6 +231,13 @@ class ControlPanel(QWidget):
         self.downsampling_algorithm_selector.addItem(
             "QuickFPS (Large)", "bucket_fps_kdline_large"
         )
+        self.downsampling_algorithm_selector.addItem(
+            "Voxel Grid (Centroid)", "voxel_centroid"
+        )
+        self.downsampling_algorithm_selector.addItem(
+            "Voxel Grid (Nearest)", "voxel_nearest"
+        )
+        self.downsampling_algorithm_selector.addItem("Poisson Disk", "poisson_disk")
 
         # Load the current selection from settings
         current_subsampling = settings.current_settings["Subsampling"]
@@ -217,6 +279,10 @@ class ControlPanel(QWidget):
         self.superpoint_graph_algorithm_selector = QComboBox(self)
         self.superpoint_graph_algorithm_selector.addItem("KNN Graph", "knn")
         self.superpoint_graph_algorithm_selector.addItem("MST Graph", "mst")
+        self.superpoint_graph_algorithm_selector.addItem(
+            "Mutual KNN Graph", "mutual_knn"
+        )
+        self.superpoint_graph_algorithm_selector.addItem("Radius Graph", "radius")
 
         # Load the current selection from settings
         current_spg = settings.current_settings["superpoint_graph"]
@@ -236,10 +302,8 @@ class ControlPanel(QWidget):
         # when k value is changed, refresh the point cloud view
         self.k_value.lineEdit().returnPressed.connect(self.create_superpoint_graph)
         print("index on spg: ", index)
-        if index != 0:
-            self.k_value.setEnabled(
-                False
-            )  # disable k selection for anything other than knn
+        if current_spg not in processing.K_GRAPH_METHODS:
+            self.k_value.setEnabled(False)  # disable k selection for graphs without a k
 
         graph_layout.addWidget(self.superpoint_graph_algorithm_selector)
         graph_layout.addWidget(self.k_value)
@@ -258,8 +322,9 @@ class ControlPanel(QWidget):
             "Label Propagation", "label_propagation"
         )
         self.community_detection_selector.addItem("Async LPA", "async_lpa")
+        self.community_detection_selector.addItem("Sparse LPA", "sparse_lpa")
         self.community_detection_selector.addItem("Louvain", "louvain")
-        # self.community_detection_selector.addItem("Girvan-Newman", "girvan_newman") # Does not work
+        self.community_detection_selector.addItem("Girvan-Newman", "girvan_newman")
         self.community_detection_selector.addItem("Modularity", "modularity")
         self.community_detection_selector.addItem("Bipartitions", "kernighan_lin")
 
@@ -341,6 +406,48 @@ class ControlPanel(QWidget):
         additional_controls_groupbox.setLayout(additional_controls_groupbox_layout)
         layout.addWidget(additional_controls_groupbox)
 
+        """PROFILING GROUPBOX"""
+        profiling_groupbox = QGroupBox("Profiling")
+        profiling_groupbox_layout = QVBoxLayout()
+
+        # Per-span summary of the recorded timings
+        self.profile_table = QTableWidget(0, len(PROFILE_COLUMNS), self)
+        self.profile_table.setHorizontalHeaderLabels(
+            [header for header, _, _ in PROFILE_COLUMNS]
+        )
+        self.profile_table.verticalHeader().setVisible(False)
+        self.profile_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.profile_table.setMaximumHeight(160)
+        profiling_groupbox_layout.addWidget(self.profile_table)
+
+        profile_buttons_layout = QHBoxLayout()
+        self.checkbox_trace_memory = QCheckBox("Trace Memory", self)
+        self.checkbox_trace_memory.setToolTip(
+            "Record the peak Python allocations of every span (slower)"
+        )
+        self.checkbox_trace_memory.setChecked(
+            settings.current_settings["Profile_memory"]
+        )
+        profiler.set_memory_tracing(settings.current_settings["Profile_memory"])
+        self.checkbox_trace_memory.toggled.connect(self.toggle_memory_tracing)
+        self.btn_refresh_profile = QPushButton("Refresh", self)
+        self.btn_refresh_profile.clicked.connect(self.refresh_profile)
+        self.btn_clear_profile = QPushButton("Clear", self)
+        self.btn_clear_profile.clicked.connect(self.clear_profile)
+        self.btn_export_profile = QPushButton("Export", self)
+        self.btn_export_profile.setToolTip(
+            "Save the recorded spans as a Chrome trace (.json) or JSON lines (.jsonl)"
+        )
+        self.btn_export_profile.clicked.connect(self.export_profile)
+        profile_buttons_layout.addWidget(self.checkbox_trace_memory)
+        profile_buttons_layout.addWidget(self.btn_refresh_profile)
+        profile_buttons_layout.addWidget(self.btn_clear_profile)
+        profile_buttons_layout.addWidget(self.btn_export_profile)
+        profiling_groupbox_layout.addLayout(profile_buttons_layout)
+
+        profiling_groupbox.setLayout(profiling_groupbox_layout)
+        layout.addWidget(profiling_groupbox)
+
         self.setLayout(layout)
 
     def select_dest_folder(self):
@@ -363,55 +470,180 @@ class ControlPanel(QWidget):
         # Proceed with label saving
         label = self.label_entry_textbox.text().strip()
         if label:
+            try:
+                label = int(label)
+            except ValueError:
+                QMessageBox.warning(self, "Warning", "Labels must be whole numbers.")
+                return
             self.pointcloud_view.label_current_cluster(label)
             self.pointcloud_view.next_cluster()
             self.label_entry_textbox.clear()
+            self.refresh_profile()
             # Update UI elements as needed
 
-            # Save the current state of labels to a file
-            self.pointcloud_view.save_labels_to_file()
+            # The label is already persisted to the label journal, which is
+            # compacted into the label file on file switch or close
+
+    def export_dense_labels(self):
+        if not self.pointcloud_view.destination_folder:
+            QMessageBox.warning(
+                self, "Warning", "Please select a destination folder for the labels."
+            )
+            return
+        if not self.pointcloud_view.current_file:
+            return
+        self.show_loading_indicator()
+        try:
+            output_path = self.pointcloud_view.export_dense_labels()
+        except Exception as e:
+            QMessageBox.warning(self, "Warning", f"Could not export labels: {e}")
+            output_path = None
+        self.show_progress(None)
+        if output_path:
+            QMessageBox.information(
+                self, "Export Dense Labels", f"Labels written to {output_path}"
+            )
 
     def select_folder(self):
-        self.btn_select_dest_folder.setEnabled(
-            True
-        )  # Enable the destination folder selection button
         folder_path = QFileDialog.getExistingDirectory(self, "Select Folder")
         if folder_path:
+            # The destination folder needs a loaded partition to save
+            self.btn_select_dest_folder.setEnabled(False)
             self.show_loading_indicator()
             QApplication.processEvents()  # Process any pending GUI events
             self.folder_path_display.setText(folder_path)
             self.load_pointcloud_files(folder_path)
             self.pointcloud_view.current_folder_path = folder_path
-            self.display_current_file()
+            self.display_current_file(on_loaded=self.on_folder_loaded)
+
+    def on_folder_loaded(self):
+        # Runs once the first file of a newly selected folder is loaded
+        self.btn_select_dest_folder.setEnabled(True)
+        self.schedule_prefetch()
 
     def load_pointcloud_files(self, folder_path):
-        # Load all point cloud files (.las and .txt) from the folder
-        self.pointcloud_files = [
-            f for f in os.listdir(folder_path) if f.endswith((".las", ".txt"))
-        ]
+        # List the point cloud files (.las, .laz and .txt) of the folder from their
+        # headers; only new or changed files are read
+        self.manifest = FolderManifest(folder_path, processing.POINTCLOUD_EXTENSIONS)
+        read = self.manifest.refresh()
+        print(f"Read the headers of {read} of {len(self.manifest.entries)} files")
+        for name, entry in sorted(self.manifest.entries.items()):
+            if entry["error"] is not None:
+                print(f"Skipping unreadable file {name}: {entry['error']}")
+        self.pointcloud_files = self.filtered_files()
         self.current_file_index = 0
 
-    def display_current_file(self):
+    def filtered_files(self):
+        max_points = self.file_max_points.value()
+        return self.manifest.files(
+            sort_key=self.file_sort_selector.currentData(),
+            max_points=int(max_points * 1_000_000) if max_points else None,
+        )
+
+    def on_file_order_changed(self):
+        settings.current_settings["File_sort"] = self.file_sort_selector.currentData()
+        settings.current_settings["File_max_points_m"] = self.file_max_points.value()
+        if self.manifest is None:
+            return
+        current = None
+        if self.pointcloud_files:
+            current = self.pointcloud_files[self.current_file_index]
+        self.pointcloud_files = self.filtered_files()
+        if current in self.pointcloud_files:
+            # Keep the open file selected
+            self.current_file_index = self.pointcloud_files.index(current)
+        elif self.pointcloud_files:
+            self.current_file_index = 0
+            self.open_current_file()
+        self.schedule_prefetch()
+
+    def file_downsampling(self, filename):
+        # Downsampling for a file, adapted to its point count from the manifest
+        method = self.downsampling_algorithm_selector.currentData()
+        target_count = self.target_point_count.value()
+        entry = self.manifest.get(filename) if self.manifest else None
+        if entry is None or not settings.current_settings["Adaptive_downsampling"]:
+            return method, target_count
+        return suggest_downsampling(entry, method, target_count)
+
+    def display_current_file(self, on_loaded=None):
         print("Running function: display_current_file")
-        self.pointcloud_view.cluster_labels = {}
         if self.pointcloud_files and self.pointcloud_view.current_folder_path:
             filename = self.pointcloud_files[self.current_file_index]
-            self.file_name_display.setText(filename)
+            self.show_loading_indicator()
             full_path = os.path.join(self.pointcloud_view.current_folder_path, filename)
             self.pointcloud_view.current_file = full_path
+            downsampling_method, target_count = self.file_downsampling(filename)
+            if self.manifest is not None:
+                # Show the downsampling actually used when it was adapted
+                tooltip = self.manifest.describe(filename)
+                if (
+                    downsampling_method
+                    != self.downsampling_algorithm_selector.currentData()
+                ):
+                    tooltip += (
+                        f"\nDownsampling adapted to: {downsampling_method or 'none'}"
+                    )
+                self.file_name_display.setToolTip(tooltip)
             self.pointcloud_view.load_and_display_pointcloud(
                 full_path,
-                downsampling_method=self.downsampling_algorithm_selector.currentData(),
-                target_count=self.target_point_count.value(),
+                downsampling_method=downsampling_method,
+                target_count=target_count,
                 show_full_view=self.checkbox_full_view.isChecked(),
                 show_cluster_view=self.checkbox_cluster_view.isChecked(),
                 superpoint_graph_method=self.superpoint_graph_algorithm_selector.currentData(),
                 k_value=self.k_value.value(),
                 clustering_algorithm=self.community_detection_selector.currentData(),
+                on_loaded=on_loaded,
             )
         else:
             print("No files to display or folder path is not set.")
 
+    def pipeline_params(self, filename):
+        # Pipeline parameters for a file as currently selected in the control panel
+        downsampling_method, target_count = self.file_downsampling(filename)
+        return {
+            **self.pointcloud_view.pipeline_params(),
+            "downsampling_method": downsampling_method,
+            "target_count": target_count,
+            "superpoint_graph_method": self.superpoint_graph_algorithm_selector.currentData(),
+            "k_value": self.k_value.value(),
+            "clustering_algorithm": self.community_detection_selector.currentData(),
+        }
+
+    def schedule_prefetch(self):
+        # Precompute the next files in the background while this one is labeled
+        depth = settings.current_settings["Prefetch_depth"]
+        if (
+            depth <= 0
+            or not self.pointcloud_files
+            or self.pointcloud_view.get_stage_cache() is None
+        ):
+            return
+        if self.prefetcher is None:
+            self.prefetcher = Prefetcher(
+                self.pointcloud_view.stage_cache.cache_dir,
+                self.pointcloud_view.stage_cache.max_bytes,
+                depth,
+            )
+
+        upcoming = []
+        params = []
+        for offset in range(1, min(depth, len(self.pointcloud_files) - 1) + 1):
+            filename = self.pointcloud_files[
+                (self.current_file_index + offset) % len(self.pointcloud_files)
+            ]
+            # Files with save data are loaded from their label file instead
+            if self.dest_folder_path and label_store.has_saved_labels(
+                self.dest_folder_path, filename
+            ):
+                continue
+            upcoming.append(
+                os.path.join(self.pointcloud_view.current_folder_path, filename)
+            )
+            params.append(self.pipeline_params(filename))
+        self.prefetcher.schedule(upcoming, params)
+
     def show_loading_indicator(self):
         self.file_name_display.setText("Loading...")
 
@@ -422,31 +654,7 @@ class ControlPanel(QWidget):
             self.current_file_index = (self.current_file_index - 1) % len(
                 self.pointcloud_files
             )
-
-            filename = self.pointcloud_files[self.current_file_index]
-            self.file_name_display.setText(filename)
-            self.pointcloud_view.current_file = filename
-
-            if self.dest_folder_path:
-                # check if there is a destination file path for current file
-                label_file_path = os.path.join(
-                    self.dest_folder_path, os.path.basename(filename) + ".json"
-                )
-                print("Looking for save data at filepath: ", label_file_path + ".json")
-
-                if not os.path.exists(label_file_path):
-                    print("Did not find save data, creating new partition")
-                    self.display_current_file()
-                else:
-                    print("Found save data, loading partition")
-                self.pointcloud_view.set_destination_folder(self.dest_folder_path)
-            else:
-                self.display_current_file()
-            self.pointcloud_view.render_pointcloud(
-                show_full_view=self.checkbox_full_view.isChecked(),
-                show_cluster_view=self.checkbox_cluster_view.isChecked(),
-            )
-            self.update_cluster_label()
+            self.open_current_file()
 
     def next_file(self):
         if self.pointcloud_files:
@@ -455,32 +663,82 @@ class ControlPanel(QWidget):
             self.current_file_index = (self.current_file_index + 1) % len(
                 self.pointcloud_files
             )
+            self.open_current_file()
 
-            filename = self.pointcloud_files[self.current_file_index]
-            self.file_name_display.setText(filename)
-            self.pointcloud_view.current_file = filename
-
-            if self.dest_folder_path:
-                # check if there is a destination file path for current file
-                label_file_path = os.path.join(
-                    self.dest_folder_path, os.path.basename(filename) + ".json"
-                )
-                print("Looking for save data at filepath: ", label_file_path + ".json")
+    def open_current_file(self):
+        filename = self.pointcloud_files[self.current_file_index]
+        # The full path, as the pipeline and the dense label export read the file
+        self.pointcloud_view.current_file = os.path.join(
+            self.pointcloud_view.current_folder_path, filename
+        )
 
-                if not os.path.exists(label_file_path):
-                    print("Did not find save data, creating new partition")
-                    self.display_current_file()
-                else:
-                    print("Found save data, loading partition")
+        if self.dest_folder_path:
+            # check if there is save data for current file
+            print(
+                "Looking for save data at filepath: ",
+                label_store.label_file_path(self.dest_folder_path, filename),
+            )
 
+            if label_store.has_saved_labels(self.dest_folder_path, filename):
+                print("Found save data, loading partition")
+                # Drop any pipeline still running for the previous file
+                self.pointcloud_view.cancel_pipeline()
                 self.pointcloud_view.set_destination_folder(self.dest_folder_path)
-            else:
-                self.display_current_file()
-            self.pointcloud_view.render_pointcloud(
-                show_full_view=self.checkbox_full_view.isChecked(),
-                show_cluster_view=self.checkbox_cluster_view.isChecked(),
+                self.on_file_loaded()
+                return
+            print("Did not find save data, creating new partition")
+        self.display_current_file(on_loaded=self.on_file_loaded)
+
+    def on_file_loaded(self):
+        # Runs once the pipeline result (or the save data) for the file is ready.
+        # The view has already rendered it and set up its label file.
+        self.btn_select_dest_folder.setEnabled(True)
+        self.update_cluster_label()
+        self.show_progress(None)
+        self.refresh_profile()
+        self.schedule_prefetch()
+
+    def show_progress(self, stage):
+        # Pipeline stage currently running for the displayed file, None when idle
+        if stage:
+            self.file_name_display.setText(f"Loading... ({stage})")
+        elif self.pointcloud_files:
+            self.file_name_display.setText(
+                self.pointcloud_files[self.current_file_index]
             )
-            self.update_cluster_label()
+
+    def refresh_profile(self):
+        rows = profiler.summary()
+        self.profile_table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            for column, (_, key, fmt) in enumerate(PROFILE_COLUMNS):
+                value = row.get(key)
+                text = "" if value is None else fmt.format(value)
+                self.profile_table.setItem(row_index, column, QTableWidgetItem(text))
+
+    def clear_profile(self):
+        profiler.clear()
+        self.refresh_profile()
+
+    def toggle_memory_tracing(self, checked):
+        settings.current_settings["Profile_memory"] = checked
+        profiler.set_memory_tracing(checked)
+
+    def export_profile(self):
+        path, selected_filter = QFileDialog.getSaveFileName(
+            self,
+            "Export Profile",
+            "profile.json",
+            "Chrome Trace (*.json);;JSON Lines (*.jsonl)",
+        )
+        if not path:
+            return
+        try:
+            if "jsonl" in selected_filter and not path.endswith(".jsonl"):
+                path += ".jsonl"
+            profiler.export(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Warning", f"Could not export profile: {e}")
 
     def change_file(self, event):
         # Logic to change file on click
@@ -509,20 +767,8 @@ class ControlPanel(QWidget):
         current_subsample_size = int(self.target_point_count.value())
         settings.current_settings["Subsample_size"] = current_subsample_size
         self.show_loading_indicator()  # This may take a while depending on the size of the point cloud
-        if self.confirm_deletion():
-            if self.pointcloud_view.current_folder_path:
-                downsampling_method = self.downsampling_algorithm_selector.currentData()
-                target_count = self.target_point_count.value()
-                self.pointcloud_view.load_and_display_pointcloud(
-                    self.pointcloud_view.current_folder_path,
-                    downsampling_method,
-                    target_count,
-                    show_full_view=self.checkbox_full_view.isChecked(),
-                    show_cluster_view=self.checkbox_cluster_view.isChecked(),
-                    superpoint_graph_method=self.superpoint_graph_algorithm_selector.currentData(),
-                    k_value=self.k_value.value(),
-                    clustering_algorithm=self.community_detection_selector.currentData(),
-                )
+        # Deleting the save data reloads the file with the new settings
+        self.confirm_deletion()
         try:
             filename = self.pointcloud_files[self.current_file_index]
             self.file_name_display.setText(filename)
@@ -535,18 +781,8 @@ class ControlPanel(QWidget):
         current_selection = self.community_detection_selector.currentData()
         settings.current_settings["Community_detection"] = current_selection
         self.show_loading_indicator()  # This may take a while depending on the size of the point cloud
-        if self.confirm_deletion():
-            if self.pointcloud_view.current_folder_path:
-                self.pointcloud_view.load_and_display_pointcloud(
-                    self.pointcloud_view.current_folder_path,
-                    downsampling_method=self.downsampling_algorithm_selector.currentData(),
-                    target_count=self.target_point_count.value(),
-                    show_full_view=self.checkbox_full_view.isChecked(),
-                    show_cluster_view=self.checkbox_cluster_view.isChecked(),
-                    superpoint_graph_method=self.superpoint_graph_algorithm_selector.currentData(),
-                    k_value=self.k_value.value(),
-                    clustering_algorithm=self.community_detection_selector.currentData(),
-                )
+        # Deleting the save data reloads the file with the new settings
+        self.confirm_deletion()
         try:
             filename = self.pointcloud_files[self.current_file_index]
             self.file_name_display.setText(filename)
@@ -562,9 +798,10 @@ class ControlPanel(QWidget):
         index = self.superpoint_graph_algorithm_selector.findData(current_selection)
         print("index on spg: ", index)
         print("is k_value enabled: ", self.k_value.isEnabled())
-        if index != 0:
+        uses_k = current_selection in processing.K_GRAPH_METHODS
+        if not uses_k:
             self.k_value.setEnabled(False)
-        if index == 0 and self.k_value.isEnabled() == False:
+        if uses_k and self.k_value.isEnabled() == False:
             self.k_value.setEnabled(True)
             try:
                 filename = self.pointcloud_files[self.current_file_index]
@@ -575,18 +812,8 @@ class ControlPanel(QWidget):
 
         print("Running function: create_superpoint_graph")
         self.show_loading_indicator()  # This may take a while depending on the size of the point cloud
-        if self.confirm_deletion():
-            if self.pointcloud_view.current_folder_path:
-                self.pointcloud_view.load_and_display_pointcloud(
-                    self.pointcloud_view.current_folder_path,
-                    downsampling_method=self.downsampling_algorithm_selector.currentData(),
-                    target_count=self.target_point_count.value(),
-                    show_full_view=self.checkbox_full_view.isChecked(),
-                    show_cluster_view=self.checkbox_cluster_view.isChecked(),
-                    superpoint_graph_method=self.superpoint_graph_algorithm_selector.currentData(),
-                    k_value=self.k_value.value(),
-                    clustering_algorithm=self.community_detection_selector.currentData(),
-                )
+        # Deleting the save data reloads the file with the new settings
+        self.confirm_deletion()
 
         try:
             filename = self.pointcloud_files[self.current_file_index]
@@ -628,10 +855,10 @@ class ControlPanel(QWidget):
             )
 
     def prev_cluster(self):
-        if self.pointcloud_view.clusters:
+        if self.pointcloud_view.partition:
             self.pointcloud_view.current_cluster_index = (
                 self.pointcloud_view.current_cluster_index - 1
-            ) % len(self.pointcloud_view.clusters)
+            ) % len(self.pointcloud_view.partition)
             self.pointcloud_view.render_pointcloud(
                 show_full_view=self.checkbox_full_view.isChecked(),
                 show_cluster_view=self.checkbox_cluster_view.isChecked(),
@@ -639,10 +866,10 @@ class ControlPanel(QWidget):
             self.update_cluster_label()
 
     def next_cluster(self):
-        if self.pointcloud_view.clusters:
+        if self.pointcloud_view.partition:
             self.pointcloud_view.current_cluster_index = (
                 self.pointcloud_view.current_cluster_index + 1
-            ) % len(self.pointcloud_view.clusters)
+            ) % len(self.pointcloud_view.partition)
             self.pointcloud_view.render_pointcloud(
                 show_full_view=self.checkbox_full_view.isChecked(),
                 show_cluster_view=self.checkbox_cluster_view.isChecked(),
@@ -650,12 +877,15 @@ class ControlPanel(QWidget):
             self.update_cluster_label()
 
     def update_cluster_label(self):
-        if self.pointcloud_view.clusters:
-            total_clusters = len(self.pointcloud_view.clusters)
+        if self.pointcloud_view.partition:
+            partition = self.pointcloud_view.partition
             current_index = (
                 self.pointcloud_view.current_cluster_index + 1
             )  # +1 for human-readable indexing
-            self.cluster_label.setText(f"Cluster {current_index} of {total_clusters}")
+            self.cluster_label.setText(
+                f"Cluster {current_index} of {len(partition)} "
+                f"({partition.num_labeled} labeled)"
+            )
         else:
             self.cluster_label.setText("No clusters")
 
@@ -672,22 +902,15 @@ class ControlPanel(QWidget):
             return False
         filename = self.pointcloud_files[self.current_file_index]
 
-        label_file_path = None
-        if self.dest_folder_path:
-            # check if there is a destination file path for current file
-            label_file_path = os.path.join(
-                self.dest_folder_path, os.path.basename(filename) + ".json"
-            )
-        else:
+        if not self.dest_folder_path:
             msg.setText("Please select a Destination Folder and try again")
             msg.exec_()
             print("No destination folder set")
             return False
-        # print("Looking for save data at filepath: ", label_file_path + ".json")
 
         # If there is no destination folder, or if there is no save data, return False
         # to indicate that deletion is not possible
-        if not os.path.exists(label_file_path):
+        if not label_store.has_saved_labels(self.dest_folder_path, filename):
             print("No save data found")
             return False
 
@@ -707,14 +930,12 @@ class ControlPanel(QWidget):
     def delete_save_and_reload(self):
         filename = self.pointcloud_files[self.current_file_index]
 
-        # check if there is a destination file path for current file
-        label_file_path = os.path.join(
-            self.dest_folder_path, os.path.basename(filename) + ".json"
+        print(
+            "Deleting save data at filepath: ",
+            label_store.label_file_path(self.dest_folder_path, filename),
         )
-        print("Looking for save data at filepath: ", label_file_path + ".json")
         # delete the save data
-        os.remove(label_file_path)
-        self.display_current_file()
-        if self.dest_folder_path:
-            self.dest_folder_path_display.setText(self.dest_folder_path)
-            self.pointcloud_view.set_destination_folder(self.dest_folder_path)
+        self.pointcloud_view.discard_label_journal()
+        label_store.delete_saved_labels(self.dest_folder_path, filename)
+        self.dest_folder_path_display.setText(self.dest_folder_path)
+        self.display_current_file(on_loaded=self.on_file_loaded)
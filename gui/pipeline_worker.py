@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+from pipeline import processing
+
+
+class PipelineRunner(QObject):
+    """
+    Runs the processing pipeline on a worker thread.
+
+    Only the most recent job matters: submitting a new job flags the previous
+    one as cancelled (it stops at its next stage boundary) and results of
+    superseded jobs are never delivered. Signals are emitted from the worker
+    thread and delivered to slots on the GUI thread through Qt's queued
+    connections.
+    """
+
+    # job id, stage name
+    progress = pyqtSignal(int, str)
+    # job id, pipeline result dict
+    finished = pyqtSignal(int, object)
+    # job id, error message
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.job_id = 0
+        self.cancel_event = None
+
+    def submit(self, file_path, params, cache=None):
+        """
+        Start a pipeline job, cancelling the one currently running.
+
+        :return: Id of the new job; only signals carrying this id are current.
+        """
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.job_id += 1
+        self.cancel_event = threading.Event()
+        self.executor.submit(
+            self._run, self.job_id, self.cancel_event, file_path, params, cache
+        )
+        return self.job_id
+
+    def cancel(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def is_current(self, job_id):
+        return job_id == self.job_id and not self.cancel_event.is_set()
+
+    def _run(self, job_id, cancel_event, file_path, params, cache):
+        try:
+            result = processing.run_pipeline(
+                file_path,
+                params,
+                cache=cache,
+                progress=lambda stage: self.progress.emit(job_id, stage),
+                cancelled=cancel_event.is_set,
+            )
+        except processing.PipelineCancelled as e:
+            print(f"Pipeline job {job_id} cancelled before stage: {e}")
+            return
+        except Exception as e:
+            self.failed.emit(job_id, str(e))
+            return
+        if not cancel_event.is_set():
+            self.finished.emit(job_id, result)
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
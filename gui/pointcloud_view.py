@@ -1,16 +1,23 @@
 from mayavi import mlab
-import laspy
 import numpy as np
 import os
 import config.settings as settings
-from algorithms import downsampling, superpoint_graph
+from algorithms.cluster_stats import ClusterStats
+from algorithms.octree import Octree
+from data import label_journal, label_store, readers
+from data.partition import Partition
+from data.stage_cache import StageCache
+from pipeline import backprojection, processing
+from pipeline.profiling import span
+from gui.pipeline_worker import PipelineRunner
 from PyQt5.QtWidgets import QDesktopWidget, QApplication
 import win32gui
-import time
-import algorithms.community_detection as cd
-import json
 import matplotlib.pyplot as plt
 
+# Point scalar of the highlighted cluster; labels map to label + LABEL_SCALAR_OFFSET
+HIGHLIGHT_SCALAR = 0
+LABEL_SCALAR_OFFSET = 2
+
 
 class PointcloudView:
     def __init__(self, update_filename_callback=None):
@@ -19,7 +26,7 @@ class PointcloudView:
             (0, 0, 0) if settings.current_settings["night_mode"] else (1, 1, 1)
         )
         self.cluster_label_update_func = None
-        self.cluster_labels = {}
+        self.progress_update_func = None
         self.fig_full = None
         self.fig_zoom = None
         self.current_folder_path = None
@@ -28,6 +35,7 @@ class PointcloudView:
         self.target_count = None
         self.old_target_count = None
         self.points = None
+        self.sample_indices = None  # Index of every point in the source file
         self.current_file = None
         self.old_file = None
         self.graph = None
@@ -39,67 +47,109 @@ class PointcloudView:
 
         self.clustering_algorithm = None
         self.old_clustering_algorithm = None
-        self.clusters = None
+        self.partition = None  # Clusters and their labels
+        self.partition_file = None  # File the partition was computed for
         self.current_cluster_index = 0
+        # Statistics of the current partition, rebuilt when it changes
+        self.cluster_stats = None
+        self.cluster_stats_key = None
 
         self.full_camera = None
-        self.zoom_camera = None
+
+        # Persistent actors, rebuilt only when their scene key changes
+        self.full_actor = None
+        self.arrow_actor = None
+        self.zoom_actor = None
+        self.full_scene_key = None
+        self.zoom_scene_key = None
+        self.point_cluster_ids = None
+        self.point_scalars = None
+        self.displayed_labels = None
+        self.highlighted_cluster = None
+        self.lut_classes = None
+
+        # Level of detail of the full view, used above the point budget
+        self.octree = None
+        self.octree_points = None
+        self.lod_indices = None  # Indices of the displayed points, None for all
+        self.lod_observed_figure = None
 
         self.destination_folder = ""
+        self.label_journal = None
+        self.stage_cache = None
+
+        self.pending_job = (
+            None  # (job id, file, show_full_view, show_cluster_view, on_loaded)
+        )
+        self.pipeline_runner = PipelineRunner()
+        self.pipeline_runner.progress.connect(self.on_pipeline_progress)
+        self.pipeline_runner.finished.connect(self.on_pipeline_finished)
+        self.pipeline_runner.failed.connect(self.on_pipeline_failed)
 
     def set_destination_folder(self, folder_path):
         self.destination_folder = folder_path
+        if self.pending_job is not None:
+            # The label file is set up once the pipeline result arrives
+            print("Point cloud still loading, deferring the label file")
+            return
         self.initialize_labels_file()
 
+    def has_current_partition(self):
+        # Whether the partition in memory belongs to the current file; it is
+        # stale while a load is in flight or after switching files
+        return (
+            self.partition is not None
+            and self.pending_job is None
+            and self.partition_file == self.current_file
+        )
+
     def initialize_labels_file(self):
-        label_file_path = os.path.join(
-            self.destination_folder, os.path.basename(self.current_file) + ".json"
+        label_file_path = label_store.label_file_path(
+            self.destination_folder, self.current_file
+        )
+        legacy_file_path = label_store.legacy_label_file_path(
+            self.destination_folder, self.current_file
         )
-        print("looking for save data: ", self.current_file + ".json")
-        self.cluster_labels = {}
+        print("looking for save data: ", label_file_path)
+        self.compact_labels()
+        if not os.path.exists(label_file_path) and os.path.exists(legacy_file_path):
+            label_store.migrate_legacy_partition(legacy_file_path, label_file_path)
+
         if not os.path.exists(label_file_path):
+            if not self.has_current_partition():
+                print("No partition loaded for this file, not creating save data")
+                return
             print("Did not find save data, creating new file")
-            label_data = []
-            for idx, cluster_indices in enumerate(self.clusters):
-                # Retrieve actual points from self.points using indices in cluster
-                cluster_points = self.points[cluster_indices]
-                # Convert points to a list of lists with native Python data types
-                cluster_points_list = (
-                    cluster_points.tolist()
-                    if isinstance(cluster_points, np.ndarray)
-                    else cluster_points
+            # A journal without its partition file belongs to deleted save data
+            if os.path.exists(label_journal.journal_path(label_file_path)):
+                os.remove(label_journal.journal_path(label_file_path))
+            with span("label_save", kind="partition"):
+                processing.save_new_partition(
+                    label_file_path,
+                    self.current_file,
+                    self.pipeline_params(),
+                    self.points,
+                    self.partition,
+                    indices=self.sample_indices,
                 )
-                cluster_points_list = [
-                    [float(coord) for coord in point] for point in cluster_points_list
-                ]
-
-                label_data.append(
-                    {"cluster": int(idx), "label": -1, "points": cluster_points_list}
-                )
-
-            with open(label_file_path, "w") as file:
-                json.dump(label_data, file, indent=4)
         else:
             print("Found save data, loading from file")
-            with open(label_file_path, "r") as file:
-                save_data = json.load(file)
-
-            # Flatten all points into a single array
-            all_points = np.concatenate(
-                [np.array(data["points"], dtype=float) for data in save_data]
-            )
-            self.points = all_points
-
-            # Partition points into clusters based on the lengths of each cluster's points
-            cluster_lengths = [len(data["points"]) for data in save_data]
-            indices = np.cumsum([0] + cluster_lengths[:-1])
-            self.clusters = [
-                np.arange(start, start + length)
-                for start, length in zip(indices, cluster_lengths)
-            ]
-            self.cluster_labels = {
-                idx: data["label"] for idx, data in enumerate(save_data)
-            }
+            with span("label_load", file=os.path.basename(label_file_path)):
+                saved = label_store.load_partition(label_file_path)
+                labels = saved["labels"]
+
+                # Recover labels recorded after the last compaction (e.g. a crash)
+                journal_file_path = label_journal.journal_path(label_file_path)
+                if label_journal.replay_journal(journal_file_path, labels):
+                    print("Recovered labels from journal")
+                    label_store.save_labels(label_file_path, labels)
+                if os.path.exists(journal_file_path):
+                    os.remove(journal_file_path)
+
+                self.points = saved["points"]
+                self.sample_indices = saved["sample_indices"]
+                self.partition = Partition(saved["cluster_ids"], len(labels), labels)
+                self.partition_file = self.current_file
 
             # Render the point cloud with loaded data
             self.render_pointcloud(
@@ -107,27 +157,74 @@ class PointcloudView:
             )
 
     def save_labels_to_file(self):
-        label_file_path = os.path.join(
-            self.destination_folder, os.path.basename(self.current_file) + ".json"
+        label_file_path = label_store.label_file_path(
+            self.destination_folder, self.current_file
         )
-        if os.path.exists(label_file_path):
+        if os.path.exists(label_file_path) and self.has_current_partition():
             # Update the label file with current labels
-            with open(label_file_path, "r") as file:
-                label_data = json.load(file)
-            for cluster in label_data:
-                cluster_idx = cluster["cluster"]
-                if cluster_idx in self.cluster_labels:
-                    cluster["label"] = self.cluster_labels[cluster_idx]
-            with open(label_file_path, "w") as file:
-                json.dump(label_data, file, indent=4)
+            with span("label_save", kind="labels"):
+                label_store.save_labels(label_file_path, self.partition.labels)
+
+    def compact_labels(self):
+        # Fold the label journal into its partition file and drop the journal.
+        # Works from the files alone, so it is safe after switching files.
+        if self.label_journal is None:
+            return
+        self.label_journal.close()
+        label_file_path = self.label_journal.path[
+            : -len(label_journal.JOURNAL_EXTENSION)
+        ]
+        if os.path.exists(label_file_path):
+            with span("label_save", kind="compaction"):
+                labels = label_store.load_labels(label_file_path)
+                if label_journal.replay_journal(self.label_journal.path, labels):
+                    label_store.save_labels(label_file_path, labels)
+        self.discard_label_journal()
+
+    def export_dense_labels(self):
+        # Project the cluster labels onto every point of the source file;
+        # returns the path of the written .npy file
+        self.compact_labels()
+        label_file_path = label_store.label_file_path(
+            self.destination_folder, self.current_file
+        )
+        if not os.path.exists(label_file_path):
+            return None
+        output_path = backprojection.dense_label_path(
+            self.destination_folder, self.current_file
+        )
+        backprojection.export_dense_labels(
+            self.current_file, label_file_path, output_path
+        )
+        return output_path
+
+    def discard_label_journal(self):
+        if self.label_journal is not None:
+            self.label_journal.discard()
+            self.label_journal = None
 
     def label_current_cluster(self, label):
-        if self.current_cluster_index < len(self.clusters):
-            self.cluster_labels[self.current_cluster_index] = label
-            # Optionally update visualization to reflect the new label
+        if not self.has_current_partition():
+            print("Point cloud still loading, label ignored")
+            return
+        if self.current_cluster_index < len(self.partition):
+            self.partition.set_label(self.current_cluster_index, label)
+            # Record the label in the append-only journal; the partition file
+            # itself is only rewritten when the journal is compacted
+            if self.destination_folder:
+                if self.label_journal is None:
+                    self.label_journal = label_journal.LabelJournal(
+                        label_journal.journal_path(
+                            label_store.label_file_path(
+                                self.destination_folder, self.current_file
+                            )
+                        )
+                    )
+                with span("label_save", kind="journal"):
+                    self.label_journal.append(self.current_cluster_index, label)
 
     def next_cluster(self):
-        if self.current_cluster_index < len(self.clusters) - 1:
+        if self.current_cluster_index < len(self.partition) - 1:
             self.current_cluster_index += 1
             self.update_cluster_visualization()
 
@@ -154,15 +251,219 @@ class PointcloudView:
         colors = [cmap(i / num_classes) for i in range(num_classes)]
         return [color[:3] for color in colors]  # Returns a list of RGBA color tuples
 
-    def render_pointcloud(self, show_full_view=None, show_cluster_view=None):
-        # Clear existing point cloud data from the figures
-        if self.fig_full:
-            mlab.clf(self.fig_full)
-            full_camera = None
-        if self.fig_zoom:
-            mlab.clf(self.fig_zoom)
-            zoom_camera = None
+    def label_lut(self, num_classes):
+        # Lookup table indexed by the point scalars: HIGHLIGHT_SCALAR is the
+        # current cluster (red), then unlabeled (gray), then one color per label
+        colors = [(1, 0, 0), (0.7, 0.7, 0.7)] + self.get_dynamic_colors(num_classes)
+        lut = np.full((len(colors), 4), 255, dtype=np.uint8)
+        lut[:, :3] = np.round(np.array(colors) * 255)
+        return lut
+
+    def apply_label_lut(self, actor, num_classes):
+        lut = self.label_lut(num_classes)
+        lut_manager = actor.module_manager.scalar_lut_manager
+        lut_manager.use_default_range = False
+        # Center every integer scalar on its own table entry
+        lut_manager.data_range = np.array([-0.5, len(lut) - 0.5])
+        lut_manager.lut.number_of_table_values = len(lut)
+        lut_manager.lut.table = lut
+        self.lut_classes = num_classes
+
+    def num_label_classes(self, labels):
+        # Colors only change when a label beyond the configured classes appears
+        highest = int(labels.max()) if len(labels) else -1
+        return max(settings.current_settings["num_classes"], highest + 1, 1)
+
+    def cluster_statistics(self):
+        # Built once per partition
+        key = ((self.points, self.partition), ())
+        if self.scene_changed(self.cluster_stats_key, key):
+            self.cluster_stats = ClusterStats(self.points, self.partition)
+            self.cluster_stats_key = key
+        return self.cluster_stats
+
+    def cluster_centroid(self):
+        return self.cluster_statistics().centroids[self.current_cluster_index]
+
+    def build_full_scene(self, point_mode):
+        # Single glyph actor colored through per-point label scalars
+        mlab.clf(self.fig_full)
+        self.point_cluster_ids = self.partition.ids
+        self.displayed_labels = self.partition.labels.copy()
+        # Points outside every cluster have id -1 and pick the appended entry
+        cluster_scalars = np.append(self.displayed_labels, -1) + LABEL_SCALAR_OFFSET
+        self.point_scalars = cluster_scalars[self.point_cluster_ids].astype(np.float64)
+
+        # Large clouds only show an octree selection of at most the budget
+        self.lod_indices = None
+        budget = settings.current_settings["LOD_point_budget"]
+        if budget and len(self.points) > budget:
+            if self.octree_points is not self.points:
+                with span("lod_index", points=len(self.points)):
+                    self.octree = Octree(
+                        self.points, seed=settings.current_settings["Random_seed"]
+                    )
+                self.octree_points = self.points
+            # Uniform until the camera is placed, see refresh_lod
+            self.lod_indices = self.octree.select(budget)
+            if self.lod_observed_figure is not self.fig_full:
+                self.fig_full.scene.interactor.interactor_style.add_observer(
+                    "EndInteractionEvent", self.refresh_lod
+                )
+                self.lod_observed_figure = self.fig_full
+        shown_points = self.displayed(self.points)
+
+        self.full_actor = mlab.points3d(
+            shown_points[:, 0],
+            shown_points[:, 1],
+            shown_points[:, 2],
+            self.displayed(self.point_scalars),
+            figure=self.fig_full,
+            scale_mode="none",
+            scale_factor=settings.current_settings["point_size"] * 0.6,
+            mode=point_mode,
+        )
+        self.apply_label_lut(
+            self.full_actor, self.num_label_classes(self.displayed_labels)
+        )
+        if self.lod_indices is None:
+            # Shared with the VTK data set; updated in place on navigation
+            self.point_scalars = self.full_actor.mlab_source.scalars
+        self.highlighted_cluster = None
+
+        # Arrow pointing down at the current cluster, moved on navigation
+        self.arrow_actor = mlab.quiver3d(
+            np.zeros(1),
+            np.zeros(1),
+            np.zeros(1),
+            np.zeros(1),
+            np.zeros(1),
+            np.ones(1),
+            figure=self.fig_full,
+            scale_factor=2,  # Controls the size of the arrow
+            mode="arrow",
+            color=(0, 1, 0),  # Green arrow
+        )
+        self.full_camera = self.fig_full.scene.camera
+
+    def update_full_scene(self, centroid):
+        # Recolor clusters whose label changed and move the highlight
+        labels = self.partition.labels
+        changed = np.flatnonzero(labels != self.displayed_labels)
+        self.displayed_labels = labels.copy()
+        num_classes = self.num_label_classes(labels)
+        if num_classes != self.lut_classes:
+            self.apply_label_lut(self.full_actor, num_classes)
+
+        previous = self.highlighted_cluster
+        if previous is not None and previous < len(self.partition):
+            self.point_scalars[self.partition.members(previous)] = (
+                labels[previous] + LABEL_SCALAR_OFFSET
+            )
+        if changed.size:
+            members, member_clusters = self.partition.members_of(changed)
+            self.point_scalars[members] = labels[member_clusters] + LABEL_SCALAR_OFFSET
+        self.highlighted_cluster = None
+        if centroid is not None:
+            self.highlighted_cluster = self.current_cluster_index
+            self.point_scalars[self.partition.members(self.current_cluster_index)] = (
+                HIGHLIGHT_SCALAR
+            )
+        # With a level of detail the scalars are pushed by refresh_lod
+        if self.lod_indices is None and (
+            previous != self.highlighted_cluster or changed.size
+        ):
+            self.full_actor.mlab_source.update()
+
+        if centroid is not None:
+            # Arrow's starting point, below the bottom of the cluster
+            start_point = centroid.copy()
+            start_point[2] = (
+                self.cluster_statistics().lower[self.current_cluster_index, 2] - 2.5
+            )
+            self.arrow_actor.mlab_source.set(
+                x=start_point[:1], y=start_point[1:2], z=start_point[2:]
+            )
+
+    def displayed(self, values):
+        # Rows of a per-point array for the points shown in the full view
+        return values if self.lod_indices is None else values[self.lod_indices]
+
+    def refresh_lod(self, *args):
+        # Select the points to show for the current camera (also runs as an
+        # observer at the end of every camera interaction)
+        if self.lod_indices is None or self.fig_full is None:
+            return
+        camera = self.fig_full.scene.camera
+        width, height = self.fig_full.scene.get_size()
+        self.lod_indices = self.octree.select(
+            settings.current_settings["LOD_point_budget"],
+            camera.position,
+            camera.direction_of_projection,
+            view_angle=camera.view_angle,
+            aspect_ratio=width / max(height, 1),
+        )
+        shown_points = self.displayed(self.points)
+        self.full_actor.mlab_source.reset(
+            x=shown_points[:, 0],
+            y=shown_points[:, 1],
+            z=shown_points[:, 2],
+            scalars=self.displayed(self.point_scalars),
+        )
+
+    def build_zoom_scene(self):
+        mlab.clf(self.fig_zoom)
+        self.zoom_actor = mlab.points3d(
+            np.zeros(1),
+            np.zeros(1),
+            np.zeros(1),
+            figure=self.fig_zoom,
+            scale_factor=settings.current_settings["point_size"],
+            color=(1, 0, 0),  # Red color
+            mode="sphere",
+        )
+
+    def update_zoom_scene(self):
+        # The number of points differs per cluster, so the source is reset
+        cluster_points = self.partition.cluster_points(
+            self.points, self.current_cluster_index
+        )
+        self.zoom_actor.mlab_source.reset(
+            x=cluster_points[:, 0], y=cluster_points[:, 1], z=cluster_points[:, 2]
+        )
+        self.frame_cluster(self.fig_zoom)
+
+    def frame_cluster(self, figure):
+        # Fit the camera to the bounding sphere of the current cluster from the
+        # precomputed statistics, keeping the viewing direction
+        center, radius = self.cluster_statistics().bounding_sphere(
+            self.current_cluster_index
+        )
+        # Leave room for the glyphs drawn around the outermost points
+        radius += settings.current_settings["point_size"]
+        camera = figure.scene.camera
+        distance = radius / np.sin(np.radians(camera.view_angle) / 2)
+        direction = np.asarray(camera.direction_of_projection)
+        camera.focal_point = center
+        camera.position = center - direction * distance
+        camera.clipping_range = (
+            max(distance - radius, distance * 1e-3),
+            distance + radius,
+        )
+
+    def scene_changed(self, old_key, new_key):
+        # Keys hold (objects, settings); objects are compared by identity
+        if old_key is None:
+            return True
+        return (
+            any(old is not new for old, new in zip(old_key[0], new_key[0]))
+            or old_key[1] != new_key[1]
+        )
 
+    def render_pointcloud(self, show_full_view=None, show_cluster_view=None):
+        # The scene is only rebuilt when the figure, the points, the partition
+        # or the glyph settings change; navigating clusters and labeling just
+        # update the scalars of the persistent actors
         screen_size = QDesktopWidget().screenGeometry(-1)
         width, height = screen_size.width() // 4, screen_size.height() // 2
         x = screen_size.width() - width
@@ -187,122 +488,65 @@ class PointcloudView:
                 bgcolor=self.bg_color,
             )
 
-        if self.fig_full:
-            # Group clusters by their labels
-            clusters_by_label = {}  # key is label, value is list of cluster indices
-
-            for idx, cluster in enumerate(self.clusters):
-                # cluster is a list of indices of points in the cluster
-                label = self.cluster_labels.get(idx, -1)
-                if label not in clusters_by_label:
-                    clusters_by_label[label] = []
-                clusters_by_label[label].extend(cluster)
+        if self.points is None or self.partition is None:
+            return
 
-            # Define colors for labels
-            num_classes = max(
-                max([int(key) for key in clusters_by_label.keys()]) + 1, 1
-            )
-            # Assuming labels start from 0
-            dynamic_colors = self.get_dynamic_colors(num_classes)
-            # print("All of dynamic colors: ", dynamic_colors)
-            # print("Dynamic colors has {} colors".format(len(dynamic_colors)))
-            # print("First color is: ", dynamic_colors[0])
-            # Render each group with its corresponding color
-            for label, cluster_indices in clusters_by_label.items():
-                color = (
-                    dynamic_colors[int(label)] if int(label) >= 0 else (0.7, 0.7, 0.7)
-                )  # Gray for unlabeled
-                group_points = self.points[cluster_indices, :]
-
-                mlab.points3d(
-                    group_points[:, 0],
-                    group_points[:, 1],
-                    group_points[:, 2],
-                    figure=self.fig_full,
-                    scale_factor=settings.current_settings["point_size"] * 0.6,
-                    color=color,
-                    mode=point_mode,
-                )
+        with span("render") as details:
+            centroid = None
+            if self.current_cluster_index < len(self.partition):
+                centroid = self.cluster_centroid()
 
-            # Highlight the current cluster in red
-            if self.current_cluster_index < len(self.clusters):
-                current_cluster = self.clusters[self.current_cluster_index]
-                cluster_points = self.points[current_cluster, :]
-                mlab.points3d(
-                    cluster_points[:, 0],
-                    cluster_points[:, 1],
-                    cluster_points[:, 2],
-                    figure=self.fig_full,
-                    scale_factor=settings.current_settings["point_size"],
-                    color=(1, 0, 0),  # Red color
-                    mode="sphere",
+            rebuilt = False
+            if self.fig_full:
+                scene_key = (
+                    (self.fig_full, self.points, self.partition),
+                    (point_mode, settings.current_settings["point_size"]),
                 )
-                centroid_full = np.mean(self.points, axis=0)
-                # Calculate the center of the cluster
-                centroid = np.mean(cluster_points, axis=0)
-
-                """ Create arrow that points to cluster centroid """
-                # Render the centroid arrow if centroid is provided
-                if centroid is not None:
-                    scale_factor = 2  # Controls the size of the arrow
-                    # Arrow's starting point (you might need to adjust this based on your visualization)
-                    start_point = centroid - np.array([0, 0, 2.5])
-
-                    # Arrow's direction (pointing towards the centroid)
-                    direction = np.array([0, 0, 1])
-
-                    # Adding the arrow to the visualization
-                    mlab.quiver3d(
-                        start_point[0],
-                        start_point[1],
-                        start_point[2],
-                        direction[0],
-                        direction[1],
-                        direction[2],
-                        scale_factor=scale_factor,
-                        mode="arrow",
-                        color=(0, 1, 0),
-                    )  # Green arrow
-
-            if self.full_camera is None and self.fig_full is not None:
-                self.full_camera = self.fig_full.scene.camera
-
-        # Highlight the current cluster in red
-        if self.fig_zoom:
-            if self.clusters and self.current_cluster_index < len(self.clusters):
-                current_cluster = self.clusters[self.current_cluster_index]
-                cluster_points = self.points[current_cluster, :]
-
-                # Calculate the center of the cluster
-                centroid = np.mean(cluster_points, axis=0)
-
-                # Render cluster points in red
-                mlab.points3d(
-                    cluster_points[:, 0],
-                    cluster_points[:, 1],
-                    cluster_points[:, 2],
-                    figure=self.fig_zoom,
-                    scale_factor=settings.current_settings["point_size"],
-                    color=(1, 0, 0),  # Red color,
-                    mode="sphere",
+                self.fig_full.scene.disable_render = True
+                try:
+                    if self.scene_changed(self.full_scene_key, scene_key):
+                        self.build_full_scene(point_mode)
+                        self.full_scene_key = scene_key
+                        rebuilt = True
+                    self.update_full_scene(centroid)
+                    if rebuilt:
+                        self.fig_full.scene.reset_zoom()
+                        self.zoom_to_cluster(self.fig_full, 2)
+                    if centroid is not None:
+                        self.set_camera_focal_point(
+                            centroid, self.fig_full, self.full_camera
+                        )
+                    self.refresh_lod()
+                finally:
+                    self.fig_full.scene.disable_render = False
+
+            if self.fig_zoom:
+                scene_key = (
+                    (self.fig_zoom, self.points, self.partition),
+                    (settings.current_settings["point_size"],),
                 )
-                if self.zoom_camera is None:
-                    self.zoom_camera = self.fig_zoom.scene.camera
-
-                # Set the camera's focal point to the centroid of the cluster
-                # only do this one time per file
-                self.set_camera_focal_point(centroid, self.fig_zoom, self.zoom_camera)
-
-        self.zoom_to_cluster(self.fig_full, 2)
-        self.set_camera_focal_point(centroid, self.fig_full, self.full_camera)
-
-        # Move the windows after rendering
-        if show_full_view:
-            self.move_window_to_position("Full Model", x, 0, width, height)
-        if show_cluster_view:
-            self.move_window_to_position("Cluster Zoom", x, height, width, height)
-        else:
-            self.move_window_to_position("Full Model", x, 0, width, height * 2)
+                self.fig_zoom.scene.disable_render = True
+                try:
+                    if self.scene_changed(self.zoom_scene_key, scene_key):
+                        self.build_zoom_scene()
+                        self.zoom_scene_key = scene_key
+                        rebuilt = True
+                    if centroid is not None:
+                        self.update_zoom_scene()
+                finally:
+                    self.fig_zoom.scene.disable_render = False
+
+            # Move the windows after (re)building the scenes
+            if rebuilt:
+                if show_full_view:
+                    self.move_window_to_position("Full Model", x, 0, width, height)
+                if show_cluster_view:
+                    self.move_window_to_position(
+                        "Cluster Zoom", x, height, width, height
+                    )
+                else:
+                    self.move_window_to_position("Full Model", x, 0, width, height * 2)
+            details["rebuilt"] = rebuilt
 
     def load_and_display_pointcloud(
         self,
@@ -314,71 +558,96 @@ class PointcloudView:
         superpoint_graph_method=None,
         k_value=None,
         clustering_algorithm=None,
+        on_loaded=None,
     ):
+        # Runs the pipeline on the worker thread; a newer call cancels this one.
+        # The result is rendered on the GUI thread, after which on_loaded runs.
         self.current_file = full_path
+        self.downsampling_method = downsampling_method
+        self.target_count = target_count
         self.superpoint_graph_method = superpoint_graph_method
+        self.superpoint_graph_args = k_value
         self.clustering_algorithm = clustering_algorithm
-        # print(self.current_file)
         print("Being ran with clustering algorithm: ", self.clustering_algorithm)
+        self.pending_job = (
+            self.pipeline_runner.submit(
+                self.current_file, self.pipeline_params(), cache=self.get_stage_cache()
+            ),
+            self.current_file,
+            show_full_view,
+            show_cluster_view,
+            on_loaded,
+        )
+
+    def on_pipeline_progress(self, job_id, stage):
+        if self.pending_job and job_id == self.pending_job[0]:
+            if self.progress_update_func:
+                self.progress_update_func(stage)
+
+    def on_pipeline_finished(self, job_id, result):
+        if not self.pending_job or job_id != self.pending_job[0]:
+            return  # Superseded by a newer job
+        _, file_path, show_full_view, show_cluster_view, on_loaded = self.pending_job
+        self.pending_job = None
+        if self.progress_update_func:
+            self.progress_update_func(None)
         try:
-            self.target_count = target_count
-            if (
-                target_count != self.old_target_count
-                or downsampling_method != self.old_downsampling_method
-                or self.current_file != self.old_file
-            ):
-                if self.current_file.endswith(".las"):
-                    las = laspy.read(self.current_file)
-                    self.points = np.vstack((las.x, las.y, las.z)).transpose()
-                elif self.current_file.endswith(".txt"):
-                    self.points = self.load_xyz_file(self.current_file)
-
-            # Apply downsampling
-            # print("Applying {} downsampling".format(downsampling_method))
-            curr_time = time.time()
-            if downsampling_method == "random":
-                self.points = downsampling.random_downsample(self.points, target_count)
-            elif downsampling_method == "vanilla_fps":
-                self.points = downsampling.vanilla_fps(self.points, target_count)
-            elif downsampling_method == "fps_npdu":
-                self.points = downsampling.fps_npdu(self.points, target_count)
-            elif downsampling_method == "fps_npdu_kdtree":
-                self.points = downsampling.fps_npdu_kdtree(self.points, target_count)
-            elif downsampling_method == "bucket_fps_kdline_small":
-                self.points = downsampling.bucket_fps_kdline(
-                    self.points, target_count, h=4
-                )
-            elif downsampling_method == "bucket_fps_kdline_medium":
-                self.points = downsampling.bucket_fps_kdline(
-                    self.points, target_count, h=7
-                )
-            elif downsampling_method == "bucket_fps_kdline_large":
-                self.points = downsampling.bucket_fps_kdline(
-                    self.points, target_count, h=9
-                )
-            print("Downsampling took", time.time() - curr_time, "seconds")
-
-            # Perform superpoint graph construction
-            # print(f"Performing {superpoint_graph_method} construction")
-            if superpoint_graph_method == "knn":
-                # Call superpoint graph construction method
-                curr_time = time.time()
-                self.graph = superpoint_graph.create_knn_graph(self.points, k_value)
-            elif superpoint_graph_method == "mst":
-                # Call superpoint graph construction method
-                curr_time = time.time()
-                self.graph = superpoint_graph.create_mst_graph(self.points)
-                # print(f"Graph construction took {time.time() - curr_time} seconds")
-
-            # Apply community detection
-            # print("Applying community detection algorithm: ", self.clustering_algorithm)
-            curr_time = time.time()
-            self.apply_community_detection(self.graph)
-            # print("Community detection took", time.time() - curr_time, "seconds")
+            self.points = result["points"]
+            self.sample_indices = result["indices"]
+            self.graph = result["graph"]
+            self.partition = result["partition"]
+            self.partition_file = file_path
+            self.current_cluster_index = 0
+            self.update_cluster_label_callback()
+            if self.stage_cache is not None:
+                print("Stage cache stats: ", self.stage_cache.stats())
             self.render_pointcloud(show_full_view, show_cluster_view)
-
         except Exception as e:
             print(f"Error loading point cloud: {e}")
+        if self.destination_folder:
+            # Set up the label file now that the partition is the current file's
+            self.initialize_labels_file()
+        if on_loaded:
+            on_loaded()
+
+    def cancel_pipeline(self):
+        self.pending_job = None
+        self.pipeline_runner.cancel()
+
+    def on_pipeline_failed(self, job_id, message):
+        if self.pending_job and job_id == self.pending_job[0]:
+            self.pending_job = None
+            print(f"Error loading point cloud: {message}")
+            if self.progress_update_func:
+                self.progress_update_func(None)
+
+    def pipeline_params(self):
+        return {
+            "downsampling_method": self.downsampling_method,
+            "target_count": self.target_count,
+            "seed": settings.current_settings["Random_seed"],
+            "xyz_sidecar": settings.current_settings["XYZ_sidecar_cache"],
+            "point_cache": settings.current_settings["Point_cache"],
+            "superpoint_graph_method": self.superpoint_graph_method,
+            "k_value": self.superpoint_graph_args,
+            "mst_candidates": settings.current_settings["MST_candidates"],
+            "radius": settings.current_settings["Radius_graph"],
+            "neighbor_backend": settings.current_settings["Neighbor_backend"],
+            "feature_weight": settings.current_settings["Feature_weight"],
+            "feature_k": settings.current_settings["Feature_neighbors"],
+            "clustering_algorithm": self.clustering_algorithm,
+            "gn_communities": settings.current_settings["Girvan_newman_communities"],
+            "gn_sources": settings.current_settings["Girvan_newman_sources"],
+        }
+
+    def get_stage_cache(self):
+        # Created lazily so the cache settings can change before the first load
+        if self.stage_cache is None and settings.current_settings["Stage_cache"]:
+            self.stage_cache = StageCache(
+                settings.stage_cache_dir(),
+                settings.current_settings["Cache_size_mb"] * 1024 * 1024,
+            )
+        return self.stage_cache
 
     def set_camera_focal_point(self, focal_point, figure, original_camera):
         # using original camera as a reference to set the focal point
@@ -405,32 +674,11 @@ class PointcloudView:
             camera.zoom(zoom_factor)
             figure.scene.render()
 
-    def apply_community_detection(self, graph):
-        if self.clustering_algorithm == "label_propagation":
-            self.clusters = cd.label_propagation(graph)
-        elif self.clustering_algorithm == "async_lpa":
-            self.clusters = cd.asyn_lpa_communities(graph)
-        elif self.clustering_algorithm == "louvain":
-            self.clusters = cd.louvain(graph)
-        elif self.clustering_algorithm == "girvan_newman":
-            self.clusters = cd.girvan_newman(graph)
-        elif self.clustering_algorithm == "modularity":
-            self.clusters = cd.modularity(graph)
-        elif self.clustering_algorithm == "kernighan_lin":
-            self.clusters = cd.kernighan_lin(graph)
-
-        self.current_cluster_index = 0
-        self.update_cluster_label_callback()
-
     def load_xyz_file(self, file_path):
-        with open(file_path, "r") as file:
-            # Assuming the format of each line is 'X Y Z ...' (additional attributes are ignored)
-            data = [
-                line.strip().split()[:3] for line in file
-            ]  # Select only the first three elements (X, Y, Z)
-
-        # Convert the data to a numpy array of floats
-        return np.array(data, dtype=float)
+        # Assuming the format of each line is 'X Y Z ...' (additional attributes are ignored)
+        return readers.load_xyz_points(
+            file_path, use_sidecar=settings.current_settings["XYZ_sidecar_cache"]
+        )
 
     def set_point_size(self, size):
         settings.current_settings["point_size"] = size
@@ -31,8 +31,12 @@ class MainWindow(QMainWindow):
         self.layout.addWidget(self.github_button)
 
     def closeEvent(self, event):
-        # Save settings on close
+        # Save settings and fold pending labels into the label file on close
         settings.save_settings(settings.current_settings)
+        self.pointcloud_view.compact_labels()
+        self.pointcloud_view.pipeline_runner.shutdown()
+        if self.controls.prefetcher is not None:
+            self.controls.prefetcher.shutdown()
         super().closeEvent(event)
         quit()
 
@@ -0,0 +1,106 @@
+# pipeline/backprojection.py
+import os
+import time
+import numpy as np
+from scipy.spatial import cKDTree
+from algorithms.neighbors import kdtree_query
+from data import label_store, readers
+
+DENSE_LABEL_EXTENSION = ".labels.npy"
+
+
+def dense_label_path(destination_folder, source_file):
+    """Path of the full-resolution label array exported for a point cloud file."""
+    return os.path.join(
+        destination_folder, os.path.basename(source_file) + DENSE_LABEL_EXTENSION
+    )
+
+
+def query_nearest(tree, points, workers=-1, distance_upper_bound=np.inf):
+    """
+    Nearest neighbor query using all cores.
+
+    :return: Distances and indices as returned by cKDTree.query; points without
+        a neighbor within distance_upper_bound get index tree.n.
+    """
+    return kdtree_query(
+        tree, points, 1, workers, distance_upper_bound=distance_upper_bound
+    )
+
+
+def backproject_labels(
+    sample_points, sample_labels, chunks, max_distance=np.inf, workers=-1
+):
+    """
+    Give every point the label of its nearest labeled sample.
+
+    :param sample_points: Numpy array of shape (n_samples, 3).
+    :param sample_labels: Label of every sample, -1 for unlabeled.
+    :param chunks: Iterable of numpy arrays of shape (m, 3) to label.
+    :param max_distance: Points farther than this from every labeled sample
+        stay unlabeled (-1).
+    :param workers: Threads per KD-tree query (-1 for all cores).
+    :return: Generator of int32 label arrays, one per chunk.
+    """
+    sample_labels = np.asarray(sample_labels)
+    labeled = sample_labels >= 0
+    if not labeled.any():
+        for chunk in chunks:
+            yield np.full(len(chunk), -1, dtype=np.int32)
+        return
+
+    tree = cKDTree(sample_points[labeled])
+    # Index tree.n (no neighbor within max_distance) maps to -1
+    tree_labels = np.append(sample_labels[labeled], -1).astype(np.int32)
+    for chunk in chunks:
+        _, nearest = query_nearest(tree, chunk, workers, max_distance)
+        yield tree_labels[nearest]
+
+
+def export_dense_labels(
+    file_path,
+    partition_path,
+    output_path,
+    max_distance=np.inf,
+    chunk_size=readers.LAS_CHUNK_SIZE,
+    workers=-1,
+):
+    """
+    Write the label of every point of a point cloud file to a .npy file.
+
+    The labels of the partition's clusters are projected from its (downsampled)
+    points onto all points of the source file, which is streamed in chunks; the
+    output is written through a memory map, so memory use does not grow with
+    the file size.
+
+    :param file_path: Path to the source .las, .laz or .txt file.
+    :param partition_path: Path to the partition .npz file.
+    :param output_path: Destination .npy path (int32, one label per point in
+        file order, -1 for unlabeled).
+    :param max_distance: See backproject_labels.
+    :param chunk_size: Number of points per query.
+    :param workers: Threads per KD-tree query (-1 for all cores).
+    :return: Number of points written.
+    """
+    curr_time = time.time()
+    partition = label_store.load_partition(partition_path)
+    cluster_ids = partition["cluster_ids"]
+    # Points outside every cluster (id -1) pick the appended entry
+    sample_labels = np.append(partition["labels"], -1)[cluster_ids]
+
+    point_count, chunks = readers.open_point_chunks(file_path, chunk_size)
+    temp_path = output_path + ".tmp.npy"
+    dense = np.lib.format.open_memmap(
+        temp_path, mode="w+", dtype=np.int32, shape=(point_count,)
+    )
+    offset = 0
+    for labels in backproject_labels(
+        partition["points"], sample_labels, chunks, max_distance, workers
+    ):
+        dense[offset : offset + len(labels)] = labels
+        offset += len(labels)
+    dense.flush()
+    del dense
+    os.replace(temp_path, output_path)
+    print(f"Exported {offset} dense labels in {time.time() - curr_time:.2f} seconds")
+    return offset
@@ -0,0 +1,79 @@
+# pipeline/prefetch.py
+from concurrent.futures import ProcessPoolExecutor
+from data.stage_cache import StageCache
+from pipeline import processing
+
+
+def _prefetch_file(file_path, params, cache_dir, max_bytes):
+    # Runs in a worker process; the results reach the GUI through the cache
+    cache = StageCache(cache_dir, max_bytes)
+    # Already in a worker process, so Girvan-Newman must not start a pool
+    params = {**params, "gn_workers": 1}
+    processing.run_pipeline(file_path, params, cache=cache)
+    return file_path
+
+
+class Prefetcher:
+    """
+    Precomputes the pipeline for upcoming files in a background process pool.
+
+    Results are written to the persistent StageCache, so opening a prefetched
+    file afterwards is a cache hit. Only the files passed to the latest
+    schedule call are kept queued; older requests that have not started yet
+    are cancelled.
+    """
+
+    def __init__(self, cache_dir, max_bytes, depth):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.depth = depth
+        self.executor = None
+        self.pending = {}  # (file path, params key) -> future
+
+    def schedule(self, file_paths, params):
+        """
+        Queue the pipeline for the first ``depth`` files of file_paths.
+
+        :param file_paths: Full paths of the upcoming files, nearest first.
+        :param params: Pipeline parameters (see processing.DEFAULT_PARAMS), or
+            a list with the parameters of every file.
+        """
+        if self.depth <= 0:
+            return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.depth)
+        if isinstance(params, dict):
+            params = [params] * len(file_paths)
+
+        wanted = {
+            (file_path, repr(sorted(file_params.items()))): (file_path, file_params)
+            for file_path, file_params in zip(
+                file_paths[: self.depth], params[: self.depth]
+            )
+        }
+        for key, future in list(self.pending.items()):
+            if future.done() or (key not in wanted and future.cancel()):
+                del self.pending[key]
+
+        for key, (file_path, file_params) in wanted.items():
+            if key in self.pending:
+                continue
+            print("Prefetching: ", file_path)
+            future = self.executor.submit(
+                _prefetch_file, file_path, file_params, self.cache_dir, self.max_bytes
+            )
+            future.add_done_callback(_report_failure)
+            self.pending[key] = future
+
+    def shutdown(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+def _report_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Prefetch failed: {future.exception()}")
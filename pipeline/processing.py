@@ -0,0 +1,421 @@
+# pipeline/processing.py
+import os
+import numpy as np
+from scipy import sparse
+from algorithms import downsampling, superpoint_graph
+import algorithms.community_detection as cd
+from data import label_store, readers
+from data.partition import Partition
+from pipeline.profiling import span
+
+# Point cloud files the pipeline can read
+POINTCLOUD_EXTENSIONS = readers.LAS_EXTENSIONS + (".txt",)
+
+# Parameters each stage's output depends on, in addition to the source file.
+# Later stages inherit the parameters of the stages before them.
+STAGE_PARAMS = {
+    "downsample": ["downsampling_method", "target_count", "seed"],
+    "graph": [
+        "superpoint_graph_method",
+        "k_value",
+        "mst_candidates",
+        "radius",
+        "feature_weight",
+        "feature_k",
+    ],
+    "communities": ["clustering_algorithm", "gn_communities", "gn_sources"],
+}
+STAGES = ["downsample", "graph", "communities"]
+
+# Parameters only read by one method: parameter -> (method parameter, method).
+# They are left out of the cache key for the other methods.
+METHOD_PARAMS = {
+    "gn_communities": ("clustering_algorithm", "girvan_newman"),
+    "gn_sources": ("clustering_algorithm", "girvan_newman"),
+}
+
+# Graph methods that take the k_value parameter
+K_GRAPH_METHODS = ("knn", "mutual_knn", "radius")
+
+# Defaults for the pipeline parameters accepted by run_pipeline
+DEFAULT_PARAMS = {
+    "downsampling_method": None,
+    "target_count": None,
+    "seed": 0,
+    "xyz_sidecar": True,
+    "point_cache": True,
+    "superpoint_graph_method": "knn",
+    "k_value": 8,
+    "mst_candidates": "knn",
+    "radius": 0.0,
+    "neighbor_backend": "kdtree",
+    "feature_weight": 0.0,
+    "feature_k": 16,
+    "clustering_algorithm": "label_propagation",
+    "gn_communities": 0,
+    "gn_sources": 64,
+    "gn_workers": None,
+}
+
+
+def with_defaults(params):
+    """
+    Fill in DEFAULT_PARAMS for the parameters that are missing or None.
+
+    :param params: Dict of pipeline parameters.
+    :return: New dict with every parameter of DEFAULT_PARAMS.
+    """
+    given = {name: value for name, value in params.items() if value is not None}
+    return {**DEFAULT_PARAMS, **given}
+
+
+class PipelineCancelled(Exception):
+    """Raised by run_pipeline when its job was superseded by a newer one."""
+
+
+def load_points(file_path, downsampling_method=None, target_count=None, **params):
+    """
+    Read the coordinates of a point cloud file.
+
+    :param file_path: Path to a .las, .laz or .txt file.
+    :param downsampling_method: Downsampling method applied afterwards (lets
+        the LAS reader reduce the cloud while streaming).
+    :param target_count: Number of points the downsampling will produce.
+    :return: Numpy array of shape (n_points, 3) and the indices of these points
+        in the file (None when every point was read).
+    """
+    if readers.is_las(file_path):
+        return readers.load_las_points(
+            file_path,
+            downsampling_method,
+            target_count,
+            seed=params.get("seed"),
+            use_cache=params.get("point_cache", True),
+        )
+    elif file_path.endswith(".txt"):
+        points = readers.load_xyz_points(
+            file_path, use_sidecar=params.get("xyz_sidecar", True)
+        )
+        return points, None
+    raise ValueError(f"Unsupported point cloud file: {file_path}")
+
+
+def select_indices(points, downsampling_method, target_count, seed=None):
+    """
+    Apply one of the downsampling methods offered in the control panel.
+
+    :param points: Numpy array of shape (n_points, 3).
+    :param downsampling_method: Name of the downsampling method.
+    :param target_count: The desired number of points after downsampling.
+    :param seed: Seed for the randomized methods.
+    :return: Indices of the sampled points, or None for methods that create new
+        points instead of selecting them (see downsample).
+    """
+    if downsampling_method == "random":
+        return downsampling.random_downsample(points, target_count, seed=seed)
+    elif downsampling_method == "vanilla_fps":
+        return downsampling.vanilla_fps(points, target_count)
+    elif downsampling_method == "fps_npdu":
+        return downsampling.fps_npdu(points, target_count)
+    elif downsampling_method == "fps_npdu_kdtree":
+        return downsampling.fps_npdu_kdtree(points, target_count)
+    elif downsampling_method == "bucket_fps_kdline_small":
+        return downsampling.bucket_fps_kdline(points, target_count, h=4)
+    elif downsampling_method == "bucket_fps_kdline_medium":
+        return downsampling.bucket_fps_kdline(points, target_count, h=7)
+    elif downsampling_method == "bucket_fps_kdline_large":
+        return downsampling.bucket_fps_kdline(points, target_count, h=9)
+    elif downsampling_method == "voxel_nearest":
+        return downsampling.voxel_downsample(points, target_count, seed=seed)
+    elif downsampling_method == "poisson_disk":
+        return downsampling.poisson_disk_downsample(points, target_count, seed=seed)
+    elif downsampling_method == "voxel_centroid":
+        return None
+    return np.arange(len(points))
+
+
+def downsample(points, downsampling_method, target_count, seed=None):
+    """
+    Downsample a point cloud with a method offered in the control panel.
+
+    :param points: Numpy array of shape (n_points, 3).
+    :param downsampling_method: Name of the downsampling method.
+    :param target_count: The desired number of points after downsampling.
+    :param seed: Seed for the randomized methods.
+    :return: Downsampled numpy array and the indices of its points in the input
+        (None for "voxel_centroid", whose points are voxel means).
+    """
+    if downsampling_method == "voxel_centroid":
+        return downsampling.voxel_centroids(points, target_count, seed=seed), None
+    indices = np.asarray(
+        select_indices(points, downsampling_method, target_count, seed),
+        dtype=np.int64,
+    )
+    return points[indices], indices
+
+
+def build_graph(
+    points,
+    superpoint_graph_method,
+    k_value=None,
+    mst_candidates="knn",
+    feature_weight=0.0,
+    feature_k=16,
+    radius=0.0,
+    neighbor_backend="kdtree",
+):
+    """
+    Construct the superpoint graph selected in the control panel.
+
+    :param points: Numpy array of shape (n_points, 3).
+    :param superpoint_graph_method: "knn", "mutual_knn", "radius" or "mst".
+    :param k_value: Number of neighbors for the KNN graphs (and the automatic
+        radius of the radius graph).
+    :param mst_candidates: Candidate edge set for the MST graph.
+    :param feature_weight: Weight of the eigen-feature term of the edge weights,
+        0 for plain Euclidean lengths.
+    :param feature_k: Neighborhood size of the eigen-features.
+    :param radius: Radius of the radius graph, 0 to derive it from k_value.
+    :param neighbor_backend: Neighbor search backend (see neighbors.BACKENDS).
+    :return: SuperpointGraph.
+    """
+    options = {
+        "feature_weight": feature_weight,
+        "feature_k": feature_k,
+        "backend": neighbor_backend,
+    }
+    if superpoint_graph_method == "knn":
+        return superpoint_graph.create_knn_graph(points, k_value, **options)
+    elif superpoint_graph_method == "mutual_knn":
+        return superpoint_graph.create_mutual_knn_graph(points, k_value, **options)
+    elif superpoint_graph_method == "radius":
+        return superpoint_graph.create_radius_graph(
+            points, radius, k_value or 8, **options
+        )
+    elif superpoint_graph_method == "mst":
+        return superpoint_graph.create_mst_graph(
+            points, candidates=mst_candidates, **options
+        )
+    raise ValueError(f"Unknown superpoint graph method: {superpoint_graph_method}")
+
+
+def detect_communities(
+    graph,
+    clustering_algorithm,
+    seed=None,
+    gn_communities=0,
+    gn_sources=64,
+    gn_workers=None,
+):
+    """
+    Apply the community detection algorithm selected in the control panel.
+
+    :param graph: SuperpointGraph.
+    :param clustering_algorithm: Name of the community detection algorithm.
+    :param seed: Seed for the randomized algorithms.
+    :param gn_communities: Girvan-Newman target community count, 0 for the
+        modularity peak.
+    :param gn_sources: Sampled betweenness sources per Girvan-Newman component.
+    :param gn_workers: Girvan-Newman worker processes (None for all cores).
+    :return: List of lists, where each sublist contains the nodes in a cluster.
+    """
+    if clustering_algorithm == "label_propagation":
+        return cd.label_propagation(graph)
+    elif clustering_algorithm == "sparse_lpa":
+        return cd.sparse_label_propagation(graph, seed=seed)
+    elif clustering_algorithm == "async_lpa":
+        return cd.asyn_lpa_communities(graph, seed=seed)
+    elif clustering_algorithm == "louvain":
+        return cd.louvain(graph, seed=seed)
+    elif clustering_algorithm == "girvan_newman":
+        return cd.girvan_newman(
+            graph,
+            target_communities=gn_communities,
+            num_sources=gn_sources,
+            workers=gn_workers,
+            seed=seed,
+        )
+    elif clustering_algorithm == "modularity":
+        return cd.modularity(graph)
+    elif clustering_algorithm == "kernighan_lin":
+        return cd.kernighan_lin(graph, seed=seed)
+    raise ValueError(f"Unknown community detection algorithm: {clustering_algorithm}")
+
+
+def stage_key(stage, source_hash, params):
+    """Cache key of a stage: the source file plus every parameter it depends on."""
+    key = {"source_hash": source_hash}
+    for name in STAGES[: STAGES.index(stage) + 1]:
+        for param in STAGE_PARAMS[name]:
+            if param in METHOD_PARAMS:
+                method_param, method = METHOD_PARAMS[param]
+                if params.get(method_param) != method:
+                    continue
+            key[param] = params.get(param)
+    return key
+
+
+def partition_header(file_path, params):
+    """
+    Metadata stored with a partition: the source file and pipeline parameters.
+
+    :param file_path: Path to the point cloud file.
+    :param params: Dict of pipeline parameters (see DEFAULT_PARAMS).
+    :return: Dict for label_store.save_partition.
+    """
+    params = with_defaults(params)
+    source_hash = None
+    if file_path and os.path.exists(file_path):
+        source_hash = label_store.file_fingerprint(file_path)
+    header = {"source_file": os.path.basename(file_path), "source_hash": source_hash}
+    for stage in STAGES:
+        for param in STAGE_PARAMS[stage]:
+            header[param] = params[param]
+    return header
+
+
+def save_new_partition(path, file_path, params, points, partition, indices=None):
+    """
+    Write a pipeline result as a partition file with every cluster unlabeled.
+
+    :param path: Destination .npz path (see label_store.label_file_path).
+    :param file_path: Path to the point cloud file the result was computed from.
+    :param params: Dict of pipeline parameters the result was computed with.
+    :param points: Numpy array of shape (n_points, 3).
+    :param partition: Partition of the points.
+    :param indices: Indices of the points in the source file, if known.
+    """
+    label_store.save_partition(
+        path,
+        points,
+        partition.ids,
+        np.full(len(partition), -1),
+        header=partition_header(file_path, params),
+        sample_indices=indices,
+    )
+
+
+def run_pipeline(file_path, params, cache=None, progress=None, cancelled=None):
+    """
+    Run downsampling, superpoint graph construction and community detection.
+
+    With a StageCache, every stage first looks up its output by source file
+    fingerprint and parameters and only computes (and stores) it on a miss.
+    Stages whose downstream output is already cached are skipped entirely.
+
+    :param file_path: Path to a .las, .laz or .txt file.
+    :param params: Dict of pipeline parameters (see DEFAULT_PARAMS).
+    :param cache: Optional StageCache.
+    :param progress: Optional callable receiving the name of each stage as it
+        starts ("downsample", "graph", "communities").
+    :param cancelled: Optional callable; when it returns True the pipeline
+        stops at the next stage boundary by raising PipelineCancelled.
+    :return: Dict with ``points``, ``indices`` (of the points in the file, or
+        None), ``graph`` (None when the communities came from the cache) and
+        the unlabeled ``partition``.
+    """
+    params = with_defaults(params)
+    source_hash = label_store.file_fingerprint(file_path) if cache else None
+
+    def cached(stage):
+        if cache is None:
+            return None
+        return cache.get(stage, stage_key(stage, source_hash, params))
+
+    def store(stage, arrays):
+        if cache is not None:
+            cache.put(stage, stage_key(stage, source_hash, params), arrays)
+
+    def start(stage):
+        if cancelled is not None and cancelled():
+            raise PipelineCancelled(stage)
+        if progress is not None:
+            progress(stage)
+
+    # Downsampling
+    start("downsample")
+    entry = cached("downsample")
+    if entry is not None:
+        points = entry["points"]
+        indices = entry.get("indices")
+    else:
+        with span("load", file=os.path.basename(file_path)) as details:
+            points, source_indices = load_points(file_path, **params)
+            details["points"] = len(points)
+        with span("downsample", method=params["downsampling_method"]):
+            points, indices = downsample(
+                points,
+                params["downsampling_method"],
+                params["target_count"],
+                params["seed"],
+            )
+            # Make the indices refer to the file rather than a streamed subset
+            if indices is not None and source_indices is not None:
+                indices = source_indices[indices]
+            arrays = {"points": points}
+            if indices is not None:
+                arrays["indices"] = indices
+            store("downsample", arrays)
+
+    # Community detection only needs the graph on a cache miss
+    graph = None
+    entry = cached("communities")
+    if entry is not None:
+        return {
+            "points": points,
+            "indices": indices,
+            "graph": graph,
+            "partition": Partition(entry["cluster_ids"]),
+        }
+
+    # Superpoint graph construction
+    start("graph")
+    entry = cached("graph")
+    if entry is not None:
+        graph = superpoint_graph.SuperpointGraph(
+            sparse.csr_matrix(
+                (entry["data"], entry["indices"], entry["indptr"]),
+                shape=(len(points), len(points)),
+            )
+        )
+    else:
+        with span("graph", method=params["superpoint_graph_method"]):
+            graph = build_graph(
+                points,
+                params["superpoint_graph_method"],
+                params["k_value"],
+                params["mst_candidates"],
+                params["feature_weight"],
+                params["feature_k"],
+                params["radius"],
+                params["neighbor_backend"],
+            )
+            store(
+                "graph",
+                {
+                    "data": graph.adjacency.data,
+                    "indices": graph.adjacency.indices,
+                    "indptr": graph.adjacency.indptr,
+                },
+            )
+
+    # Community detection
+    start("communities")
+    with span("communities", algorithm=params["clustering_algorithm"]) as details:
+        clusters = detect_communities(
+            graph,
+            params["clustering_algorithm"],
+            params["seed"],
+            params["gn_communities"],
+            params["gn_sources"],
+            params["gn_workers"],
+        )
+        details["clusters"] = len(clusters)
+        partition = Partition.from_clusters(clusters, len(points))
+        store("communities", {"cluster_ids": partition.ids})
+    return {
+        "points": points,
+        "indices": indices,
+        "graph": graph,
+        "partition": partition,
+    }
@@ -0,0 +1,282 @@
+# pipeline/profiling.py
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+# Seconds between the resident memory samples taken while spans are open
+RSS_SAMPLE_INTERVAL = 0.01
+
+_process = None
+
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, None if unavailable.
+
+    Uses psutil where it is installed. Otherwise falls back to the
+    high-water mark of the process on Unix, which never goes down.
+    """
+    global _process
+    if psutil is not None:
+        if _process is None:
+            _process = psutil.Process()
+        return _process.memory_info().rss
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Profiler:
+    """
+    Records named, possibly nested spans of work.
+
+    Every span captures its start (Unix time, so spans of several processes
+    line up), its wall time, the CPU time of the process, the peak resident
+    memory of the process while it ran (sampled by a background thread every
+    RSS_SAMPLE_INTERVAL seconds, so short spikes can be missed), how much it
+    changed the resident memory and, while memory tracing is on, the peak of
+    the Python allocations traced with tracemalloc during the span. Spans may
+    be recorded from any thread. The most recent max_records spans are kept
+    and can be exported as JSON lines or in the Chrome trace event format
+    (chrome://tracing or https://ui.perfetto.dev).
+
+    Resident memory and tracemalloc are per process, so spans that overlap in
+    different threads (e.g. the pipeline on its worker thread and rendering
+    on the GUI thread) see each other's memory. The tracemalloc peak is also
+    reset whenever a span starts, so the traced peak of a span overlapping
+    one in another thread may miss allocations made before that reset.
+    """
+
+    def __init__(self, max_records=10000, verbose=True):
+        self.records = deque(maxlen=max_records)
+        self.verbose = verbose
+        self._local = threading.local()
+        self._open_frames = []  # Frames of all open spans, for the sampler
+        self._frames_lock = threading.Lock()
+        self._sampler = None
+        self._wake = threading.Event()
+
+    @property
+    def tracing_memory(self):
+        return tracemalloc.is_tracing()
+
+    def set_memory_tracing(self, enabled):
+        """Start or stop tracemalloc; tracing slows allocations down noticeably."""
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _sample_rss(self):
+        # Runs on a daemon thread: raise the peak of every open span
+        while True:
+            self._wake.wait()
+            rss = current_rss()
+            with self._frames_lock:
+                if not self._open_frames:
+                    self._wake.clear()
+                    continue
+                for frame in self._open_frames:
+                    frame["rss_peak"] = max(frame["rss_peak"], rss)
+            time.sleep(RSS_SAMPLE_INTERVAL)
+
+    def _open_frame(self, frame):
+        with self._frames_lock:
+            self._open_frames.append(frame)
+            # A forked worker process inherits the attribute but not the thread
+            if self._sampler is None or self._sampler[0] != os.getpid():
+                thread = threading.Thread(
+                    target=self._sample_rss, name="rss-sampler", daemon=True
+                )
+                thread.start()
+                self._sampler = (os.getpid(), thread)
+        self._wake.set()
+
+    def _close_frame(self, frame):
+        with self._frames_lock:
+            self._open_frames.remove(frame)
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Record the block run inside the with statement as a span.
+
+        :param name: Span name, e.g. "graph".
+        :param args: Extra JSON-serializable details stored with the span.
+        """
+        stack = self._stack()
+        tracing = tracemalloc.is_tracing()
+        rss_start = current_rss()
+        frame = {"traced_peak": 0, "rss_peak": rss_start}
+        if tracing:
+            traced_start, traced_peak = tracemalloc.get_traced_memory()
+            # Hand the peak so far to the enclosing span before resetting it
+            if stack:
+                stack[-1]["traced_peak"] = max(stack[-1]["traced_peak"], traced_peak)
+            if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+                tracemalloc.reset_peak()
+        stack.append(frame)
+        sampled = rss_start is not None and psutil is not None
+        if sampled:
+            self._open_frame(frame)
+        cpu_start = time.process_time()
+        start_time = time.time()
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            rss_end = current_rss()
+            if sampled:
+                self._close_frame(frame)
+            if rss_end is not None:
+                frame["rss_peak"] = max(frame["rss_peak"], rss_end)
+            stack.pop()
+            traced = None
+            if tracing and tracemalloc.is_tracing():
+                traced_peak = max(
+                    tracemalloc.get_traced_memory()[1], frame["traced_peak"]
+                )
+                traced = max(traced_peak - traced_start, 0)
+                if stack:
+                    stack[-1]["traced_peak"] = max(
+                        stack[-1]["traced_peak"], traced_peak
+                    )
+            record = {
+                "name": name,
+                "start": start_time,
+                "wall": wall,
+                "cpu": cpu,
+                "rss_peak_mb": None if rss_end is None else frame["rss_peak"] / MB,
+                "rss_growth_mb": (
+                    None if rss_end is None else (rss_end - rss_start) / MB
+                ),
+                "traced_peak_mb": None if traced is None else traced / MB,
+                "depth": len(stack),
+                "pid": os.getpid(),
+                "thread": threading.current_thread().name,
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            self.records.append(record)
+            if self.verbose:
+                print(self.format_record(record))
+
+    @staticmethod
+    def format_record(record):
+        text = (
+            f"{record['name']} took {record['wall']:.3f} s (CPU {record['cpu']:.3f} s"
+        )
+        if record["rss_peak_mb"] is not None:
+            text += f", peak RSS {record['rss_peak_mb']:.0f} MB"
+        if record["traced_peak_mb"] is not None:
+            text += f", traced peak {record['traced_peak_mb']:.1f} MB"
+        return text + ")"
+
+    def clear(self):
+        self.records.clear()
+
+    def extend(self, records):
+        """Add spans recorded elsewhere, e.g. returned by a worker process."""
+        self.records.extend(records)
+
+    def export(self, path):
+        """Export as JSON lines for .jsonl paths, as a Chrome trace otherwise."""
+        if path.endswith(".jsonl"):
+            self.export_jsonl(path)
+        else:
+            self.export_chrome_trace(path)
+
+    def summary(self):
+        """
+        Aggregate of the recorded spans per name, in order of first appearance.
+
+        :return: List of dicts with name, count, last/mean/max wall time, total
+            CPU time and the largest peak RSS and traced peak.
+        """
+        rows = {}
+        for record in list(self.records):
+            row = rows.setdefault(
+                record["name"],
+                {
+                    "name": record["name"],
+                    "count": 0,
+                    "wall_total": 0.0,
+                    "wall_max": 0.0,
+                    "cpu_total": 0.0,
+                    "rss_peak_mb": None,
+                    "traced_peak_mb": None,
+                },
+            )
+            row["count"] += 1
+            row["wall_last"] = record["wall"]
+            row["wall_total"] += record["wall"]
+            row["wall_max"] = max(row["wall_max"], record["wall"])
+            row["cpu_total"] += record["cpu"]
+            for key in ("rss_peak_mb", "traced_peak_mb"):
+                if record[key] is not None:
+                    row[key] = max(row[key] or 0.0, record[key])
+        for row in rows.values():
+            row["wall_mean"] = row["wall_total"] / row["count"]
+        return list(rows.values())
+
+    def export_jsonl(self, path):
+        """Write every recorded span as one JSON object per line."""
+        with open(path, "w") as file:
+            for record in list(self.records):
+                file.write(json.dumps(record, default=str) + "\n")
+
+    def export_chrome_trace(self, path):
+        """Write the recorded spans as complete ("X") Chrome trace events."""
+        records = list(self.records)
+        origin = min((record["start"] for record in records), default=0.0)
+        events = []
+        for record in records:
+            details = {
+                key: record[key]
+                for key in ("cpu", "rss_peak_mb", "rss_growth_mb", "traced_peak_mb")
+            }
+            details.update(record["args"])
+            events.append(
+                {
+                    "name": record["name"],
+                    "cat": "needlr",
+                    "ph": "X",
+                    "ts": (record["start"] - origin) * 1e6,
+                    "dur": record["wall"] * 1e6,
+                    "pid": record["pid"],
+                    "tid": record["tid"],
+                    "args": details,
+                }
+            )
+        with open(path, "w") as file:
+            json.dump(
+                {"traceEvents": events, "displayTimeUnit": "ms"}, file, default=str
+            )
+
+
+# Profiler shared by the pipeline and the GUI
+profiler = Profiler()
+span = profiler.span